@@ -1,27 +1,86 @@
 '''
 Business: Регистрация и авторизация пользователей
-Args: event с httpMethod, body; context с request_id
+Args: event с httpMethod, body; context с request_id; проверка сессии (GET) читает с реплики, если задан DATABASE_READ_URLS
 Returns: HTTP response с токеном сессии или данными пользователя
+
+Логика в async_handler: проверка существующего пользователя идёт параллельно с KDF, записи логина -
+одним конвейером; handler - синхронная обёртка для платформы
 '''
 
+import asyncio
 import json
 import os
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from typing import Dict, Any
-import hashlib
+import sys
+from typing import Dict, Any, Optional
 import secrets
 
-def get_db_connection():
-    return psycopg2.connect(os.environ['DATABASE_URL'])
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.aio import async_db_connection, async_read_connection, prewarm, sync_handler
+from common.cache import TTLCache
+from common.http import CACHE_CONTROL_PRIVATE
+from common.instrument import instrumented, record_error, watch_cache
+from common.passwords import hash_password_async, verify_password_async, needs_rehash
+from common.replicas import get_replica_set, pin_primary
+
+prewarm()
 
-def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode()).hexdigest()
+SESSION_TTL_SECONDS = int(os.environ.get('SESSION_TTL_DAYS', 30)) * 86400
+
+SESSION_USER_SQL = '''
+    SELECT u.id, u.username, u.email,
+           EXTRACT(EPOCH FROM s.expires_at - CURRENT_TIMESTAMP) AS expires_in
+    FROM sessions s
+    JOIN users u ON u.id = s.user_id
+    WHERE s.token = %s AND s.expires_at > CURRENT_TIMESTAMP
+'''
+
+# Кэш живёт в процессе: выход на другом инстансе виден здесь не позже чем через SESSION_CACHE_TTL
+session_cache = TTLCache(
+    max_size=int(os.environ.get('SESSION_CACHE_SIZE', 10000)),
+    ttl=float(os.environ.get('SESSION_CACHE_TTL', 60))
+)
+# Доля попаданий и вытеснения видны в логе запросов: по ним подбираются SESSION_CACHE_SIZE и TTL
+watch_cache('session', session_cache.stats)
 
 def generate_session_token() -> str:
     return secrets.token_urlsafe(32)
 
-def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+def get_session_token(event: Dict[str, Any]) -> str:
+    request_headers = event.get('headers') or {}
+    return request_headers.get('X-Session-Token') or request_headers.get('x-session-token')
+
+async def create_session(cur, user_id: int) -> str:
+    session_token = generate_session_token()
+    await cur.execute(
+        '''INSERT INTO sessions (token, user_id, expires_at) 
+           VALUES (%s, %s, CURRENT_TIMESTAMP + %s * INTERVAL '1 second')''',
+        (session_token, user_id, SESSION_TTL_SECONDS)
+    )
+    return session_token
+
+async def delete_session(cur, session_token: str) -> None:
+    '''Кэш нужно сбросить уже после commit, иначе параллельный GET успеет закэшировать старую сессию'''
+    await cur.execute('DELETE FROM sessions WHERE token = %s', (session_token,))
+
+async def find_session_user(event: Dict[str, Any], session_token: str) -> Optional[Dict[str, Any]]:
+    '''Только что созданная сессия может ещё не дойти до реплики - промах перепроверяется на primary'''
+    async with async_read_connection(event) as conn, conn.cursor() as cur:
+        await cur.execute(SESSION_USER_SQL, (session_token,))
+        user = await cur.fetchone()
+    if user is None and get_replica_set() is not None:
+        async with async_db_connection(autocommit=True) as conn, conn.cursor() as cur:
+            await cur.execute(SESSION_USER_SQL, (session_token,))
+            user = await cur.fetchone()
+    return user
+
+async def find_existing_user(username: str, email: str) -> bool:
+    async with async_db_connection(autocommit=True) as conn, conn.cursor() as cur:
+        await cur.execute('SELECT id FROM users WHERE username = %s OR email = %s', (username, email))
+        return await cur.fetchone() is not None
+
+@instrumented('auth')
+async def async_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
@@ -39,19 +98,25 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     headers = {
         'Content-Type': 'application/json',
-        'Access-Control-Allow-Origin': '*'
+        'Access-Control-Allow-Origin': '*',
+        'Cache-Control': CACHE_CONTROL_PRIVATE
     }
     
+    session_token = get_session_token(event)
+    
+    if method == 'GET' and session_token:
+        cached_user = session_cache.get(session_token)
+        if cached_user:
+            return {
+                'statusCode': 200,
+                'headers': {**headers, 'X-Session-Cache': 'hit'},
+                'body': json.dumps(cached_user),
+                'isBase64Encoded': False
+            }
+    
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
         if method == 'GET':
-            session_token = event.get('headers', {}).get('X-Session-Token') or event.get('headers', {}).get('x-session-token')
-            
             if not session_token:
-                cur.close()
-                conn.close()
                 return {
                     'statusCode': 401,
                     'headers': headers,
@@ -59,19 +124,14 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
-            cur.execute(
-                'SELECT id, username, email FROM users WHERE session_token = %s',
-                (session_token,)
-            )
-            user = cur.fetchone()
-            cur.close()
-            conn.close()
+            user = await find_session_user(event, session_token)
             
             if user:
+                session_cache.set(session_token, user, ttl=float(user.pop('expires_in')))
                 return {
                     'statusCode': 200,
-                    'headers': headers,
-                    'body': json.dumps(dict(user)),
+                    'headers': {**headers, 'X-Session-Cache': 'miss'},
+                    'body': json.dumps(user),
                     'isBase64Encoded': False
                 }
             else:
@@ -83,6 +143,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 }
         
         elif method == 'POST':
+            # Выход должен сразу перестать узнаваться, вход и регистрация - сразу узнаваться
+            pin_primary(event)
             body_data = json.loads(event.get('body', '{}'))
             action = body_data.get('action')
             
@@ -92,8 +154,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 password = body_data.get('password')
                 
                 if not all([username, email, password]):
-                    cur.close()
-                    conn.close()
                     return {
                         'statusCode': 400,
                         'headers': headers,
@@ -101,12 +161,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'isBase64Encoded': False
                     }
                 
-                cur.execute('SELECT id FROM users WHERE username = %s OR email = %s', (username, email))
-                existing = cur.fetchone()
+                # Проверка занятости не зависит от хэша: KDF считается, пока идёт запрос
+                existing, password_hash = await asyncio.gather(
+                    find_existing_user(username, email), hash_password_async(password)
+                )
                 
                 if existing:
-                    cur.close()
-                    conn.close()
                     return {
                         'statusCode': 400,
                         'headers': headers,
@@ -114,23 +174,21 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'isBase64Encoded': False
                     }
                 
-                password_hash = hash_password(password)
-                session_token = generate_session_token()
-                
-                cur.execute(
-                    '''INSERT INTO users (username, email, password_hash, session_token, last_login) 
-                       VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP) RETURNING id, username, email, session_token''',
-                    (username, email, password_hash, session_token)
-                )
-                new_user = cur.fetchone()
-                conn.commit()
-                cur.close()
-                conn.close()
+                async with async_db_connection() as conn:
+                    async with conn.cursor() as cur:
+                        await cur.execute(
+                            '''INSERT INTO users (username, email, password_hash, last_login) 
+                               VALUES (%s, %s, %s, CURRENT_TIMESTAMP) RETURNING id, username, email''',
+                            (username, email, password_hash)
+                        )
+                        new_user = await cur.fetchone()
+                        new_user['session_token'] = await create_session(cur, new_user['id'])
+                    await conn.commit()
                 
                 return {
                     'statusCode': 201,
                     'headers': headers,
-                    'body': json.dumps(dict(new_user)),
+                    'body': json.dumps(new_user),
                     'isBase64Encoded': False
                 }
             
@@ -139,8 +197,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 password = body_data.get('password')
                 
                 if not all([username, password]):
-                    cur.close()
-                    conn.close()
                     return {
                         'statusCode': 400,
                         'headers': headers,
@@ -148,17 +204,16 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'isBase64Encoded': False
                     }
                 
-                password_hash = hash_password(password)
-                
-                cur.execute(
-                    'SELECT id, username, email FROM users WHERE username = %s AND password_hash = %s',
-                    (username, password_hash)
-                )
-                user = cur.fetchone()
+                async with async_db_connection(autocommit=True) as conn, conn.cursor() as cur:
+                    await cur.execute(
+                        'SELECT id, username, email, password_hash FROM users WHERE username = %s',
+                        (username,)
+                    )
+                    user = await cur.fetchone()
+                stored_hash = user.pop('password_hash') if user else None
                 
-                if not user:
-                    cur.close()
-                    conn.close()
+                # Соединение возвращено в пул, пока считается KDF
+                if not await verify_password_async(password, stored_hash):
                     return {
                         'statusCode': 401,
                         'headers': headers,
@@ -166,18 +221,26 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'isBase64Encoded': False
                     }
                 
-                session_token = generate_session_token()
+                # Устаревший SHA-256 или старые параметры KDF - обновляем хэш, пока знаем пароль
+                new_hash = await hash_password_async(password) if needs_rehash(stored_hash) else None
                 
-                cur.execute(
-                    'UPDATE users SET session_token = %s, last_login = CURRENT_TIMESTAMP WHERE id = %s',
-                    (session_token, user['id'])
-                )
-                conn.commit()
-                cur.close()
-                conn.close()
+                async with async_db_connection() as conn:
+                    # Ротация токена и отметка входа независимы - один сетевой круг вместо трёх
+                    async with conn.pipeline():
+                        # Повторный вход с того же устройства ротирует токен, сессии других устройств остаются
+                        if session_token:
+                            await delete_session(conn.cursor(), session_token)
+                        new_session_token = await create_session(conn.cursor(), user['id'])
+                        await conn.cursor().execute(
+                            'UPDATE users SET password_hash = COALESCE(%s, password_hash), last_login = CURRENT_TIMESTAMP WHERE id = %s',
+                            (new_hash, user['id'])
+                        )
+                    await conn.commit()
+                if session_token:
+                    session_cache.invalidate(session_token)
                 
                 result = dict(user)
-                result['session_token'] = session_token
+                result['session_token'] = new_session_token
                 
                 return {
                     'statusCode': 200,
@@ -186,9 +249,22 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
+            elif action == 'logout':
+                if session_token:
+                    async with async_db_connection() as conn:
+                        async with conn.cursor() as cur:
+                            await delete_session(cur, session_token)
+                        await conn.commit()
+                    session_cache.invalidate(session_token)
+                
+                return {
+                    'statusCode': 200,
+                    'headers': headers,
+                    'body': json.dumps({'success': True}),
+                    'isBase64Encoded': False
+                }
+            
             else:
-                cur.close()
-                conn.close()
                 return {
                     'statusCode': 400,
                     'headers': headers,
@@ -197,8 +273,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 }
         
         else:
-            cur.close()
-            conn.close()
             return {
                 'statusCode': 405,
                 'headers': headers,
@@ -207,9 +281,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             }
     
     except Exception as e:
+        record_error(e)
         return {
             'statusCode': 500,
             'headers': headers,
             'body': json.dumps({'error': str(e)}),
             'isBase64Encoded': False
         }
+
+handler = sync_handler(async_handler)
@@ -0,0 +1,3 @@
+'''
+Business: Бенчмарки backend-функций - запускаются из каталога backend через python -m bench.<бенчмарк>
+'''
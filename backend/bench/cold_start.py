@@ -0,0 +1,131 @@
+'''
+Business: Бенчмарк холодного старта функций - импорт index.py, первый OPTIONS и первый GET в свежем интерпретаторе
+Args: --functions (через запятую), --runs (холодных запусков на функцию), --with-db (первый GET к базе из DATABASE_URL), --prewarm N (DB_PREWARM), --budget-ms (порог на импорт + OPTIONS)
+Returns: JSON на функцию - медианы import_ms / options_ms / first_get_ms, загружен ли драйвер и самые дорогие модули по -X importtime; код 1, если бюджет превышен
+'''
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, Any, List, Optional
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# common.router - только stdlib: bench.harness импортирует psycopg2 и загрузил бы драйвер в измеряющий процесс
+from common.router import BACKEND_DIR, discover_functions
+
+# psycopg2 у синхронных функций, psycopg (v3) у async - messages и auth
+DRIVER_MODULES = ('psycopg2', 'psycopg')
+TOP_IMPORTS = 5
+
+# Первый запрос, который реально обслуживает функция: без обязательных параметров вернулся бы 400 до базы
+FIRST_GET: Dict[str, Dict[str, Any]] = {
+    'auth': {'headers': {'X-Session-Token': 'cold-start-benchmark'}},
+    'posts': {'queryStringParameters': {'limit': '20'}},
+    'characters': {},
+    'locations': {},
+    'messages': {'queryStringParameters': {'location_id': '1'}},
+    'search': {'queryStringParameters': {'q': 'таверна'}},
+    'follows': {'headers': {'X-User-Id': '1'}},
+}
+
+# Выполняется в свежем процессе: время считается от начала импорта index.py, а не от старта интерпретатора
+CHILD = '''
+import importlib.util, json, os, sys, time
+
+class Context:
+    request_id = 'cold-start'
+
+name, path, first_get = sys.argv[1], sys.argv[2], json.loads(sys.argv[3])
+result = {}
+started = time.perf_counter()
+spec = importlib.util.spec_from_file_location(name + '_index', path)
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+result['import_ms'] = (time.perf_counter() - started) * 1000
+result['driver_after_import'] = any(driver in sys.modules for driver in %(drivers)r)
+
+started = time.perf_counter()
+response = module.handler({'httpMethod': 'OPTIONS', 'headers': {}}, Context())
+result['options_ms'] = (time.perf_counter() - started) * 1000
+result['options_status'] = response['statusCode']
+result['driver_after_options'] = any(driver in sys.modules for driver in %(drivers)r)
+
+if first_get is not None:
+    started = time.perf_counter()
+    response = module.handler({'httpMethod': 'GET', 'headers': {}, **first_get}, Context())
+    result['first_get_ms'] = (time.perf_counter() - started) * 1000
+    result['first_get_status'] = response['statusCode']
+
+print(json.dumps(result))
+''' % {'drivers': DRIVER_MODULES}
+
+
+def parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    '''Строки "import time: self [us] | cumulative | package" -> самые дорогие по собственному времени'''
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = [part.strip() for part in line[len('import time:'):].split('|')]
+        modules.append({'module': module, 'self_ms': int(self_us) / 1000, 'cumulative_ms': int(cumulative_us) / 1000})
+    modules.sort(key=lambda module: module['self_ms'], reverse=True)
+    return modules[:TOP_IMPORTS]
+
+
+def cold_start(name: str, with_db: bool, prewarm: int) -> Dict[str, Any]:
+    env = {**os.environ, 'INSTRUMENT_LOG': '0', 'DB_PREWARM': str(prewarm)}
+    first_get = FIRST_GET.get(name, {}) if with_db else None
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CHILD, name, os.path.join(BACKEND_DIR, name, 'index.py'), json.dumps(first_get)],
+        cwd=os.path.join(BACKEND_DIR, name), env=env, capture_output=True, text=True, check=True
+    )
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result['top_imports'] = parse_importtime(completed.stderr)
+    return result
+
+
+def measure(name: str, runs: int = 5, with_db: bool = False, prewarm: int = 0) -> Dict[str, Any]:
+    samples = [cold_start(name, with_db, prewarm) for _ in range(runs)]
+    result: Dict[str, Any] = {'function': name, 'runs': runs, 'prewarm': prewarm}
+    for metric in ('import_ms', 'options_ms', 'first_get_ms'):
+        if metric in samples[0]:
+            result[metric] = round(statistics.median(sample[metric] for sample in samples), 2)
+    result['driver_after_import'] = any(sample['driver_after_import'] for sample in samples)
+    result['driver_after_options'] = any(sample['driver_after_options'] for sample in samples)
+    result['options_status'] = samples[0]['options_status']
+    if 'first_get_status' in samples[0]:
+        result['first_get_status'] = samples[0]['first_get_status']
+    result['top_imports'] = samples[-1]['top_imports']
+    return result
+
+
+def over_budget(result: Dict[str, Any], budget_ms: Optional[float]) -> bool:
+    if budget_ms is None:
+        return False
+    return result['import_ms'] + result['options_ms'] > budget_ms
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Measure cold start of every serverless function')
+    parser.add_argument('--functions', type=lambda value: value.split(','), default=discover_functions())
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--with-db', action='store_true', help='also time the first GET against DATABASE_URL')
+    parser.add_argument('--prewarm', type=int, default=0, help='DB_PREWARM for the cold processes')
+    parser.add_argument('--budget-ms', type=float, help='fail if import + first OPTIONS exceeds this')
+    args = parser.parse_args()
+
+    results = [measure(name, args.runs, args.with_db, args.prewarm) for name in args.functions]
+    for result in results:
+        result['over_budget'] = over_budget(result, args.budget_ms)
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    # С DB_PREWARM драйвер загружается при импорте намеренно
+    failed = any(result['over_budget'] or (result['driver_after_options'] and not args.prewarm) for result in results)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,381 @@
+'''
+Business: Нагрузочный стенд - вызывает handler(event, context) всех пяти функций в процессе против локального Postgres
+Args: --seed с объёмами (--users, --characters, --locations, --messages, --posts), --requests, --concurrency, --mix, --output, --baseline
+Returns: JSON с req/s, p50/p95/p99, числом запросов к БД и временем в БД на запрос по каждому сценарию
+'''
+
+import argparse
+import contextvars
+import importlib.util
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+MIGRATIONS_DIR = os.path.join(BACKEND_DIR, '..', 'db_migrations')
+FUNCTIONS = ['auth', 'posts', 'characters', 'locations', 'messages', 'search', 'follows']
+
+sys.path.append(BACKEND_DIR)
+
+# Строка лога на каждый запрос под нагрузкой только мешает - метрики стенд берёт через add_listener
+os.environ.setdefault('INSTRUMENT_LOG', '0')
+
+import psycopg2
+
+from common.db import pool_stats
+from common.instrument import add_listener
+
+DEFAULT_MIX = {
+    'feed': 20,
+    'home_feed': 5,
+    'feed_by_location': 5,
+    'locations_list': 10,
+    'chat_history': 15,
+    'chat_poll': 20,
+    'chat_post': 10,
+    'post_create': 3,
+    'character_profile': 7,
+    'session_check': 5,
+}
+
+# Контекст, а не поток: async-функции отдают метрики из фонового loop, куда копируется контекст вызова
+_request_stats: 'contextvars.ContextVar[Dict[str, Any]]' = contextvars.ContextVar('bench_request_stats')
+
+
+def _collect(request: Dict[str, Any]) -> None:
+    stats = _request_stats.get(None)
+    if stats is not None:
+        stats['queries'] = request['queries']
+        stats['db_time'] = request['db_ms'] / 1000
+
+
+class Context:
+    def __init__(self):
+        self.request_id = str(uuid.uuid4())
+        self.function_name = 'bench'
+
+
+def load_handlers(names: Optional[List[str]] = None) -> Dict[str, Callable[[Dict[str, Any], Any], Dict[str, Any]]]:
+    handlers = {}
+    for name in names or FUNCTIONS:
+        spec = importlib.util.spec_from_file_location(f'bench_{name}_index', os.path.join(BACKEND_DIR, name, 'index.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        handlers[name] = module.handler
+    return handlers
+
+
+def apply_migrations(conn) -> None:
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        if filename.endswith('.sql'):
+            with open(os.path.join(MIGRATIONS_DIR, filename)) as migration, conn.cursor() as cur:
+                cur.execute(migration.read())
+            conn.commit()
+
+
+# Таблицы, в которые V0002 и засев пишут строки; у каждой serial id
+SERIAL_TABLES = ['users', 'characters', 'locations', 'posts', 'messages']
+
+
+def sync_sequences(cur) -> None:
+    '''
+    V0002 вставляет пользователя и локации 1-3 с явными id и не двигает serial: без этого первый
+    INSERT засева на свежей базе падает на первичном ключе. Последовательность только растёт
+    '''
+    for table in SERIAL_TABLES:
+        cur.execute(
+            f'''SELECT setval(pg_get_serial_sequence('{table}', 'id'),
+                              GREATEST(MAX(id), nextval(pg_get_serial_sequence('{table}', 'id'))))
+                FROM {table}'''
+        )
+
+
+def seed(conn, volumes: Dict[str, int]) -> None:
+    with conn.cursor() as cur:
+        sync_sequences(cur)
+        cur.execute('''
+            INSERT INTO users (username, email)
+            SELECT 'bench_user_' || g, 'bench_' || g || '@example.com'
+            FROM generate_series(1, %(users)s) g
+            ON CONFLICT DO NOTHING
+        ''', volumes)
+        cur.execute('''
+            INSERT INTO sessions (token, user_id, expires_at)
+            SELECT 'bench-token-' || id, id, CURRENT_TIMESTAMP + INTERVAL '1 day'
+            FROM users WHERE username LIKE 'bench\\_user\\_%'
+            ON CONFLICT DO NOTHING
+        ''')
+        cur.execute('''
+            INSERT INTO characters (user_id, name, avatar, race, class, description)
+            SELECT u.id, 'Герой ' || g, 'https://api.dicebear.com/7.x/avataaars/svg?seed=' || g,
+                   'Эльф', 'Маг', repeat('Древняя история героя. ', 20)
+            FROM generate_series(1, %(characters)s) g
+            JOIN LATERAL (
+                SELECT id FROM users WHERE username = 'bench_user_' || (g %% %(users)s + 1)
+            ) u ON TRUE
+        ''', volumes)
+        cur.execute('''
+            INSERT INTO locations (user_id, name, type, description)
+            SELECT (SELECT MIN(id) FROM users), 'Локация ' || g, 'Таверна', repeat('Описание локации. ', 10)
+            FROM generate_series(1, %(locations)s) g
+        ''', volumes)
+        # Настоящие списки id, а не MIN..MAX: в id бывают пропуски, и ссылка в пропуск нарушила бы FK
+        cur.execute('SELECT id FROM characters ORDER BY id')
+        character_ids = [row[0] for row in cur.fetchall()]
+        cur.execute('SELECT id FROM locations ORDER BY id')
+        location_ids = [row[0] for row in cur.fetchall()]
+        params = {
+            **volumes,
+            'character_ids': character_ids, 'char_count': len(character_ids),
+            'location_ids': location_ids, 'loc_count': len(location_ids),
+        }
+        # Подписки до постов: триггер fan-out сразу наполняет feed_items, как при обычной записи
+        cur.execute('''
+            INSERT INTO location_follows (user_id, location_id)
+            SELECT u.id, (%(location_ids)s::int[])[1 + (u.id * 31 + k * 97) %% %(loc_count)s]
+            FROM users u CROSS JOIN generate_series(1, %(follows)s) k
+            WHERE u.username LIKE 'bench\\_user\\_%%'
+            ON CONFLICT DO NOTHING
+        ''', params)
+        cur.execute('''
+            INSERT INTO character_follows (user_id, character_id)
+            SELECT u.id, (%(character_ids)s::int[])[1 + (u.id * 17 + k * 89) %% %(char_count)s]
+            FROM users u CROSS JOIN generate_series(1, %(follows)s) k
+            WHERE u.username LIKE 'bench\\_user\\_%%'
+            ON CONFLICT DO NOTHING
+        ''', params)
+        cur.execute('''
+            UPDATE locations l
+            SET follower_count = s.follower_count
+            FROM (SELECT location_id, COUNT(*) AS follower_count FROM location_follows GROUP BY location_id) s
+            WHERE l.id = s.location_id
+        ''')
+        cur.execute('''
+            INSERT INTO messages (character_id, location_id, content, created_at)
+            SELECT (%(character_ids)s::int[])[1 + g %% %(char_count)s],
+                   (%(location_ids)s::int[])[1 + (g * 7) %% %(loc_count)s],
+                   'Сообщение ' || g || ' в чате локации', CURRENT_TIMESTAMP - (%(messages)s - g) * INTERVAL '1 second'
+            FROM generate_series(1, %(messages)s) g
+        ''', params)
+        cur.execute('''
+            INSERT INTO posts (character_id, location_id, content, created_at)
+            SELECT (%(character_ids)s::int[])[1 + g %% %(char_count)s],
+                   (%(location_ids)s::int[])[1 + (g * 13) %% %(loc_count)s],
+                   repeat('Пост о приключениях. ', 5), CURRENT_TIMESTAMP - (%(posts)s - g) * INTERVAL '1 second'
+            FROM generate_series(1, %(posts)s) g
+        ''', params)
+        cur.execute('''
+            UPDATE locations l
+            SET message_count = s.message_count, last_message_at = s.last_message_at
+            FROM (
+                SELECT location_id, COUNT(*) AS message_count, MAX(created_at) AS last_message_at
+                FROM messages GROUP BY location_id
+            ) s
+            WHERE l.id = s.location_id
+        ''')
+    conn.commit()
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute('VACUUM ANALYZE')
+    conn.autocommit = False
+
+
+class Workload:
+    def __init__(self, conn):
+        with conn.cursor() as cur:
+            cur.execute('SELECT id FROM characters')
+            self.characters = [row[0] for row in cur.fetchall()]
+            cur.execute('SELECT id FROM locations')
+            self.locations = [row[0] for row in cur.fetchall()]
+            cur.execute('SELECT COALESCE(MAX(id), 0) FROM messages')
+            self.last_message_id = cur.fetchone()[0]
+            cur.execute("SELECT token FROM sessions WHERE token LIKE 'bench-token-%' LIMIT 1000")
+            self.tokens = [row[0] for row in cur.fetchall()]
+            cur.execute("SELECT user_id FROM location_follows GROUP BY user_id LIMIT 1000")
+            self.followers = [row[0] for row in cur.fetchall()] or [1]
+        conn.rollback()
+
+    def _character(self) -> int:
+        return random.choice(self.characters)
+
+    def _location(self) -> int:
+        return random.choice(self.locations)
+
+    def event(self, scenario: str) -> Tuple[str, Dict[str, Any]]:
+        if scenario == 'feed':
+            return 'posts', {'httpMethod': 'GET', 'queryStringParameters': {'limit': '20'}}
+        if scenario == 'home_feed':
+            return 'posts', {
+                'httpMethod': 'GET',
+                'headers': {'X-User-Id': str(random.choice(self.followers))},
+                'queryStringParameters': {'limit': '20', 'feed': 'home'}
+            }
+        if scenario == 'feed_by_location':
+            return 'posts', {'httpMethod': 'GET', 'queryStringParameters': {'limit': '20', 'location_id': str(self._location())}}
+        if scenario == 'locations_list':
+            return 'locations', {'httpMethod': 'GET', 'queryStringParameters': {}}
+        if scenario == 'chat_history':
+            return 'messages', {'httpMethod': 'GET', 'queryStringParameters': {'location_id': str(self._location())}}
+        if scenario == 'chat_poll':
+            return 'messages', {'httpMethod': 'GET', 'queryStringParameters': {
+                'location_id': str(self._location()), 'after_id': str(self.last_message_id)
+            }}
+        if scenario == 'chat_post':
+            return 'messages', {'httpMethod': 'POST', 'body': json.dumps({
+                'character_id': self._character(), 'location_id': self._location(), 'content': 'Бенчмарк: новое сообщение'
+            })}
+        if scenario == 'post_create':
+            return 'posts', {'httpMethod': 'POST', 'body': json.dumps({
+                'character_id': self._character(), 'location_id': self._location(), 'content': 'Бенчмарк: новый пост'
+            })}
+        if scenario == 'character_profile':
+            return 'characters', {'httpMethod': 'GET', 'queryStringParameters': {'id': str(self._character())}}
+        if scenario == 'search':
+            return 'search', {'httpMethod': 'GET', 'queryStringParameters': {
+                'q': random.choice(['герой', 'таверна', 'приключения', 'эльф маг']), 'limit': '20'
+            }}
+        if scenario == 'session_check':
+            return 'auth', {'httpMethod': 'GET', 'headers': {'X-Session-Token': random.choice(self.tokens)}}
+        raise ValueError(f'Unknown scenario: {scenario}')
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+def summarize(samples: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    latencies = [sample['latency'] for sample in samples]
+    statuses: Dict[str, int] = {}
+    for sample in samples:
+        statuses[str(sample['status'])] = statuses.get(str(sample['status']), 0) + 1
+    count = len(samples)
+    return {
+        'requests': count,
+        'errors': sum(1 for sample in samples if sample['status'] >= 500),
+        'statuses': statuses,
+        'rps': round(count / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'queries_per_request': round(sum(sample['queries'] for sample in samples) / count, 2) if count else 0.0,
+        'db_ms_per_request': round(sum(sample['db_time'] for sample in samples) / count * 1000, 2) if count else 0.0,
+    }
+
+
+def run(handlers, workload: Workload, mix: Dict[str, int], requests: int, concurrency: int) -> Dict[str, Any]:
+    scenarios = random.choices(list(mix), weights=list(mix.values()), k=requests)
+
+    def invoke(scenario: str) -> Dict[str, Any]:
+        function, event = workload.event(scenario)
+        stats = {'queries': 0, 'db_time': 0.0}
+        _request_stats.set(stats)
+        started = time.perf_counter()
+        response = handlers[function](event, Context())
+        return {
+            'scenario': scenario,
+            'status': response['statusCode'],
+            'latency': time.perf_counter() - started,
+            'queries': stats['queries'],
+            'db_time': stats['db_time'],
+        }
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(invoke, scenarios))
+    elapsed = time.perf_counter() - started
+
+    by_scenario = {
+        scenario: summarize([sample for sample in samples if sample['scenario'] == scenario], elapsed)
+        for scenario in mix
+    }
+    return {'total': summarize(samples, elapsed), 'scenarios': by_scenario}
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=BACKEND_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, Any]:
+    '''Относительное изменение ключевых метрик: положительное значение у латентности - регрессия'''
+    deltas = {}
+    for scenario, metrics in current['results']['scenarios'].items():
+        before = baseline['results']['scenarios'].get(scenario)
+        if not before:
+            continue
+        deltas[scenario] = {
+            metric: round((metrics[metric] - before[metric]) / before[metric], 3) if before[metric] else None
+            for metric in ('rps', 'p50_ms', 'p99_ms', 'queries_per_request', 'db_ms_per_request')
+        }
+    return deltas
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='In-process load test for the backend handlers')
+    parser.add_argument('--migrate', action='store_true', help='apply db_migrations before seeding')
+    parser.add_argument('--seed', action='store_true', help='insert synthetic data with the volumes below')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--characters', type=int, default=5000)
+    parser.add_argument('--locations', type=int, default=2000)
+    parser.add_argument('--messages', type=int, default=1000000)
+    parser.add_argument('--posts', type=int, default=100000)
+    parser.add_argument('--follows', type=int, default=10, help='locations and characters followed per user')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--mix', type=json.loads, default=DEFAULT_MIX, help='JSON object scenario -> weight')
+    parser.add_argument('--output', help='write results JSON here instead of stdout')
+    parser.add_argument('--baseline', help='results JSON from an earlier commit to compare against')
+    args = parser.parse_args()
+
+    os.environ.setdefault('DB_POOL_MAX_SIZE', str(args.concurrency))
+    os.environ.setdefault('NOTIFY_BACKEND', 'memory')
+    # Нагрузка идёт от нескольких клиентов - лимиты частоты исказили бы пропускную способность
+    os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+
+    admin = psycopg2.connect(os.environ['DATABASE_URL'])
+    if args.migrate:
+        apply_migrations(admin)
+    if args.seed:
+        seed(admin, {
+            'users': args.users, 'characters': args.characters, 'locations': args.locations,
+            'messages': args.messages, 'posts': args.posts, 'follows': args.follows,
+        })
+    workload = Workload(admin)
+    admin.close()
+
+    add_listener(_collect)
+    handlers = load_handlers()
+    report = {
+        'revision': git_revision(),
+        'config': {
+            'requests': args.requests, 'concurrency': args.concurrency, 'mix': args.mix,
+            'pool_max_size': int(os.environ['DB_POOL_MAX_SIZE']),
+        },
+        'results': run(handlers, workload, args.mix, args.requests, args.concurrency),
+        'pool': pool_stats(),
+    }
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        report['compared_to'] = baseline.get('revision')
+        report['delta'] = compare(report, baseline)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as result_file:
+            result_file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+'''
+Business: Бенчмарк лайков одного горячего поста - UPDATE posts.likes против шардированных счётчиков
+Args: --likes (пользователей, каждый ставит один лайк), --concurrency, --shards (через запятую), --commit-delay-ms (задержка до commit, как сетевой RTT)
+Returns: JSON с лайками в секунду, p50/p99 и проверкой итогового счётчика для каждой схемы
+'''
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import psycopg2
+
+from bench.harness import percentile
+from common.likes import LIKE_SQL
+
+# Как сделал бы наивный обработчик: каждый лайк держит блокировку строки поста до commit
+ROW_LIKE_SQL = '''
+    WITH liked AS (
+        INSERT INTO post_likes (user_id, post_id) VALUES (%(user_id)s, %(post_id)s)
+        ON CONFLICT DO NOTHING
+        RETURNING post_id
+    )
+    UPDATE posts SET likes = COALESCE(likes, 0) + 1
+    WHERE id IN (SELECT post_id FROM liked)
+'''
+
+
+def prepare(conn, likes: int) -> List[int]:
+    with conn.cursor() as cur:
+        cur.execute('''
+            INSERT INTO users (username, email)
+            SELECT 'bench_like_user_' || g, 'bench_like_' || g || '@example.com'
+            FROM generate_series(1, %s) g
+            ON CONFLICT DO NOTHING
+        ''', (likes,))
+        cur.execute(
+            "SELECT id FROM users WHERE username LIKE 'bench\\_like\\_user\\_%%' ORDER BY id LIMIT %s",
+            (likes,)
+        )
+        user_ids = [row[0] for row in cur.fetchall()]
+    conn.commit()
+    return user_ids
+
+
+def create_post(conn) -> int:
+    with conn.cursor() as cur:
+        cur.execute('''
+            INSERT INTO posts (character_id, location_id, content)
+            SELECT (SELECT MIN(id) FROM characters), (SELECT MIN(id) FROM locations), 'Бенчмарк: горячий пост'
+            RETURNING id
+        ''')
+        post_id = cur.fetchone()[0]
+    conn.commit()
+    return post_id
+
+
+def total_likes(conn, post_id: int) -> int:
+    with conn.cursor() as cur:
+        cur.execute('''
+            SELECT COALESCE(p.likes, 0) + COALESCE((SELECT SUM(likes) FROM post_like_shards WHERE post_id = p.id), 0)
+            FROM posts p WHERE p.id = %s
+        ''', (post_id,))
+        count = cur.fetchone()[0]
+    conn.rollback()
+    return int(count)
+
+
+def run(dsn: str, user_ids: List[int], post_id: int, concurrency: int, shards: Optional[int], commit_delay: float) -> Dict[str, Any]:
+    local = threading.local()
+    connections = []
+    lock = threading.Lock()
+
+    def connection():
+        if not hasattr(local, 'conn'):
+            local.conn = psycopg2.connect(dsn)
+            with lock:
+                connections.append(local.conn)
+        return local.conn
+
+    def like(user_id: int) -> float:
+        conn = connection()
+        started = time.perf_counter()
+        with conn.cursor() as cur:
+            if shards is None:
+                cur.execute(ROW_LIKE_SQL, {'user_id': user_id, 'post_id': post_id})
+            else:
+                cur.execute(LIKE_SQL, {'user_id': user_id, 'post_id': post_id, 'shard': random.randrange(shards)})
+        if commit_delay:
+            time.sleep(commit_delay)
+        conn.commit()
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(like, user_ids))
+    elapsed = time.perf_counter() - started
+    for conn in connections:
+        conn.close()
+
+    return {
+        'likes_per_second': round(len(user_ids) / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark concurrent likes on a single hot post')
+    parser.add_argument('--likes', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--shards', type=lambda value: [int(shard) for shard in value.split(',')], default=[4, 16, 64])
+    parser.add_argument('--commit-delay-ms', type=float, default=1.0)
+    args = parser.parse_args()
+
+    dsn = os.environ['DATABASE_URL']
+    conn = psycopg2.connect(dsn)
+    user_ids = prepare(conn, args.likes)
+
+    results = []
+    for shards in [None] + args.shards:
+        post_id = create_post(conn)
+        result = run(dsn, user_ids, post_id, args.concurrency, shards, args.commit_delay_ms / 1000)
+        results.append({
+            'scheme': 'row_update' if shards is None else f'sharded_{shards}',
+            'likes': len(user_ids),
+            'concurrency': args.concurrency,
+            **result,
+            'count_matches': total_likes(conn, post_id) == len(user_ids),
+        })
+    conn.close()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
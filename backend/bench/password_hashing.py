@@ -0,0 +1,73 @@
+'''
+Business: Бенчмарк стоимости хэширования паролей - логины в секунду и p99 для каждой настройки KDF
+Args: --logins, --concurrency (параллельные запросы), --workers (размер пула хэширования)
+Returns: JSON со строкой результатов на каждую настройку, чтобы подобрать параметры под железо
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.passwords import hash_password_sync, verify_password_sync
+
+SETTINGS: List[Dict[str, Any]] = [
+    {'algorithm': 'scrypt', 'params': {'n': 2 ** 13, 'r': 8, 'p': 1}},
+    {'algorithm': 'scrypt', 'params': {'n': 2 ** 14, 'r': 8, 'p': 1}},
+    {'algorithm': 'scrypt', 'params': {'n': 2 ** 15, 'r': 8, 'p': 1}},
+    {'algorithm': 'pbkdf2_sha256', 'params': {'i': 100000}},
+    {'algorithm': 'pbkdf2_sha256', 'params': {'i': 300000}},
+    {'algorithm': 'pbkdf2_sha256', 'params': {'i': 600000}},
+]
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_setting(settings: Dict[str, Any], logins: int, concurrency: int, workers: int) -> Dict[str, Any]:
+    stored = hash_password_sync('benchmark-password', settings)
+    hash_pool = ThreadPoolExecutor(max_workers=workers)
+    
+    def login() -> float:
+        started = time.perf_counter()
+        assert hash_pool.submit(verify_password_sync, 'benchmark-password', stored).result()
+        return time.perf_counter() - started
+    
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as requests:
+        latencies = list(requests.map(lambda _: login(), range(logins)))
+    elapsed = time.perf_counter() - started
+    hash_pool.shutdown()
+    
+    return {
+        'algorithm': settings['algorithm'],
+        'params': settings['params'],
+        'logins': logins,
+        'concurrency': concurrency,
+        'workers': workers,
+        'logins_per_second': round(logins / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark password KDF cost settings')
+    parser.add_argument('--logins', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('PASSWORD_HASH_WORKERS', 2)))
+    args = parser.parse_args()
+    
+    results = [run_setting(settings, args.logins, args.concurrency, args.workers) for settings in SETTINGS]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+'''
+Business: Бенчмарк размера ответов - полные строки против ?fields=, компактного формата и сжатия gzip/br для списков
+Args: --migrate/--seed как у harness, --repeat (вызовов на вариант), --functions (через запятую); база по DATABASE_URL
+Returns: JSON с байтами тела и на проводе, временем сериализации и сжатия, p50 и экономией относительно полного ответа без сжатия
+'''
+
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+os.environ.setdefault('INSTRUMENT_LOG', '0')
+
+import psycopg2
+
+from bench.harness import apply_migrations, load_handlers, percentile, seed
+from common.instrument import add_listener
+
+# Поля, которых хватает карточке списка во фронтенде
+LIST_FIELDS = {
+    'characters': 'id,name,avatar,race,class',
+    'locations': 'id,name,type,message_count,last_message_at',
+    'posts': 'id,character_name,character_avatar,location_name,content,likes,created_at',
+    'messages': 'id,character_name,character_avatar,content,created_at',
+}
+ENCODINGS = ['identity', 'gzip', 'br']
+
+_metrics: List[Dict[str, Any]] = []
+
+
+def base_params(conn, function: str) -> Dict[str, str]:
+    if function == 'posts':
+        return {'limit': '50'}
+    if function == 'messages':
+        with conn.cursor() as cur:
+            cur.execute('SELECT id FROM locations ORDER BY message_count DESC LIMIT 1')
+            location_id = cur.fetchone()[0]
+        conn.rollback()
+        return {'location_id': str(location_id), 'limit': '200'}
+    return {}
+
+
+def variants(function: str) -> List[Tuple[str, Dict[str, str]]]:
+    return [
+        ('full', {}),
+        ('fields', {'fields': LIST_FIELDS[function]}),
+        ('fields_compact', {'fields': LIST_FIELDS[function], 'format': 'compact'}),
+    ]
+
+
+def wire_bytes(response: Dict[str, Any]) -> int:
+    if response.get('isBase64Encoded'):
+        return len(base64.b64decode(response['body']))
+    return len(response['body'].encode())
+
+
+def measure(handler, params: Dict[str, str], encoding: str, repeat: int) -> Dict[str, Any]:
+    event = {
+        'httpMethod': 'GET',
+        'headers': {'Accept-Encoding': encoding},
+        'queryStringParameters': params,
+    }
+    latencies: List[float] = []
+    serialize_ms: List[float] = []
+    compress_ms: List[float] = []
+    response: Optional[Dict[str, Any]] = None
+    for _ in range(repeat):
+        _metrics.clear()
+        started = time.perf_counter()
+        response = handler(event, None)
+        latencies.append(time.perf_counter() - started)
+        assert response['statusCode'] == 200, response['body']
+        serialize_ms.append(_metrics[-1]['serialize_ms'] if _metrics else 0.0)
+        compress_ms.append(_metrics[-1]['compress_ms'] if _metrics else 0.0)
+    return {
+        'content_encoding': response['headers'].get('Content-Encoding', 'identity'),
+        'wire_bytes': wire_bytes(response),
+        'serialize_ms': round(sum(serialize_ms) / repeat, 3),
+        'compress_ms': round(sum(compress_ms) / repeat, 3),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Measure list payload size with field projection, compact format and compression')
+    parser.add_argument('--migrate', action='store_true', help='apply db_migrations before seeding')
+    parser.add_argument('--seed', action='store_true', help='insert synthetic data with the volumes below')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--characters', type=int, default=5000)
+    parser.add_argument('--locations', type=int, default=2000)
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--posts', type=int, default=20000)
+    parser.add_argument('--functions', type=lambda value: value.split(','), default=list(LIST_FIELDS))
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    if args.migrate:
+        apply_migrations(conn)
+    if args.seed:
+        seed(conn, {
+            'users': args.users, 'characters': args.characters, 'locations': args.locations,
+            'messages': args.messages, 'posts': args.posts, 'follows': 0,
+        })
+
+    add_listener(_metrics.append)
+    handlers = load_handlers(args.functions)
+    report = []
+    for function in args.functions:
+        params = base_params(conn, function)
+        baseline: Optional[Dict[str, Any]] = None
+        for variant, extra in variants(function):
+            for encoding in ENCODINGS:
+                result = measure(handlers[function], {**params, **extra}, encoding, args.repeat)
+                if baseline is None:
+                    baseline = result
+                report.append({
+                    'function': function,
+                    'variant': variant,
+                    'accept_encoding': encoding,
+                    **result,
+                    'bytes_saved_pct': round(100 * (1 - result['wire_bytes'] / max(baseline['wire_bytes'], 1)), 1),
+                    'serialize_ms_saved': round(baseline['serialize_ms'] - result['serialize_ms'], 3),
+                })
+    conn.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+'''
+Business: Бенчмарк самостоятельного развёртывания - отдельный процесс на функцию против общего роутера tools/serve.py
+Args: --requests, --concurrency, --workers (воркеров роутера, по умолчанию по одному на функцию), --preflight-share (доля OPTIONS), --port, --asgi (добавить схему router_asgi, нужен uvicorn); база уже засеяна harness --seed
+Returns: JSON с req/s, p50/p99, числом соединений с базой и суммарной памятью серверных процессов для каждой схемы
+'''
+
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Tuple
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import psycopg2
+
+from bench.harness import BACKEND_DIR, percentile
+
+SERVE = os.path.join(BACKEND_DIR, 'tools', 'serve.py')
+GET_FUNCTIONS = ['posts', 'characters', 'locations', 'messages', 'search']
+STARTUP_TIMEOUT = 30.0
+
+
+def request_paths(conn, count: int, preflight_share: float) -> List[Tuple[str, str, str]]:
+    with conn.cursor() as cur:
+        cur.execute('SELECT id FROM locations ORDER BY random() LIMIT 50')
+        location_ids = [row[0] for row in cur.fetchall()]
+    conn.rollback()
+    queries = {
+        'posts': lambda: '?limit=20',
+        'characters': lambda: '',
+        'locations': lambda: '',
+        'messages': lambda: f'?location_id={random.choice(location_ids)}',
+        'search': lambda: '?q=' + random.choice(['%D1%82%D0%B0%D0%B2%D0%B5%D1%80%D0%BD%D0%B0', 'hero']),
+    }
+    paths = []
+    for _ in range(count):
+        function = random.choice(GET_FUNCTIONS)
+        method = 'OPTIONS' if random.random() < preflight_share else 'GET'
+        paths.append((function, method, queries[function]()))
+    return paths
+
+
+def start_server(port: int, workers: int, functions: List[str], asgi: bool = False) -> subprocess.Popen:
+    env = {**os.environ, 'INSTRUMENT_LOG': '0'}
+    process = subprocess.Popen(
+        [sys.executable, SERVE, '--port', str(port), '--workers', str(workers), '--functions', ','.join(functions)]
+        + (['--asgi'] if asgi else []),
+        env=env
+    )
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            probe = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            probe.request('OPTIONS', f'/{functions[0]}')
+            probe.getresponse().read()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f'server on port {port} did not start')
+
+
+def process_tree_rss_kb(pid: int) -> int:
+    '''RSS процесса и его прямых потомков (воркеров после fork)'''
+    total = 0
+    children_path = f'/proc/{pid}/task/{pid}/children'
+    children = open(children_path).read().split() if os.path.exists(children_path) else []
+    for member in [pid] + [int(child) for child in children]:
+        with open(f'/proc/{member}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    total += int(line.split()[1])
+    return total
+
+
+def database_connections(conn) -> int:
+    with conn.cursor() as cur:
+        cur.execute('SELECT COUNT(*) FROM pg_stat_activity WHERE datname = current_database() AND pid <> pg_backend_pid()')
+        count = cur.fetchone()[0]
+    conn.rollback()
+    return count
+
+
+def drive(ports: Dict[str, int], paths: List[Tuple[str, str, str]], concurrency: int) -> Dict[str, Any]:
+    headers = {'X-User-Id': '1'}
+
+    def call(item: Tuple[str, str, str]) -> Tuple[float, int]:
+        function, method, query = item
+        started = time.perf_counter()
+        client = http.client.HTTPConnection('127.0.0.1', ports[function], timeout=60)
+        client.request(method, f'/{function}{query}', headers=headers)
+        response = client.getresponse()
+        response.read()
+        client.close()
+        return time.perf_counter() - started, response.status
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(call, paths))
+    elapsed = time.perf_counter() - started
+    latencies = [latency for latency, _ in samples]
+    statuses: Dict[str, int] = {}
+    for _, status in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'requests': len(paths),
+        'req_per_second': round(len(paths) / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'statuses': statuses,
+    }
+
+
+def run_scheme(conn, scheme: str, paths: List[Tuple[str, str, str]], args: argparse.Namespace) -> Dict[str, Any]:
+    processes = []
+    try:
+        if scheme == 'per_function':
+            ports = {function: args.port + index for index, function in enumerate(GET_FUNCTIONS)}
+            processes = [start_server(port, 1, [function]) for function, port in ports.items()]
+        else:
+            ports = {function: args.port for function in GET_FUNCTIONS}
+            processes = [start_server(args.port, args.workers, GET_FUNCTIONS, asgi=scheme == 'router_asgi')]
+        result = drive(ports, paths, args.concurrency)
+        result['server_processes'] = len(GET_FUNCTIONS) if scheme == 'per_function' else args.workers
+        result['db_connections'] = database_connections(conn)
+        result['server_rss_mb'] = round(sum(process_tree_rss_kb(process.pid) for process in processes) / 1024, 1)
+        return {'scheme': scheme, **result}
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Compare one process per function with the consolidated router')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=len(GET_FUNCTIONS))
+    parser.add_argument('--preflight-share', type=float, default=0.2, help='share of OPTIONS requests, as browsers send them')
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--asgi', action='store_true', help='also measure the router under uvicorn')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    paths = request_paths(conn, args.requests, args.preflight_share)
+    schemes = ['per_function', 'router'] + (['router_asgi'] if args.asgi else [])
+    results = [run_scheme(conn, scheme, paths, args) for scheme in schemes]
+    conn.close()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
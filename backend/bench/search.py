@@ -0,0 +1,107 @@
+'''
+Business: Бенчмарк поиска - search handler (tsvector + GIN) против полного просмотра таблиц с фильтрацией в Python
+Args: --migrate/--seed как у harness, --repeat (повторов на запрос), --terms (поисковые запросы через запятую)
+Returns: JSON с p50/p99, числом совпадений и объёмом прочитанного текста для каждого запроса и способа
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, Any, List
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+os.environ.setdefault('INSTRUMENT_LOG', '0')
+
+import psycopg2
+
+from bench.harness import apply_migrations, load_handlers, percentile, seed
+
+DEFAULT_TERMS = ['герой', 'таверна', 'приключения', 'сообщение 4242', 'эльф маг']
+
+# Так клиент ищет сегодня: выгружает все списки целиком и фильтрует подстрокой у себя
+FULL_SCAN_SOURCES = [
+    ('character', "SELECT id, name || ' ' || race || ' ' || class || ' ' || description FROM characters"),
+    ('location', "SELECT id, name || ' ' || type || ' ' || description FROM locations"),
+    ('post', 'SELECT id, content FROM posts'),
+    ('message', 'SELECT id, content FROM messages'),
+]
+
+
+def full_scan(conn, term: str) -> Dict[str, Any]:
+    needle = term.casefold()
+    matches = 0
+    scanned_bytes = 0
+    for entity, sql in FULL_SCAN_SOURCES:
+        with conn.cursor(name=f'search_bench_{entity}') as cur:
+            cur.itersize = 5000
+            cur.execute(sql)
+            for _, text in cur:
+                scanned_bytes += len(text)
+                if needle in text.casefold():
+                    matches += 1
+    conn.rollback()
+    return {'matches': matches, 'scanned_bytes': scanned_bytes}
+
+
+def fts_search(search_handler, term: str, limit: int) -> Dict[str, Any]:
+    response = search_handler({'httpMethod': 'GET', 'queryStringParameters': {'q': term, 'limit': str(limit)}}, None)
+    assert response['statusCode'] == 200, response['body']
+    body = json.loads(response['body'])
+    return {'matches': len(body['results']), 'response_bytes': len(response['body'])}
+
+
+def measure(function, repeat: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    result: Dict[str, Any] = {}
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        latencies.append(time.perf_counter() - started)
+    return {
+        **result,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Compare full-text search with a full scan of the tables')
+    parser.add_argument('--migrate', action='store_true', help='apply db_migrations before seeding')
+    parser.add_argument('--seed', action='store_true', help='insert synthetic data with the volumes below')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--characters', type=int, default=5000)
+    parser.add_argument('--locations', type=int, default=2000)
+    parser.add_argument('--messages', type=int, default=1000000)
+    parser.add_argument('--posts', type=int, default=100000)
+    parser.add_argument('--terms', type=lambda value: value.split(','), default=DEFAULT_TERMS)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--scan-repeat', type=int, default=3, help='the full scan is slow, repeat it fewer times')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    if args.migrate:
+        apply_migrations(conn)
+    if args.seed:
+        seed(conn, {
+            'users': args.users, 'characters': args.characters, 'locations': args.locations,
+            'messages': args.messages, 'posts': args.posts, 'follows': 0,
+        })
+
+    search_handler = load_handlers(['search'])['search']
+    results = []
+    for term in args.terms:
+        results.append({
+            'term': term,
+            'fts': measure(lambda: fts_search(search_handler, term, args.limit), args.repeat),
+            'full_scan': measure(lambda: full_scan(conn, term), args.scan_repeat),
+        })
+    conn.close()
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
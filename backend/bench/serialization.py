@@ -0,0 +1,115 @@
+'''
+Business: Бенчмарк сериализации списков - пиковая память и скорость fetchall+dict+dumps против потокового кодирования
+Args: --rows (например 10000 100000), --source synthetic|postgres (postgres читает messages по DATABASE_URL)
+Returns: JSON с пиковым приростом RSS, временем и размером тела для каждого режима
+'''
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Any, Iterator, List, Tuple
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.serialize import DEFAULT_CHUNK_SIZE, row_encoder
+
+COLUMNS = ['id', 'character_id', 'location_id', 'content', 'created_at']
+CONTENT = 'Странник заходит в таверну, стряхивает снег с плаща и заказывает кружку эля. ' * 3
+STARTED_AT = datetime(2024, 1, 1)
+
+
+def synthetic_chunks(rows: int, chunk_size: int) -> Iterator[List[Tuple[Any, ...]]]:
+    for start in range(0, rows, chunk_size):
+        yield [
+            (row_id, row_id % 50 + 1, row_id % 7 + 1, CONTENT, STARTED_AT + timedelta(seconds=row_id))
+            for row_id in range(start, min(start + chunk_size, rows))
+        ]
+
+
+def baseline_synthetic(rows: int) -> str:
+    fetched = [dict(zip(COLUMNS, row)) for chunk in synthetic_chunks(rows, rows) for row in chunk]
+    return json.dumps([dict(row) for row in fetched], default=str)
+
+
+def streaming_synthetic(rows: int) -> str:
+    encode = row_encoder(COLUMNS)
+    parts = [','.join(map(encode, chunk)) for chunk in synthetic_chunks(rows, DEFAULT_CHUNK_SIZE)]
+    return '[' + ','.join(parts) + ']'
+
+
+SQL = 'SELECT id, character_id, location_id, content, created_at FROM messages ORDER BY id LIMIT %s'
+
+
+def baseline_postgres(rows: int) -> str:
+    import psycopg2
+    from psycopg2.extras import RealDictCursor
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    cur.execute(SQL, (rows,))
+    fetched = cur.fetchall()
+    body = json.dumps([dict(row) for row in fetched], default=str)
+    conn.close()
+    return body
+
+
+def streaming_postgres(rows: int) -> str:
+    import psycopg2
+    from common.serialize import query_json_array
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    body = query_json_array(conn, SQL, (rows,))
+    conn.close()
+    return body
+
+
+MODES = {
+    ('synthetic', 'baseline'): baseline_synthetic,
+    ('synthetic', 'streaming'): streaming_synthetic,
+    ('postgres', 'baseline'): baseline_postgres,
+    ('postgres', 'streaming'): streaming_postgres,
+}
+
+
+def measure(source: str, mode: str, rows: int, results: Any) -> None:
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    body = MODES[(source, mode)](rows)
+    elapsed = time.perf_counter() - started
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    body_bytes = len(body.encode())
+    results.put({
+        'source': source,
+        'mode': mode,
+        'rows': rows,
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(rows / elapsed),
+        'body_bytes': body_bytes,
+        'peak_rss_delta_mb': round((rss_after - rss_before) / 1024, 1),
+    })
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Compare list serialization strategies')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--source', choices=['synthetic', 'postgres'], default='synthetic')
+    args = parser.parse_args()
+    
+    # Каждый замер в отдельном процессе: ru_maxrss - максимум за всю жизнь процесса
+    context = multiprocessing.get_context('spawn')
+    report: List[Dict[str, Any]] = []
+    for rows in args.rows:
+        for mode in ('baseline', 'streaming'):
+            results = context.Queue()
+            process = context.Process(target=measure, args=(args.source, mode, rows, results))
+            process.start()
+            report.append(results.get())
+            process.join()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
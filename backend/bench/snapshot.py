@@ -0,0 +1,229 @@
+'''
+Business: Бенчмарк снимков локации - экспорт COPY TO в gzip NDJSON и импорт COPY FROM с переназначением id на большом чате
+Args: --messages (по умолчанию 1000000), --posts, --characters, --months (на сколько месяцев назад растянуть чат), --output (файл снимка), --location-id (готовая локация вместо засева); база по DATABASE_URL
+Returns: JSON с rows/s, временем, размером архива и пиковым приростом RSS для экспорта и импорта,
+         плюс сверка исходной и импортированной локации и границ курсоров чата; код возврата 1, если фаза упала,
+         данные разошлись или опрос исходного чата после импорта перестал отсекать старые месяцы.
+         Маленький объём (--messages 1000 --posts 100 --characters 5) - быстрая проверка экспорта и импорта
+'''
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+import uuid
+from typing import Dict, Any, List
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import psycopg2
+
+from tools.snapshot import export_location, import_snapshot
+
+
+def seed_location(conn, messages: int, posts: int, characters: int, months: int) -> int:
+    '''
+    Одна локация с большим чатом, растянутым на months месяцев назад. Импорт впишет в эти месяцы id
+    больше последнего id исходного чата - id перестанут расти от месяца к месяцу
+    '''
+    suffix = uuid.uuid4().hex[:8]
+    with conn.cursor() as cur:
+        cur.execute(
+            'INSERT INTO users (username, email) VALUES (%s, %s) RETURNING id',
+            (f'snapshot_bench_{suffix}', f'snapshot_bench_{suffix}@example.com')
+        )
+        user_id = cur.fetchone()[0]
+        cur.execute(
+            '''INSERT INTO locations (user_id, name, type, description)
+               VALUES (%s, %s, 'tavern', 'Таверна для замера снимков') RETURNING id''',
+            (user_id, f'Snapshot bench {suffix}')
+        )
+        location_id = cur.fetchone()[0]
+        cur.execute(
+            '''INSERT INTO characters (user_id, name, avatar, race, class, description)
+               SELECT %s, 'Герой ' || i, 'https://api.dicebear.com/7.x/avataaars/svg?seed=' || i, 'Эльф', 'Маг',
+                      repeat('Длинная история персонажа. ', 40)
+               FROM generate_series(1, %s) i
+               RETURNING id''',
+            (user_id, characters)
+        )
+        character_ids = [row[0] for row in cur.fetchall()]
+        cur.execute(
+            '''SELECT create_messages_partition(month_start)
+               FROM generate_series(date_trunc('month', LOCALTIMESTAMP - %s * INTERVAL '1 month'),
+                                    LOCALTIMESTAMP, INTERVAL '1 month') month_start''',
+            (months,)
+        )
+        cur.execute(
+            '''INSERT INTO messages (character_id, location_id, content, created_at)
+               SELECT (%(characters)s::int[])[1 + i %% %(count)s], %(location_id)s,
+                      'Сообщение ' || i || ': ' || repeat('странник заказывает эль ', 3),
+                      LOCALTIMESTAMP - (%(messages)s - i) * %(months)s * INTERVAL '1 month' / %(messages)s
+               FROM generate_series(1, %(messages)s) i''',
+            {'characters': character_ids, 'count': len(character_ids), 'location_id': location_id,
+             'messages': messages, 'months': months}
+        )
+        cur.execute(
+            '''INSERT INTO posts (character_id, location_id, content, created_at)
+               SELECT (%(characters)s::int[])[1 + i %% %(count)s], %(location_id)s,
+                      'Пост ' || i || ': ' || repeat('в таверне было шумно ', 10),
+                      LOCALTIMESTAMP - (%(posts)s - i) * INTERVAL '1 minute'
+               FROM generate_series(1, %(posts)s) i''',
+            {'characters': character_ids, 'count': len(character_ids), 'location_id': location_id, 'posts': posts}
+        )
+        cur.execute(
+            '''UPDATE locations
+               SET (message_count, last_message_at) = (
+                   SELECT COUNT(*), MAX(created_at) FROM messages WHERE location_id = %(location_id)s
+               )
+               WHERE id = %(location_id)s''',
+            {'location_id': location_id}
+        )
+        # Как tools/message_partitions.py по расписанию: прошедшие месяцы получают окончательные диапазоны id
+        cur.execute('SELECT record_message_partition_ids()')
+    conn.commit()
+    return location_id
+
+
+# Отпечаток содержимого без id: после импорта id новые, а текст, время, лайки и авторы те же
+FINGERPRINT_QUERIES = {
+    'characters': '''
+        SELECT COUNT(*), md5(COALESCE(string_agg(concat_ws('|', name, avatar, race, class, description, created_at),
+                                                 E'\\n' ORDER BY name, created_at), ''))
+        FROM characters
+        WHERE id IN (SELECT character_id FROM messages WHERE location_id = %(location_id)s
+                     UNION SELECT character_id FROM posts WHERE location_id = %(location_id)s)
+    ''',
+    'posts': '''
+        SELECT COUNT(*), md5(COALESCE(string_agg(concat_ws('|', c.name, p.content, p.created_at,
+                                                           p.likes + COALESCE(s.likes, 0)), E'\\n' ORDER BY p.id), ''))
+        FROM posts p
+        JOIN characters c ON c.id = p.character_id
+        LEFT JOIN (SELECT post_id, SUM(likes) AS likes FROM post_like_shards GROUP BY post_id) s ON s.post_id = p.id
+        WHERE p.location_id = %(location_id)s
+    ''',
+    'messages': '''
+        SELECT COUNT(*), md5(COALESCE(string_agg(concat_ws('|', c.name, m.content, m.created_at), E'\\n' ORDER BY m.id), ''))
+        FROM messages m
+        JOIN characters c ON c.id = m.character_id
+        WHERE m.location_id = %(location_id)s
+    ''',
+    # Чтение с курсорами видит весь чат: границы по id не должны отсекать месяцы, куда импорт вписал новые id.
+    # Курсоры - первое сообщение каждого месяца и края: в импортированной копии id не растут от месяца к месяцу
+    'cursors': '''
+        WITH pivots AS (
+            SELECT 0 AS id
+            UNION SELECT MIN(id) FROM messages WHERE location_id = %(location_id)s GROUP BY date_trunc('month', created_at)
+            UNION SELECT 2147483647
+        )
+        SELECT
+            array_agg((SELECT COUNT(*) FROM messages
+                       WHERE location_id = %(location_id)s AND id > p.id
+                         AND created_at >= (SELECT message_id_floor(%(location_id)s, p.id))) ORDER BY p.id),
+            array_agg((SELECT COUNT(*) FROM messages
+                       WHERE location_id = %(location_id)s AND id < p.id
+                         AND created_at < (SELECT message_id_ceiling(%(location_id)s, p.id))) ORDER BY p.id)
+        FROM pivots p
+    ''',
+    'counters': "SELECT message_count, COALESCE(last_message_at::text, '') FROM locations WHERE id = %(location_id)s",
+}
+
+
+# Опрос исходного чата с его последнего id: импорт вписал в старые месяцы id больше этого, но граница
+# не должна уйти туда - месяцы старше незакрытых (текущий и вчерашний) отсекаются
+POLL_FLOOR_QUERY = '''
+    SELECT message_id_floor(%(location_id)s, MAX(id)) >= date_trunc('month', LOCALTIMESTAMP - INTERVAL '1 day')
+    FROM messages
+    WHERE location_id = %(location_id)s
+'''
+
+
+def fingerprint(conn, location_id: int) -> Dict[str, List[Any]]:
+    result = {}
+    with conn.cursor() as cur:
+        for name, query in FINGERPRINT_QUERIES.items():
+            cur.execute(query, {'location_id': location_id})
+            result[name] = list(cur.fetchone())
+    conn.rollback()
+    return result
+
+
+def verify_round_trip(source_id: int, imported_id: int) -> Dict[str, Any]:
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        source, imported = fingerprint(conn, source_id), fingerprint(conn, imported_id)
+        with conn.cursor() as cur:
+            cur.execute(POLL_FLOOR_QUERY, {'location_id': source_id})
+            source_poll_pruned = cur.fetchone()[0]
+    finally:
+        conn.close()
+    mismatched = [name for name in FINGERPRINT_QUERIES if source[name] != imported[name]]
+    return {
+        'phase': 'verify',
+        'source_location_id': source_id,
+        'location_id': imported_id,
+        'rows': {name: source[name][0] for name in FINGERPRINT_QUERIES},
+        'mismatched': mismatched,
+        'source_poll_pruned': source_poll_pruned,
+    }
+
+
+def run_phase(phase: str, location_id: int, path: str, results: Any) -> None:
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    try:
+        if phase == 'export':
+            result = export_location(conn, location_id, path)
+        else:
+            result = import_snapshot(conn, path)
+    except Exception as e:
+        # Родитель ждёт ответа из очереди - ошибка тоже ответ
+        results.put({'phase': phase, 'error': f'{type(e).__name__}: {e}'})
+        return
+    finally:
+        conn.close()
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put({'phase': phase, **result, 'peak_rss_delta_mb': round((rss_after - rss_before) / 1024, 1)})
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Measure snapshot export and import throughput')
+    parser.add_argument('--messages', type=int, default=1000000)
+    parser.add_argument('--posts', type=int, default=20000)
+    parser.add_argument('--characters', type=int, default=50)
+    parser.add_argument('--months', type=int, default=3, help='spread the seeded chat over this many past months')
+    parser.add_argument('--location-id', type=int, help='export this location instead of seeding a new one')
+    parser.add_argument('--output', default='snapshot_bench.ndjson.gz')
+    args = parser.parse_args()
+
+    location_id = args.location_id
+    report: List[Dict[str, Any]] = []
+    if location_id is None:
+        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        started = time.perf_counter()
+        location_id = seed_location(conn, args.messages, args.posts, args.characters, args.months)
+        conn.close()
+        report.append({'phase': 'seed', 'location_id': location_id, 'seconds': round(time.perf_counter() - started, 3)})
+
+    # Каждая фаза в отдельном процессе: ru_maxrss - максимум за всю жизнь процесса
+    context = multiprocessing.get_context('spawn')
+    for phase in ('export', 'import'):
+        results = context.Queue()
+        process = context.Process(target=run_phase, args=(phase, location_id, args.output, results))
+        process.start()
+        report.append(results.get())
+        process.join()
+        if 'error' in report[-1]:
+            break
+    else:
+        report.append(verify_round_trip(location_id, report[-1]['location_id']))
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    failed = 'error' in report[-1] or report[-1].get('mismatched') or report[-1].get('source_poll_pruned') is False
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
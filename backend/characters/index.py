@@ -1,18 +1,27 @@
 '''
 Business: API для управления персонажами - создание, получение списка, получение по ID
-Args: event с httpMethod, body, queryStringParameters; context с request_id
-Returns: HTTP response с данными персонажей в JSON
+Args: event с httpMethod, body, queryStringParameters (id, user_id, fields - поля через запятую, format=compact для списка); context с request_id
+Returns: HTTP response с данными персонажей в JSON, большие ответы сжаты по Accept-Encoding
 '''
 
 import json
 import os
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import sys
 from typing import Dict, Any
 
-def get_db_connection():
-    return psycopg2.connect(os.environ['DATABASE_URL'])
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
 
+from common.db import get_db_connection, get_read_connection, release_db_connection, prewarm, dict_cursor
+from common.http import cache_control, compress_response, make_etag, etag_matches, not_modified, table_version
+from common.instrument import instrumented, record_error
+from common.lookups import get_characters, get_cached_character, prime_character
+from common.projection import CHARACTER_FIELDS, parse_fields, select_list, wants_compact
+from common.replicas import pin_primary
+from common.serialize import encode_rows, query_json_array
+
+prewarm()
+
+@instrumented('characters')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
@@ -22,7 +31,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
@@ -31,34 +40,68 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     headers = {
         'Content-Type': 'application/json',
-        'Access-Control-Allow-Origin': '*'
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Expose-Headers': 'ETag',
+        'Cache-Control': cache_control(method)
     }
     
+    query_params = event.get('queryStringParameters') or {}
+    fields = None
+    compact = False
+    if method == 'GET':
+        try:
+            fields = parse_fields(query_params, CHARACTER_FIELDS)
+            compact = wants_compact(query_params)
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': str(e)}),
+                'isBase64Encoded': False
+            }
+    
+    if method == 'GET' and str(query_params.get('id') or '').isdigit():
+        cached_character = get_cached_character(query_params['id'])
+        if cached_character:
+            body = json.dumps({field: cached_character.get(field) for field in fields} if fields else cached_character)
+            etag = make_etag(body)
+            if etag_matches(event, etag):
+                return not_modified(headers, etag)
+            return compress_response(event, {
+                'statusCode': 200,
+                'headers': {**headers, 'ETag': etag},
+                'body': body,
+                'isBase64Encoded': False
+            })
+    
+    if method == 'POST':
+        pin_primary(event)
+    
+    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
+        conn = get_read_connection(event) if method == 'GET' else get_db_connection()
+        cur = dict_cursor(conn)
         
         if method == 'GET':
-            query_params = event.get('queryStringParameters') or {}
             user_id = query_params.get('user_id')
             character_id = query_params.get('id')
             
             if character_id:
-                cur.execute(
-                    'SELECT * FROM characters WHERE id = %s',
-                    (character_id,)
-                )
-                character = cur.fetchone()
+                character = get_characters(conn, [character_id]).get(int(character_id))
                 cur.close()
-                conn.close()
+                release_db_connection(conn)
                 
                 if character:
-                    return {
+                    body = json.dumps({field: character.get(field) for field in fields} if fields else character)
+                    etag = make_etag(body)
+                    if etag_matches(event, etag):
+                        return not_modified(headers, etag)
+                    return compress_response(event, {
                         'statusCode': 200,
-                        'headers': headers,
-                        'body': json.dumps(dict(character)),
+                        'headers': {**headers, 'ETag': etag},
+                        'body': body,
                         'isBase64Encoded': False
-                    }
+                    })
                 else:
                     return {
                         'statusCode': 404,
@@ -67,24 +110,32 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'isBase64Encoded': False
                     }
             
+            etag = make_etag('characters', table_version(cur, 'characters'), user_id, fields, compact)
+            cur.close()
+            
+            if etag_matches(event, etag):
+                release_db_connection(conn)
+                return not_modified(headers, etag)
+            
+            columns = select_list(fields, '', CHARACTER_FIELDS)
             if user_id:
+                cur = conn.cursor()
                 cur.execute(
-                    'SELECT * FROM characters WHERE user_id = %s ORDER BY created_at DESC',
+                    f'SELECT {columns} FROM characters WHERE user_id = %s ORDER BY created_at DESC',
                     (user_id,)
                 )
+                body = encode_rows([column.name for column in cur.description], cur.fetchall(), compact)
+                cur.close()
             else:
-                cur.execute('SELECT * FROM characters ORDER BY created_at DESC')
-            
-            characters = cur.fetchall()
-            cur.close()
-            conn.close()
+                body = query_json_array(conn, f'SELECT {columns} FROM characters ORDER BY created_at DESC', compact=compact)
+            release_db_connection(conn)
             
-            return {
+            return compress_response(event, {
                 'statusCode': 200,
-                'headers': headers,
-                'body': json.dumps([dict(char) for char in characters], default=str),
+                'headers': {**headers, 'ETag': etag},
+                'body': body,
                 'isBase64Encoded': False
-            }
+            })
         
         elif method == 'POST':
             body_data = json.loads(event.get('body', '{}'))
@@ -97,7 +148,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             
             if not all([user_id, name, race, char_class, description]):
                 cur.close()
-                conn.close()
+                release_db_connection(conn)
                 return {
                     'statusCode': 400,
                     'headers': headers,
@@ -113,7 +164,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             new_character = cur.fetchone()
             conn.commit()
             cur.close()
-            conn.close()
+            release_db_connection(conn)
+            prime_character(new_character)
             
             return {
                 'statusCode': 201,
@@ -124,7 +176,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         else:
             cur.close()
-            conn.close()
+            release_db_connection(conn)
             return {
                 'statusCode': 405,
                 'headers': headers,
@@ -133,6 +185,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             }
     
     except Exception as e:
+        record_error(e)
+        release_db_connection(conn)
         return {
             'statusCode': 500,
             'headers': headers,
@@ -0,0 +1,3 @@
+'''
+Business: Общий рантайм backend-функций - пул соединений и вспомогательные модули
+'''
@@ -0,0 +1,214 @@
+'''
+Business: Асинхронный режим функций - пул psycopg 3 на event loop и синхронные обёртки для платформы
+Args: DATABASE_URL, DATABASE_READ_URLS, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT и DB_REPLICA_TIMEOUT (на каждый event loop) из окружения
+Returns: async_db_connection() и async_read_connection(event) с dict-строками, sync_handler() - handler(event, context) поверх async_handler, prewarm(), close_async_pools()
+
+Независимые запросы одного handler идут конвейером (conn.pipeline()) - один сетевой круг вместо
+нескольких, а ожидание базы не держит поток: один воркер обслуживает много запросов сразу.
+Драйвер импортируется при первом подключении, как и в common.db
+'''
+
+import asyncio
+import atexit
+import concurrent.futures
+import contextvars
+import functools
+import os
+import threading
+from contextlib import asynccontextmanager
+from typing import Dict, Any, AsyncIterator, Awaitable, Callable, Optional, Tuple
+
+from common.db import DEFAULT_MAX_SIZE, DEFAULT_REPLICA_TIMEOUT, DEFAULT_TIMEOUT
+from common.instrument import instrumented_async_cursor_class, timed
+from common.replicas import get_replica_set, is_pinned
+
+AsyncHandler = Callable[[Dict[str, Any], Any], Awaitable[Dict[str, Any]]]
+
+# Пул привязан к loop, в котором открыт: у фонового loop обёрток и у ASGI-сервера свои пулы
+_pools: Dict[Tuple[asyncio.AbstractEventLoop, str], 'asyncio.Task[Any]'] = {}
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+SHUTDOWN_TIMEOUT = 5.0
+_loop_lock = threading.Lock()
+
+
+async def _open_pool(dsn: str, timeout: float) -> Any:
+    from psycopg.rows import dict_row
+    from psycopg_pool import AsyncConnectionPool
+
+    pool = AsyncConnectionPool(
+        dsn,
+        min_size=1,
+        max_size=int(os.environ.get('DB_POOL_MAX_SIZE', DEFAULT_MAX_SIZE)),
+        timeout=timeout,
+        reset=_reset_connection,
+        kwargs={'row_factory': dict_row, 'cursor_factory': instrumented_async_cursor_class()},
+        open=False,
+    )
+    await pool.open()
+    return pool
+
+
+async def get_async_pool(dsn: Optional[str] = None) -> Any:
+    '''Без dsn - пул primary; реплики получают свои пулы с коротким DB_REPLICA_TIMEOUT'''
+    loop = asyncio.get_running_loop()
+    if dsn is None:
+        dsn, timeout = os.environ['DATABASE_URL'], float(os.environ.get('DB_POOL_TIMEOUT', DEFAULT_TIMEOUT))
+    else:
+        timeout = float(os.environ.get('DB_REPLICA_TIMEOUT', DEFAULT_REPLICA_TIMEOUT))
+    task = _pools.get((loop, dsn))
+    if task is None or (task.done() and (task.cancelled() or task.exception() is not None)):
+        # Задача, а не пул: параллельные первые запросы ждут одно открытие, неудачное - повторяется
+        task = _pools[(loop, dsn)] = loop.create_task(_open_pool(dsn, timeout))
+    return await task
+
+
+async def _reset_connection(conn: Any) -> None:
+    '''Сброс пула при возврате: соединение после autocommit-чтения снова транзакционное'''
+    if conn.autocommit:
+        await conn.set_autocommit(False)
+
+
+@asynccontextmanager
+async def _checked_out(pool: Any, conn: Any, autocommit: bool) -> AsyncIterator[Any]:
+    '''
+    Соединение уходит в пул без открытой транзакции, иначе psycopg_pool сам откатывает её лишним
+    сетевым кругом и пишет предупреждение. Чтение идёт в autocommit - без BEGIN и ROLLBACK;
+    запись коммитит сама, а незакоммиченное при выходе коммитится, при ошибке - откатывается
+    '''
+    try:
+        if autocommit:
+            await conn.set_autocommit(True)
+        # Выход из async with у соединения пула - commit или rollback, без закрытия
+        async with conn:
+            yield conn
+    finally:
+        await pool.putconn(conn)
+
+
+@asynccontextmanager
+async def async_db_connection(autocommit: bool = False) -> AsyncIterator[Any]:
+    '''Соединение primary; autocommit=True - для чтений, которым не нужна общая транзакция'''
+    pool = await get_async_pool()
+    with timed('connect_ms'):
+        conn = await pool.getconn()
+    async with _checked_out(pool, conn, autocommit):
+        yield conn
+
+
+def _unreachable(pool: Any) -> bool:
+    '''Пул psycopg_pool подключается в фоне: таймаут без единого соединения - реплика недоступна, а не занята'''
+    return pool.get_stats().get('pool_size', 0) == 0
+
+
+async def _acquire_read(event: Optional[Dict[str, Any]]) -> Tuple[Any, Any]:
+    replicas = get_replica_set()
+    if replicas is not None and is_pinned(event):
+        replicas.count('pinned_reads')
+    elif replicas is not None:
+        import psycopg
+        from psycopg_pool import PoolTimeout
+        for dsn in replicas.candidates():
+            pool = None
+            try:
+                pool = await get_async_pool(dsn)
+                return pool, await pool.getconn()
+            except psycopg.Error:
+                replicas.mark_down(dsn)
+            except PoolTimeout:
+                # Как в common.db: занятая реплика остаётся в круге, выпадает только недоступная
+                if pool is None or _unreachable(pool):
+                    replicas.mark_down(dsn)
+        replicas.count('primary_fallbacks')
+    pool = await get_async_pool()
+    return pool, await pool.getconn()
+
+
+@asynccontextmanager
+async def async_read_connection(event: Optional[Dict[str, Any]] = None) -> AsyncIterator[Any]:
+    '''
+    Как common.db.get_read_connection(): реплика по кругу, primary при привязке после POST или отказе
+    реплик. Соединение в autocommit: каждый запрос видит свой снимок, общей транзакции нет
+    '''
+    with timed('connect_ms'):
+        pool, conn = await _acquire_read(event)
+    async with _checked_out(pool, conn, True):
+        yield conn
+
+
+async def close_async_pools() -> None:
+    '''Закрывает пулы текущего loop: без этого их фоновые задачи обрываются при выходе процесса'''
+    loop = asyncio.get_running_loop()
+    for key in [key for key in _pools if key[0] is loop]:
+        task = _pools.pop(key)
+        if task.done() and not task.cancelled() and task.exception() is None:
+            await task.result().close()
+        elif not task.done():
+            task.cancel()
+
+
+def _stop_background_loop() -> None:
+    loop = _loop
+    if loop is None or not loop.is_running():
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(close_async_pools(), loop).result(SHUTDOWN_TIMEOUT)
+    except Exception:
+        # Процесс всё равно завершается - закрытие пулов не должно мешать выходу
+        pass
+    loop.call_soon_threadsafe(loop.stop)
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='async-handlers', daemon=True).start()
+                atexit.register(_stop_background_loop)
+                _loop = loop
+    return _loop
+
+
+def run_sync(function: Callable[..., Awaitable[Any]], *args: Any) -> Any:
+    '''
+    Выполняет корутину в долгоживущем фоновом loop: пул переживает тёплые вызовы, как в
+    common.db. Контекст вызывающего потока копируется в задачу - слушатели instrument
+    видят свой запрос
+    '''
+    loop = _background_loop()
+    context = contextvars.copy_context()
+    result: 'concurrent.futures.Future[Any]' = concurrent.futures.Future()
+
+    def done(task: 'asyncio.Task[Any]') -> None:
+        if task.cancelled():
+            result.cancel()
+        elif task.exception() is not None:
+            result.set_exception(task.exception())
+        else:
+            result.set_result(task.result())
+
+    def start() -> None:
+        context.run(loop.create_task, function(*args)).add_done_callback(done)
+
+    loop.call_soon_threadsafe(start)
+    return result.result()
+
+
+def sync_handler(async_handler: AsyncHandler) -> Callable[[Dict[str, Any], Any], Dict[str, Any]]:
+    @functools.wraps(async_handler)
+    def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        return run_sync(async_handler, event, context)
+    return handler
+
+
+def prewarm() -> None:
+    '''DB_PREWARM для async-функций: открывает пул фонового loop при загрузке модуля'''
+    if int(os.environ.get('DB_PREWARM', 0)) <= 0 or 'DATABASE_URL' not in os.environ:
+        return
+    try:
+        run_sync(get_async_pool)
+    except Exception:
+        # Первый запрос откроет пул заново и вернёт понятную ошибку
+        pass
@@ -0,0 +1,89 @@
+'''
+Business: Пакетная вставка сообщений и постов - проверка всех элементов до вставки и поэлементные результаты
+Args: body запроса вида {"items": [{character_id, location_id, content}, ...]}, BATCH_MAX_ITEMS из окружения
+Returns: валидные строки для одного execute_values и итоговый статус с results по каждому элементу; parse_batch() / filter_known() для async-обработчиков
+'''
+
+import os
+from typing import Dict, Any, List, Set, Tuple
+
+MAX_BATCH_SIZE = int(os.environ.get('BATCH_MAX_ITEMS', 100))
+
+
+def _to_id(value: Any) -> int:
+    if isinstance(value, bool):
+        raise ValueError
+    result = int(value)
+    if result < 1:
+        raise ValueError
+    return result
+
+
+def parse_batch(items: List[Any]) -> Tuple[List[Tuple[int, Tuple[int, int, str]]], Dict[int, str]]:
+    '''Проверки без базы: (индекс, значения) разобранных элементов и ошибки по индексам'''
+    parsed: List[Tuple[int, Tuple[int, int, str]]] = []
+    errors: Dict[int, str] = {}
+
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not all([item.get('character_id'), item.get('location_id'), item.get('content')]):
+            errors[index] = 'Missing required fields'
+            continue
+        try:
+            character_id = _to_id(item['character_id'])
+            location_id = _to_id(item['location_id'])
+        except (TypeError, ValueError):
+            errors[index] = 'character_id and location_id must be positive integers'
+            continue
+        if not isinstance(item['content'], str):
+            errors[index] = 'content must be a string'
+            continue
+        parsed.append((index, (character_id, location_id, item['content'])))
+    return parsed, errors
+
+
+def referenced_ids(parsed: List[Tuple[int, Tuple[int, int, str]]]) -> Tuple[List[int], List[int]]:
+    return list({values[0] for _, values in parsed}), list({values[1] for _, values in parsed})
+
+
+def filter_known(parsed: List[Tuple[int, Tuple[int, int, str]]], errors: Dict[int, str],
+                 known_characters: Set[int], known_locations: Set[int]) -> List[Tuple[int, Tuple[int, int, str]]]:
+    valid = []
+    for index, values in parsed:
+        if values[0] not in known_characters:
+            errors[index] = 'Character not found'
+        elif values[1] not in known_locations:
+            errors[index] = 'Location not found'
+        else:
+            valid.append((index, values))
+    return valid
+
+
+def validate_batch(cur, items: List[Any]) -> Tuple[List[Tuple[int, Tuple[int, int, str]]], Dict[int, str]]:
+    '''Возвращает (индекс, значения) валидных элементов и ошибки по индексам; ссылки проверяются двумя запросами на весь пакет'''
+    parsed, errors = parse_batch(items)
+    if not parsed:
+        return parsed, errors
+
+    character_ids, location_ids = referenced_ids(parsed)
+    cur.execute('SELECT id FROM characters WHERE id = ANY(%s)', (character_ids,))
+    known_characters = {row['id'] for row in cur.fetchall()}
+    cur.execute('SELECT id FROM locations WHERE id = ANY(%s)', (location_ids,))
+    known_locations = {row['id'] for row in cur.fetchall()}
+    return filter_known(parsed, errors, known_characters, known_locations), errors
+
+
+def batch_response_body(size: int, valid: List[Tuple[int, Any]], rows: List[Dict[str, Any]], errors: Dict[int, str]) -> Tuple[int, Dict[str, Any]]:
+    '''rows идут в порядке вставки, то есть в порядке valid'''
+    results: List[Dict[str, Any]] = [{} for _ in range(size)]
+    for (index, _), row in zip(valid, rows):
+        results[index] = {'index': index, 'status': 201, 'item': dict(row)}
+    for index, error in errors.items():
+        results[index] = {'index': index, 'status': 400, 'error': error}
+
+    if not errors:
+        status_code = 201
+    elif rows:
+        status_code = 207
+    else:
+        status_code = 400
+    return status_code, {'created': len(rows), 'failed': len(errors), 'results': results}
@@ -0,0 +1,129 @@
+'''
+Business: Внутрипроцессный кэш с TTL и вытеснением по LRU для тёплых вызовов функций
+Args: max_size и ttl (секунды) при создании кэша
+Returns: TTLCache с get/set/invalidate и счётчиками через stats(); CacheBackend для подключаемого общего кэша
+'''
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Hashable, Iterable, Optional, Tuple
+
+
+class TTLCache:
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items: 'OrderedDict[Hashable, Tuple[Any, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0,
+        }
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self._stats['misses'] += 1
+                return None
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._items[key]
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._items.move_to_end(key)
+            self._stats['hits'] += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        '''ttl может быть короче стандартного, например до истечения сессии'''
+        lifetime = self.ttl if ttl is None else min(ttl, self.ttl)
+        if lifetime <= 0:
+            return
+        with self._lock:
+            self._items[key] = (value, time.monotonic() + lifetime)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            if self._items.pop(key, None) is not None:
+                self._stats['invalidations'] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            result: Dict[str, Any] = dict(self._stats)
+            result['size'] = len(self._items)
+            result['max_size'] = self.max_size
+        lookups = result['hits'] + result['misses']
+        result['hit_rate'] = result['hits'] / lookups if lookups else 0.0
+        return result
+
+
+class CacheBackend:
+    '''
+    Интерфейс подключаемого кэша. LocalCacheBackend - внутрипроцессная замена общего
+    кэша; общий (Redis, Memcached) регистрируется через register_backend и должен
+    хранить JSON-совместимые значения
+    '''
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def set_many(self, items: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class LocalCacheBackend(CacheBackend):
+    def __init__(self, max_size: int, ttl: float):
+        self._cache = TTLCache(max_size=max_size, ttl=ttl)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        found = {}
+        for key in keys:
+            value = self._cache.get(key)
+            if value is not None:
+                found[key] = value
+        return found
+
+    def set_many(self, items: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        for key, value in items.items():
+            self._cache.set(key, value, ttl=ttl)
+
+    def delete(self, key: str) -> None:
+        self._cache.invalidate(key)
+
+    def stats(self) -> Dict[str, Any]:
+        return self._cache.stats()
+
+
+_backend_factories: Dict[str, Callable[[int, float], CacheBackend]] = {
+    'local': LocalCacheBackend,
+}
+
+
+def register_backend(name: str, factory: Callable[[int, float], CacheBackend]) -> None:
+    _backend_factories[name] = factory
+
+
+def create_backend(name: str, max_size: int, ttl: float) -> CacheBackend:
+    if name not in _backend_factories:
+        raise ValueError(f'Unknown cache backend: {name}')
+    return _backend_factories[name](max_size, ttl)
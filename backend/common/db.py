@@ -0,0 +1,330 @@
+'''
+Business: Пул соединений с Postgres, переживающий тёплые вызовы функций; отдельные пулы для реплик чтения
+Args: DATABASE_URL, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT, DB_POOL_HEALTHCHECK_INTERVAL, DB_PREWARM, DATABASE_READ_URLS, DB_REPLICA_TIMEOUT из окружения
+Returns: get_db_connection() / get_read_connection(event) / release_db_connection(), dict_cursor(), prewarm() и метрики пула через pool_stats()
+
+psycopg2 импортируется при первом обращении к базе, а не при загрузке модуля: холодный старт
+функции и OPTIONS-ответы не платят за загрузку драйвера
+'''
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple, Iterator
+
+from common.instrument import instrumented_connection_class, timed
+from common.replicas import get_replica_set, is_pinned, replica_stats
+
+DEFAULT_MAX_SIZE = 5
+DEFAULT_TIMEOUT = 10.0
+# Занятую реплику не ждём долго: primary рядом и примет чтение
+DEFAULT_REPLICA_TIMEOUT = 1.0
+DEFAULT_HEALTHCHECK_INTERVAL = 30.0
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, dsn: str, max_size: int, timeout: float, healthcheck_interval: float):
+        self.dsn = dsn
+        self.max_size = max_size
+        self.timeout = timeout
+        self.healthcheck_interval = healthcheck_interval
+        # Подкласс psycopg2 connection: по умолчанию считает запросы, время и строки текущего запроса
+        self.connection_factory: Optional[Any] = instrumented_connection_class()
+        self._idle: List[Tuple[Any, float]] = []
+        self._in_use: Dict[int, Any] = {}
+        self._cond = threading.Condition(threading.Lock())
+        self._stats: Dict[str, float] = {
+            'hits': 0,
+            'misses': 0,
+            'waits': 0,
+            'wait_time': 0.0,
+            'timeouts': 0,
+            'discarded': 0,
+            'health_failures': 0,
+        }
+
+    def _size(self) -> int:
+        return len(self._idle) + len(self._in_use)
+
+    def owns(self, conn: Any) -> bool:
+        with self._cond:
+            return id(conn) in self._in_use
+
+    def _is_healthy(self, conn: Any, idle_since: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.healthcheck_interval:
+            return True
+        import psycopg2
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _close_quietly(self, conn: Any) -> None:
+        import psycopg2
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def acquire(self) -> Any:
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        wait_started = 0.0
+
+        while True:
+            idle = None
+            with self._cond:
+                while True:
+                    if self._idle:
+                        # Слот остаётся занятым на время проверки - пул не вырастет сверх max_size
+                        idle = self._idle.pop()
+                        self._in_use[id(idle[0])] = idle[0]
+                        self._record_wait(waited, wait_started)
+                        waited = False
+                        break
+
+                    if self._size() < self.max_size:
+                        self._stats['misses'] += 1
+                        placeholder = object()
+                        self._in_use[id(placeholder)] = placeholder
+                        self._record_wait(waited, wait_started)
+                        break
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        self._record_wait(waited, wait_started)
+                        raise PoolTimeoutError(
+                            f'No free database connection after {self.timeout}s (max_size={self.max_size})'
+                        )
+                    if not waited:
+                        waited = True
+                        wait_started = time.monotonic()
+                        self._stats['waits'] += 1
+                    self._cond.wait(remaining)
+
+            if idle is None:
+                break
+            conn, idle_since = idle
+            # SELECT 1 идёт без блокировки пула: медленная проверка не держит release() и другие acquire()
+            if self._is_healthy(conn, idle_since):
+                with self._cond:
+                    self._stats['hits'] += 1
+                return conn
+            self._close_quietly(conn)
+            with self._cond:
+                del self._in_use[id(conn)]
+                self._stats['health_failures'] += 1
+                self._stats['discarded'] += 1
+                self._cond.notify()
+
+        import psycopg2
+        try:
+            conn = psycopg2.connect(self.dsn, connection_factory=self.connection_factory)
+        except Exception:
+            with self._cond:
+                del self._in_use[id(placeholder)]
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            del self._in_use[id(placeholder)]
+            self._in_use[id(conn)] = conn
+        return conn
+
+    def _record_wait(self, waited: bool, wait_started: float) -> None:
+        if waited:
+            self._stats['wait_time'] += time.monotonic() - wait_started
+
+    def release(self, conn: Any, discard: bool = False) -> None:
+        with self._cond:
+            if self._in_use.pop(id(conn), None) is None:
+                return
+
+        if not discard and not conn.closed:
+            import psycopg2
+            import psycopg2.extensions
+            status = conn.info.transaction_status
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                self._close_quietly(conn)
+            elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    discard = True
+
+        broken = bool(conn.closed)
+        with self._cond:
+            if discard or broken:
+                self._stats['discarded'] += 1
+                self._close_quietly(conn)
+                if broken:
+                    # Сервер мог перезапуститься: перед выдачей проверяем все простаивающие соединения
+                    self._idle = [(idle_conn, 0.0) for idle_conn, _ in self._idle]
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def reset(self) -> None:
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            result: Dict[str, Any] = dict(self._stats)
+            result['idle'] = len(self._idle)
+            result['in_use'] = len(self._in_use)
+            result['max_size'] = self.max_size
+        requests = result['hits'] + result['misses']
+        result['hit_rate'] = result['hits'] / requests if requests else 0.0
+        return result
+
+
+_pool: Optional[ConnectionPool] = None
+_read_pools: Dict[str, ConnectionPool] = {}
+_pool_lock = threading.Lock()
+
+
+def _new_pool(dsn: str, timeout: float) -> ConnectionPool:
+    return ConnectionPool(
+        dsn=dsn,
+        max_size=int(os.environ.get('DB_POOL_MAX_SIZE', DEFAULT_MAX_SIZE)),
+        timeout=timeout,
+        healthcheck_interval=float(
+            os.environ.get('DB_POOL_HEALTHCHECK_INTERVAL', DEFAULT_HEALTHCHECK_INTERVAL)
+        ),
+    )
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = _new_pool(os.environ['DATABASE_URL'], float(os.environ.get('DB_POOL_TIMEOUT', DEFAULT_TIMEOUT)))
+    return _pool
+
+
+def get_read_pool(dsn: str) -> ConnectionPool:
+    pool = _read_pools.get(dsn)
+    if pool is None:
+        with _pool_lock:
+            pool = _read_pools.get(dsn)
+            if pool is None:
+                pool = _read_pools[dsn] = _new_pool(
+                    dsn, float(os.environ.get('DB_REPLICA_TIMEOUT', DEFAULT_REPLICA_TIMEOUT))
+                )
+    return pool
+
+
+def get_db_connection() -> Any:
+    with timed('connect_ms'):
+        return get_pool().acquire()
+
+
+def get_read_connection(event: Optional[Dict[str, Any]] = None) -> Any:
+    '''
+    Соединение для GET: реплика по кругу, primary - если реплик нет, клиент недавно писал
+    (is_pinned) или ни одна реплика не отвечает. Упавшая реплика выпадает из круга на
+    DB_REPLICA_RETRY_SECONDS; возвращать соединение так же через release_db_connection()
+    '''
+    replicas = get_replica_set()
+    if replicas is None:
+        return get_db_connection()
+    if is_pinned(event):
+        replicas.count('pinned_reads')
+        return get_db_connection()
+
+    import psycopg2
+    with timed('connect_ms'):
+        for dsn in replicas.candidates():
+            try:
+                return get_read_pool(dsn).acquire()
+            except psycopg2.Error:
+                replicas.mark_down(dsn)
+            except PoolTimeoutError:
+                # Реплика жива, но занята - следующий запрос снова попробует её
+                pass
+        replicas.count('primary_fallbacks')
+        return get_pool().acquire()
+
+
+def release_db_connection(conn: Any, discard: bool = False) -> None:
+    '''Возвращает соединение в его пул; повторный вызов для того же соединения ничего не делает'''
+    if conn is None:
+        return
+    for pool in [_pool, *_read_pools.values()]:
+        if pool is not None and pool.owns(conn):
+            pool.release(conn, discard=discard)
+            return
+
+
+def dict_cursor(conn: Any) -> Any:
+    from psycopg2.extras import RealDictCursor
+    return conn.cursor(cursor_factory=RealDictCursor)
+
+
+@contextmanager
+def db_connection() -> Iterator[Any]:
+    import psycopg2
+    conn = get_db_connection()
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        release_db_connection(conn, discard=True)
+        raise
+    finally:
+        release_db_connection(conn)
+
+
+def reset_pool() -> None:
+    for pool in [_pool, *_read_pools.values()]:
+        if pool is not None:
+            pool.reset()
+
+
+def pool_stats() -> Dict[str, Any]:
+    if _pool is None:
+        return {}
+    result = get_pool().stats()
+    if _read_pools:
+        # Без URL: в них пароль
+        result['read_pools'] = [pool.stats() for pool in list(_read_pools.values())]
+        result['replicas'] = replica_stats()
+    return result
+
+
+def prewarm() -> None:
+    '''
+    Вызывается при загрузке модуля функции. DB_PREWARM=N открывает до N соединений в фазе
+    инициализации, чтобы первый запрос не ждал подключения; по умолчанию выключено - тогда
+    загрузка модуля не трогает ни драйвер, ни базу
+    '''
+    count = int(os.environ.get('DB_PREWARM', 0))
+    if count <= 0 or 'DATABASE_URL' not in os.environ:
+        return
+    import psycopg2
+    pool = get_pool()
+    connections = []
+    try:
+        for _ in range(min(count, pool.max_size)):
+            connections.append(pool.acquire())
+    except (psycopg2.Error, PoolTimeoutError):
+        # База недоступна при старте - первый запрос подключится сам и вернёт понятную ошибку
+        pass
+    finally:
+        for conn in connections:
+            pool.release(conn)
@@ -0,0 +1,184 @@
+'''
+Business: Персональная лента - подписки на локации и персонажей, fan-out on write в feed_items и чтение одной выборкой по пользователю
+Args: FEED_FANOUT_LIMIT (подписчиков, после которых локация читается при запросе), FEED_BACKFILL_ITEMS, FEED_MAX_ITEMS, FEED_MAX_AGE_DAYS из окружения
+Returns: follow()/unfollow()/list_follows() для подписок, fetch_home_feed() для страницы ленты, trim_feed() для обслуживания
+'''
+
+import os
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+FANOUT_LIMIT = int(os.environ.get('FEED_FANOUT_LIMIT', 5000))
+BACKFILL_ITEMS = int(os.environ.get('FEED_BACKFILL_ITEMS', 50))
+MAX_ITEMS = int(os.environ.get('FEED_MAX_ITEMS', 1000))
+MAX_AGE_DAYS = int(os.environ.get('FEED_MAX_AGE_DAYS', 90))
+
+# Новые посты раскладывает по лентам триггер posts_fan_out (V0011); здесь только подписки и чтение
+TARGETS = {
+    'location': ('location_follows', 'location_id'),
+    'character': ('character_follows', 'character_id'),
+}
+
+FOLLOW_LOCATION_SQL = '''
+    WITH followed AS (
+        INSERT INTO location_follows (user_id, location_id) VALUES (%(user_id)s, %(target_id)s)
+        ON CONFLICT DO NOTHING
+        RETURNING location_id
+    )
+    UPDATE locations
+    SET follower_count = follower_count + 1,
+        fanout_on_read = fanout_on_read OR follower_count + 1 >= %(fanout_limit)s
+    WHERE id IN (SELECT location_id FROM followed)
+    RETURNING fanout_on_read
+'''
+
+UNFOLLOW_LOCATION_SQL = '''
+    WITH unfollowed AS (
+        DELETE FROM location_follows WHERE user_id = %(user_id)s AND location_id = %(target_id)s
+        RETURNING location_id
+    )
+    UPDATE locations
+    SET follower_count = GREATEST(follower_count - 1, 0)
+    WHERE id IN (SELECT location_id FROM unfollowed)
+    RETURNING id
+'''
+
+FOLLOW_CHARACTER_SQL = '''
+    INSERT INTO character_follows (user_id, character_id) VALUES (%(user_id)s, %(target_id)s)
+    ON CONFLICT DO NOTHING
+    RETURNING FALSE AS fanout_on_read
+'''
+
+UNFOLLOW_CHARACTER_SQL = '''
+    DELETE FROM character_follows WHERE user_id = %(user_id)s AND character_id = %(target_id)s
+    RETURNING character_id
+'''
+
+BACKFILL_SQL = '''
+    INSERT INTO feed_items (user_id, created_at, post_id)
+    SELECT %(user_id)s, created_at, id
+    FROM posts
+    WHERE {column} = %(target_id)s
+    ORDER BY created_at DESC, id DESC
+    LIMIT %(backfill)s
+    ON CONFLICT DO NOTHING
+'''
+
+# Пост остаётся в ленте, если он всё ещё приходит через другую подписку
+REMOVE_ITEMS_SQL = {
+    'location': '''
+        DELETE FROM feed_items fi
+        USING posts p
+        WHERE fi.user_id = %(user_id)s AND p.id = fi.post_id AND p.location_id = %(target_id)s
+          AND NOT EXISTS (
+              SELECT 1 FROM character_follows cf
+              WHERE cf.user_id = fi.user_id AND cf.character_id = p.character_id
+          )
+    ''',
+    'character': '''
+        DELETE FROM feed_items fi
+        USING posts p
+        WHERE fi.user_id = %(user_id)s AND p.id = fi.post_id AND p.character_id = %(target_id)s
+          AND NOT EXISTS (
+              SELECT 1 FROM location_follows lf
+              WHERE lf.user_id = fi.user_id AND lf.location_id = p.location_id
+          )
+    ''',
+}
+
+# Материализованная часть - обратный проход по первичному ключу feed_items; популярные локации
+# (fanout_on_read) добавляются при чтении, по limit свежих постов с каждой через индекс (location_id, created_at, id)
+HOME_FEED_SQL = '''
+    SELECT p.*
+    FROM posts p
+    WHERE p.id IN (
+        (SELECT fi.post_id
+         FROM feed_items fi
+         WHERE fi.user_id = %(user_id)s {before_items}
+         ORDER BY fi.created_at DESC, fi.post_id DESC
+         LIMIT %(limit)s)
+        UNION
+        (SELECT recent.id
+         FROM location_follows lf
+         JOIN locations l ON l.id = lf.location_id AND l.fanout_on_read
+         CROSS JOIN LATERAL (
+             SELECT lp.id
+             FROM posts lp
+             WHERE lp.location_id = lf.location_id {before_posts}
+             ORDER BY lp.created_at DESC, lp.id DESC
+             LIMIT %(limit)s
+         ) recent
+         WHERE lf.user_id = %(user_id)s)
+    )
+    ORDER BY p.created_at DESC, p.id DESC
+    LIMIT %(limit)s
+'''
+
+
+def follow(cur, user_id: int, target: str, target_id: int) -> bool:
+    '''Возвращает False, если подписка уже была. Свежие посты цели сразу попадают в ленту'''
+    sql = FOLLOW_LOCATION_SQL if target == 'location' else FOLLOW_CHARACTER_SQL
+    params = {'user_id': user_id, 'target_id': target_id, 'fanout_limit': FANOUT_LIMIT, 'backfill': BACKFILL_ITEMS}
+    cur.execute(sql, params)
+    row = cur.fetchone()
+    if row is None:
+        return False
+    fanout_on_read = row['fanout_on_read'] if isinstance(row, dict) else row[0]
+    if not fanout_on_read:
+        cur.execute(BACKFILL_SQL.format(column=TARGETS[target][1]), params)
+    return True
+
+
+def unfollow(cur, user_id: int, target: str, target_id: int) -> bool:
+    sql = UNFOLLOW_LOCATION_SQL if target == 'location' else UNFOLLOW_CHARACTER_SQL
+    params = {'user_id': user_id, 'target_id': target_id}
+    cur.execute(sql, params)
+    if cur.fetchone() is None:
+        return False
+    cur.execute(REMOVE_ITEMS_SQL[target], params)
+    return True
+
+
+def list_follows(cur, user_id: int) -> Dict[str, List[int]]:
+    follows = {}
+    for target, (table, column) in TARGETS.items():
+        cur.execute(f'SELECT {column} FROM {table} WHERE user_id = %s ORDER BY created_at DESC', (user_id,))
+        follows[f'{target}s'] = [row[column] if isinstance(row, dict) else row[0] for row in cur.fetchall()]
+    return follows
+
+
+def fetch_home_feed(cur, user_id: int, limit: int, before: Optional[Tuple[datetime, int]] = None) -> List[Any]:
+    '''Ожидает limit + 1, как и глобальная лента, чтобы next_cursor() понял, есть ли следующая страница'''
+    params: Dict[str, Any] = {'user_id': user_id, 'limit': limit}
+    before_items = before_posts = ''
+    if before:
+        before_items = 'AND (fi.created_at, fi.post_id) < (%(before_created_at)s, %(before_id)s)'
+        before_posts = 'AND (lp.created_at, lp.id) < (%(before_created_at)s, %(before_id)s)'
+        params.update({'before_created_at': before[0], 'before_id': before[1]})
+    cur.execute(HOME_FEED_SQL.format(before_items=before_items, before_posts=before_posts), params)
+    return cur.fetchall()
+
+
+def trim_feed(cur, max_items: int = MAX_ITEMS, max_age_days: int = MAX_AGE_DAYS) -> Dict[str, int]:
+    '''Старше max_age_days удаляется у всех; сверх max_items - только у тех, у кого лента длиннее'''
+    cur.execute(
+        "DELETE FROM feed_items WHERE created_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 day'",
+        (max_age_days,)
+    )
+    expired = cur.rowcount
+    cur.execute(
+        '''DELETE FROM feed_items fi
+           USING (
+               SELECT user_id, created_at, post_id
+               FROM (
+                   SELECT user_id, created_at, post_id,
+                          ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY created_at DESC, post_id DESC) AS position
+                   FROM feed_items
+                   WHERE user_id IN (SELECT user_id FROM feed_items GROUP BY user_id HAVING COUNT(*) > %s)
+               ) ranked
+               WHERE position > %s
+           ) excess
+           WHERE fi.user_id = excess.user_id AND fi.created_at = excess.created_at AND fi.post_id = excess.post_id''',
+        (max_items, max_items)
+    )
+    return {'expired': expired, 'over_limit': cur.rowcount}
@@ -0,0 +1,119 @@
+'''
+Business: HTTP-условные запросы - дешёвые ETag по версиям таблиц и ответ 304 до основного запроса; сжатие больших ответов
+Args: event с headers (If-None-Match, Accept-Encoding), курсор для чтения table_versions; COMPRESS_MIN_BYTES, GZIP_LEVEL, BROTLI_QUALITY из окружения
+Returns: make_etag() / etag_matches() / not_modified(), заголовки Cache-Control и compress_response()
+'''
+
+import base64
+import gzip
+import hashlib
+import os
+from typing import Dict, Any, Optional, Set
+
+from common.instrument import timed
+
+# GET-ответы можно хранить, но перед использованием нужно перепроверить по ETag
+CACHE_CONTROL_REVALIDATE = 'no-cache'
+CACHE_CONTROL_NO_STORE = 'no-store'
+CACHE_CONTROL_PRIVATE = 'private, no-store'
+
+# Меньше порога сжатие почти ничего не экономит, а заголовки и base64 съедают выигрыш
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', 5))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', 4))
+
+
+def cache_control(method: str) -> str:
+    return CACHE_CONTROL_REVALIDATE if method == 'GET' else CACHE_CONTROL_NO_STORE
+
+
+def request_header(event: Dict[str, Any], name: str) -> Optional[str]:
+    wanted = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == wanted:
+            return value
+    return None
+
+
+def make_etag(*parts: Any) -> str:
+    digest = hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def etag_matches(event: Dict[str, Any], etag: str) -> bool:
+    if_none_match = request_header(event, 'If-None-Match')
+    if not if_none_match:
+        return False
+    candidates = {candidate.strip() for candidate in if_none_match.split(',')}
+    # Сравнение для If-None-Match слабое: W/"x" и "x" считаются одним тегом
+    return '*' in candidates or etag in candidates or etag[2:] in candidates
+
+
+def not_modified(headers: Dict[str, str], etag: str) -> Dict[str, Any]:
+    return {
+        'statusCode': 304,
+        'headers': {**headers, 'ETag': etag},
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+
+def table_version(cur, table_name: str) -> int:
+    '''Версия поднимается statement-триггером в той же транзакции, что и изменение таблицы; это сумма шардов'''
+    cur.execute('SELECT version FROM table_versions WHERE table_name = %s', (table_name,))
+    row = cur.fetchone()
+    if row is None:
+        return 0
+    return row['version'] if isinstance(row, dict) else row[0]
+
+
+
+def accepted_encodings(event: Dict[str, Any]) -> Set[str]:
+    accepted = set()
+    for item in (request_header(event, 'Accept-Encoding') or '').split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q=') and quality[2:].strip() in ('0', '0.0', '0.00', '0.000'):
+            continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def _brotli() -> Optional[Any]:
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def compress_response(event: Dict[str, Any], response: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    br, если клиент его принимает и модуль установлен, иначе gzip. Тело уходит в base64 -
+    так платформа отдаёт бинарные ответы; роутер tools/serve.py декодирует его так же
+    '''
+    body = response.get('body')
+    if not body or response.get('isBase64Encoded'):
+        return response
+    raw = body.encode('utf-8')
+    if len(raw) < COMPRESS_MIN_BYTES:
+        return response
+
+    headers = {**response.get('headers', {}), 'Vary': 'Accept-Encoding'}
+    accepted = accepted_encodings(event)
+    brotli = _brotli() if 'br' in accepted else None
+    with timed('compress_ms'):
+        if brotli is not None:
+            encoding, payload = 'br', brotli.compress(raw, quality=BROTLI_QUALITY)
+        elif 'gzip' in accepted or '*' in accepted:
+            encoding, payload = 'gzip', gzip.compress(raw, compresslevel=GZIP_LEVEL, mtime=0)
+        else:
+            return {**response, 'headers': headers}
+        encoded = base64.b64encode(payload).decode('ascii')
+    return {
+        **response,
+        'headers': {**headers, 'Content-Encoding': encoding},
+        'body': encoded,
+        'isBase64Encoded': True,
+    }
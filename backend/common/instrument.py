@@ -0,0 +1,340 @@
+'''
+Business: Инструментирование запросов - время подключения, каждого SQL, строки, сериализация, сжатие и размер ответа
+Args: SLOW_QUERY_MS (порог медленного запроса, по умолчанию 200), SERVER_TIMING=1 для заголовка Server-Timing, INSTRUMENT_LOG=0 чтобы отключить логи
+Returns: декоратор instrumented() для синхронного и async handler и JSON-строка лога на каждый запрос с тегом context.request_id;
+         watch_cache() добавляет в неё счётчики кэшей процесса
+'''
+
+import contextvars
+import functools
+import inspect
+import json
+import os
+import re
+import sys
+import time
+import traceback
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, Iterator, List, Optional
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 200))
+SERVER_TIMING = os.environ.get('SERVER_TIMING') == '1'
+LOG_ENABLED = os.environ.get('INSTRUMENT_LOG', '1') == '1'
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+MAX_LOGGED_SQL = 4000
+# Строковые литералы в плане - подставленные параметры: токены сессий, хэши паролей
+PLAN_LITERAL = re.compile(r"'(?:[^']|'')*'")
+
+# ContextVar, а не threading.local: в async-режиме один поток обслуживает много запросов сразу
+_request: 'contextvars.ContextVar[Optional[Dict[str, Any]]]' = contextvars.ContextVar('instrument_request', default=None)
+_listeners: List[Callable[[Dict[str, Any]], None]] = []
+_caches: Dict[str, Callable[[], Dict[str, Any]]] = {}
+CACHE_STATS = ('hit_rate', 'hits', 'misses', 'evictions', 'expirations', 'size')
+
+
+def current() -> Optional[Dict[str, Any]]:
+    '''Метрики текущего запроса; None вне instrumented-обработчика, например в tools'''
+    return _request.get()
+
+
+def _new_request(function_name: str, request_id: Optional[str]) -> Dict[str, Any]:
+    return {
+        'function': function_name,
+        'request_id': request_id,
+        'connect_ms': 0.0,
+        'queries': 0,
+        'db_ms': 0.0,
+        'rows': 0,
+        'serialize_ms': 0.0,
+        'compress_ms': 0.0,
+        'slow_queries': [],
+        'error': None,
+    }
+
+
+def add_listener(listener: Callable[[Dict[str, Any]], None]) -> None:
+    '''Получает итоговые метрики каждого запроса - так их собирает нагрузочный стенд'''
+    _listeners.append(listener)
+
+
+def watch_cache(name: str, stats: Callable[[], Dict[str, Any]]) -> None:
+    '''Счётчики кэша процесса (TTLCache.stats) попадают в каждую строку лога и в метрики для слушателей'''
+    _caches[name] = stats
+
+
+def _cache_stats() -> Dict[str, Dict[str, Any]]:
+    result = {}
+    for name, stats in _caches.items():
+        values = stats()
+        result[name] = {key: round(values[key], 3) if key == 'hit_rate' else values[key]
+                        for key in CACHE_STATS if key in values}
+    return result
+
+
+def record(metric: str, value: float) -> None:
+    request = current()
+    if request is not None:
+        request[metric] += value
+
+
+@contextmanager
+def timed(metric: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(metric, (time.perf_counter() - started) * 1000)
+
+
+def record_error(error: BaseException) -> None:
+    request = current()
+    if request is not None:
+        request['error'] = {
+            'type': type(error).__name__,
+            'message': str(error),
+            'traceback': traceback.format_exc(limit=8),
+        }
+
+
+def _statement_text(query: Any, cursor: Any) -> str:
+    '''Текст запроса без значений параметров - в лог не попадают токены и хэши'''
+    if isinstance(query, bytes):
+        return query.decode(errors='replace')
+    if isinstance(query, str):
+        return query
+    return query.as_string(cursor)
+
+
+def _redact_plan(node: Any) -> Any:
+    if isinstance(node, dict):
+        return {key: _redact_plan(value) for key, value in node.items()}
+    if isinstance(node, list):
+        return [_redact_plan(value) for value in node]
+    if isinstance(node, str):
+        return PLAN_LITERAL.sub("'?'", node)
+    return node
+
+
+def _explain(cursor: Any, sql: str) -> Optional[Any]:
+    if not sql.lstrip().upper().startswith(EXPLAINABLE):
+        return None
+    import psycopg2
+    import psycopg2.extensions
+    conn = cursor.connection
+    if conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+        return None
+    # Отдельный некластерный курсор и SAVEPOINT: неудачный EXPLAIN не должен ломать транзакцию handler
+    plain = psycopg2.extensions.cursor(conn)
+    try:
+        if conn.autocommit:
+            plain.execute('EXPLAIN (FORMAT JSON) ' + sql)
+            return plain.fetchone()[0]
+        plain.execute('SAVEPOINT instrument_explain')
+        try:
+            plain.execute('EXPLAIN (FORMAT JSON) ' + sql)
+            plan = plain.fetchone()[0]
+            plain.execute('RELEASE SAVEPOINT instrument_explain')
+            return plan
+        except psycopg2.Error:
+            plain.execute('ROLLBACK TO SAVEPOINT instrument_explain')
+            return None
+    except psycopg2.Error:
+        return None
+    finally:
+        plain.close()
+
+
+class InstrumentedCursorMixin:
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            request = current()
+            if request is not None:
+                request['queries'] += 1
+                request['db_ms'] += elapsed_ms
+                if elapsed_ms >= SLOW_QUERY_MS and self.name is None:
+                    # EXPLAIN нужен запрос с подставленными значениями; в лог - шаблон и план без литералов
+                    bound = self.query.decode(errors='replace') if self.query else _statement_text(query, self)
+                    plan = _explain(self, bound)
+                    request['slow_queries'].append({
+                        'ms': round(elapsed_ms, 2),
+                        'sql': _statement_text(query, self)[:MAX_LOGGED_SQL],
+                        'plan': _redact_plan(plan) if plan is not None else None,
+                    })
+
+    def fetchone(self):
+        return _count_rows(super().fetchone())
+
+    def fetchmany(self, size=None):
+        return _count_rows(super().fetchmany(size) if size is not None else super().fetchmany())
+
+    def fetchall(self):
+        return _count_rows(super().fetchall())
+
+
+def _count_rows(rows: Any) -> Any:
+    request = current()
+    if request is not None and rows is not None:
+        request['rows'] += len(rows) if isinstance(rows, list) else 1
+    return rows
+
+
+_cursor_classes: Dict[type, type] = {}
+
+
+def instrumented_cursor_class(factory: type) -> type:
+    if factory not in _cursor_classes:
+        _cursor_classes[factory] = type(f'Instrumented{factory.__name__}', (InstrumentedCursorMixin, factory), {})
+    return _cursor_classes[factory]
+
+
+_connection_class: Optional[type] = None
+
+
+def instrumented_connection_class() -> type:
+    '''
+    Подкласс psycopg2 connection, который оборачивает любой cursor_factory handler-а
+    (RealDictCursor, именованный и т.д.). Создаётся при первом подключении, чтобы импорт
+    модуля не тянул драйвер
+    '''
+    global _connection_class
+    if _connection_class is None:
+        import psycopg2.extensions
+
+        class InstrumentedConnection(psycopg2.extensions.connection):
+            def cursor(self, *args, **kwargs):
+                factory = kwargs.pop('cursor_factory', None) or self.cursor_factory or psycopg2.extensions.cursor
+                return super().cursor(*args, cursor_factory=instrumented_cursor_class(factory), **kwargs)
+
+        _connection_class = InstrumentedConnection
+    return _connection_class
+
+
+_async_cursor_class: Optional[type] = None
+
+
+def instrumented_async_cursor_class() -> type:
+    '''cursor_factory для соединений psycopg 3 из асинхронного пула'''
+    global _async_cursor_class
+    if _async_cursor_class is None:
+        import psycopg
+
+        class InstrumentedAsyncCursor(psycopg.AsyncCursor):
+            async def execute(self, query, params=None, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await super().execute(query, params, **kwargs)
+                finally:
+                    elapsed_ms = (time.perf_counter() - started) * 1000
+                    request = current()
+                    if request is not None:
+                        request['queries'] += 1
+                        request['db_ms'] += elapsed_ms
+                        if elapsed_ms >= SLOW_QUERY_MS:
+                            # EXPLAIN на соединении в режиме конвейера не выполнить - в лог идёт только текст
+                            request['slow_queries'].append({
+                                'ms': round(elapsed_ms, 2),
+                                'sql': _statement_text(query, self)[:MAX_LOGGED_SQL],
+                                'plan': None,
+                            })
+
+            async def fetchone(self):
+                return _count_rows(await super().fetchone())
+
+            async def fetchmany(self, size=0):
+                return _count_rows(await super().fetchmany(size))
+
+            async def fetchall(self):
+                return _count_rows(await super().fetchall())
+
+        _async_cursor_class = InstrumentedAsyncCursor
+    return _async_cursor_class
+
+
+def _server_timing(request: Dict[str, Any], total_ms: float) -> str:
+    return ', '.join([
+        f'connect;dur={request["connect_ms"]:.1f}',
+        f'db;dur={request["db_ms"]:.1f};desc="{request["queries"]} queries"',
+        f'serialize;dur={request["serialize_ms"]:.1f}',
+        f'compress;dur={request["compress_ms"]:.1f}',
+        f'total;dur={total_ms:.1f}',
+    ])
+
+
+def _emit(line: Dict[str, Any]) -> None:
+    sys.stdout.write(json.dumps(line, default=str, ensure_ascii=False) + '\n')
+    sys.stdout.flush()
+
+
+def _finish(function_name: str, event: Dict[str, Any], request: Dict[str, Any],
+            response: Dict[str, Any], started: float) -> Dict[str, Any]:
+    total_ms = (time.perf_counter() - started) * 1000
+    request['total_ms'] = total_ms
+    request['status'] = response.get('statusCode')
+    if _caches:
+        request['caches'] = _cache_stats()
+    for listener in _listeners:
+        listener(request)
+
+    if SERVER_TIMING:
+        response['headers'] = {
+            **response.get('headers', {}),
+            'Server-Timing': _server_timing(request, total_ms),
+            'Timing-Allow-Origin': '*',
+        }
+    if LOG_ENABLED:
+        line = {
+            'event': 'request',
+            'function': function_name,
+            'request_id': request['request_id'],
+            'method': event.get('httpMethod'),
+            'status': response.get('statusCode'),
+            'total_ms': round(total_ms, 2),
+            'connect_ms': round(request['connect_ms'], 2),
+            'queries': request['queries'],
+            'db_ms': round(request['db_ms'], 2),
+            'rows': request['rows'],
+            'serialize_ms': round(request['serialize_ms'], 2),
+            'compress_ms': round(request['compress_ms'], 2),
+            'response_bytes': len((response.get('body') or '').encode()),
+        }
+        if request.get('caches'):
+            line['caches'] = request['caches']
+        if request['error']:
+            line['error'] = request['error']
+        _emit(line)
+        for slow in request['slow_queries']:
+            _emit({'event': 'slow_query', 'function': function_name, 'request_id': request['request_id'], **slow})
+    return response
+
+
+def instrumented(function_name: str) -> Callable:
+    def decorator(handler: Callable) -> Callable:
+        if inspect.iscoroutinefunction(handler):
+            @functools.wraps(handler)
+            async def async_wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+                request = _new_request(function_name, getattr(context, 'request_id', None))
+                token = _request.set(request)
+                started = time.perf_counter()
+                try:
+                    response = await handler(event, context)
+                finally:
+                    _request.reset(token)
+                return _finish(function_name, event, request, response, started)
+            return async_wrapper
+
+        @functools.wraps(handler)
+        def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+            request = _new_request(function_name, getattr(context, 'request_id', None))
+            token = _request.set(request)
+            started = time.perf_counter()
+            try:
+                response = handler(event, context)
+            finally:
+                _request.reset(token)
+            return _finish(function_name, event, request, response, started)
+        return wrapper
+    return decorator
@@ -0,0 +1,131 @@
+'''
+Business: Лайки постов без блокировки строки поста - post_likes для идемпотентности и шардированные счётчики
+Args: POST_LIKE_SHARDS (число строк-шардов на пост, по умолчанию 16) из окружения
+Returns: like()/unlike() для записи, attach_like_counts() и like_count() для чтения суммарного счётчика, attach_liked() - флаг лайка читателя
+'''
+
+import os
+import random
+from typing import Dict, Iterable, List, Optional, Set
+
+from common.http import table_version
+
+SHARDS = int(os.environ.get('POST_LIKE_SHARDS', 16))
+LIKED_COLUMNS = ['liked']
+
+# Внешние ключи берут только FOR KEY SHARE на строку поста - такие блокировки друг другу не мешают,
+# а UPDATE одной строки-шарда сериализует лишь ~1/SHARDS одновременных лайков
+LIKE_SQL = '''
+    WITH liked AS (
+        INSERT INTO post_likes (user_id, post_id) VALUES (%(user_id)s, %(post_id)s)
+        ON CONFLICT DO NOTHING
+        RETURNING post_id
+    )
+    INSERT INTO post_like_shards (post_id, shard, likes)
+    SELECT post_id, %(shard)s, 1 FROM liked
+    ON CONFLICT (post_id, shard) DO UPDATE SET likes = post_like_shards.likes + 1
+    RETURNING post_id
+'''
+
+UNLIKE_SQL = '''
+    WITH unliked AS (
+        DELETE FROM post_likes WHERE user_id = %(user_id)s AND post_id = %(post_id)s
+        RETURNING post_id
+    )
+    INSERT INTO post_like_shards (post_id, shard, likes)
+    SELECT post_id, %(shard)s, -1 FROM unliked
+    ON CONFLICT (post_id, shard) DO UPDATE SET likes = post_like_shards.likes - 1
+    RETURNING post_id
+'''
+
+# Шард может уйти в минус после отписки - значима только сумма по посту
+FOLD_SQL = '''
+    WITH folded AS (
+        DELETE FROM post_like_shards
+        WHERE post_id IN (SELECT DISTINCT post_id FROM post_like_shards ORDER BY post_id LIMIT %s)
+        RETURNING post_id, likes
+    )
+    UPDATE posts p
+    SET likes = COALESCE(p.likes, 0) + s.total
+    FROM (SELECT post_id, SUM(likes) AS total FROM folded GROUP BY post_id) s
+    WHERE p.id = s.post_id
+'''
+
+
+def _execute_counted(cur, sql: str, user_id: int, post_id: int) -> bool:
+    cur.execute(sql, {'user_id': user_id, 'post_id': post_id, 'shard': random.randrange(SHARDS)})
+    return cur.fetchone() is not None
+
+
+def like(cur, user_id: int, post_id: int) -> bool:
+    '''Возвращает False, если лайк уже стоял'''
+    return _execute_counted(cur, LIKE_SQL, user_id, post_id)
+
+
+def unlike(cur, user_id: int, post_id: int) -> bool:
+    return _execute_counted(cur, UNLIKE_SQL, user_id, post_id)
+
+
+def likes_version(cur) -> int:
+    '''Версия post_likes поднимается statement-триггером в транзакции лайка - на реплике она приходит вместе с ним'''
+    return table_version(cur, 'post_likes')
+
+
+def like_deltas(cur, post_ids: Iterable[int]) -> Dict[int, int]:
+    cur.execute(
+        'SELECT post_id, SUM(likes) FROM post_like_shards WHERE post_id = ANY(%s) GROUP BY post_id',
+        (list(post_ids),)
+    )
+    return {row[0]: row[1] for row in cur.fetchall()}
+
+
+def like_count(cur, post_id: int) -> int:
+    cur.execute(
+        '''SELECT COALESCE(p.likes, 0) + COALESCE((SELECT SUM(likes) FROM post_like_shards WHERE post_id = p.id), 0) AS likes
+           FROM posts p WHERE p.id = %s''',
+        (post_id,)
+    )
+    row = cur.fetchone()
+    if row is None:
+        return 0
+    return int(row['likes'] if isinstance(row, dict) else row[0])
+
+
+def attach_like_counts(conn, columns: List[str], posts: List[tuple]) -> List[tuple]:
+    '''Подставляет в колонку likes сумму свёрнутого значения и шардов - один запрос на страницу'''
+    if not posts:
+        return posts
+    id_index = columns.index('id')
+    likes_index = columns.index('likes')
+    with conn.cursor() as cur:
+        deltas = like_deltas(cur, [post[id_index] for post in posts])
+    if not deltas:
+        return posts
+    return [
+        post[:likes_index] + ((post[likes_index] or 0) + deltas.get(post[id_index], 0),) + post[likes_index + 1:]
+        for post in posts
+    ]
+
+
+def liked_post_ids(cur, user_id: int, post_ids: Iterable[int]) -> Set[int]:
+    cur.execute(
+        'SELECT post_id FROM post_likes WHERE user_id = %s AND post_id = ANY(%s)',
+        (user_id, list(post_ids))
+    )
+    return {row[0] for row in cur.fetchall()}
+
+
+def attach_liked(conn, columns: List[str], posts: List[tuple], user_id: Optional[int]) -> List[tuple]:
+    '''Дописывает в конец строки колонку liked - по первичному ключу post_likes; без читателя везде False'''
+    if user_id is None or not posts:
+        return [tuple(post) + (False,) for post in posts]
+    id_index = columns.index('id')
+    with conn.cursor() as cur:
+        liked = liked_post_ids(cur, user_id, [post[id_index] for post in posts])
+    return [tuple(post) + (post[id_index] in liked,) for post in posts]
+
+
+def fold_shards(cur, batch_size: int = 1000) -> int:
+    '''Переносит один батч шардов в posts.likes; возвращает число обновлённых постов'''
+    cur.execute(FOLD_SQL, (batch_size,))
+    return cur.rowcount
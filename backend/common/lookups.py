@@ -0,0 +1,108 @@
+'''
+Business: Read-through кэш персонажей и локаций для профилей и гидрации ленты и чатов без JOIN
+Args: LOOKUP_CACHE_BACKEND (local по умолчанию), LOOKUP_CACHE_SIZE, LOOKUP_CACHE_TTL из окружения
+Returns: get_characters() / get_locations() по множеству id, prime_* для путей записи, hydrate_posts() для лент
+
+Инвалидации нет: у персонажей и локаций нет UPDATE/DELETE-путей, новые строки (POST, импорт
+снимка) получают новые id, а изменяемые счётчики локаций (message_count, last_message_at,
+follower_count) в кэш не попадают. Появится правка имени или аватара - она станет видна
+не позже LOOKUP_CACHE_TTL; при общем кэше её путь записи должен удалять ключ сам
+'''
+
+import os
+from typing import Dict, Any, Iterable, List, Optional, Set, Tuple
+
+from common.cache import CacheBackend, create_backend
+from common.db import dict_cursor
+
+HYDRATED_COLUMNS = ['character_name', 'character_avatar', 'location_name']
+
+# В кэше локаций только неизменяемые поля: счётчики сообщений меняются на каждом POST
+LOCATION_COLUMNS = 'id, user_id, name, type'
+
+_backend: Optional[CacheBackend] = None
+
+
+def get_backend() -> CacheBackend:
+    global _backend
+    if _backend is None:
+        _backend = create_backend(
+            os.environ.get('LOOKUP_CACHE_BACKEND', 'local'),
+            int(os.environ.get('LOOKUP_CACHE_SIZE', 10000)),
+            float(os.environ.get('LOOKUP_CACHE_TTL', 300)),
+        )
+    return _backend
+
+
+def _plain(row: Dict[str, Any]) -> Dict[str, Any]:
+    '''Значения приводятся к JSON-виду заранее, чтобы общий кэш мог их сериализовать'''
+    return {key: str(value) if hasattr(value, 'isoformat') else value for key, value in row.items()}
+
+
+def _cached(prefix: str, ids: Iterable[Any]) -> Tuple[Dict[int, Dict[str, Any]], Set[int]]:
+    wanted = {int(row_id) for row_id in ids}
+    if not wanted:
+        return {}, set()
+    cached = get_backend().get_many(f'{prefix}:{row_id}' for row_id in wanted)
+    found = {value['id']: value for value in cached.values()}
+    return found, wanted - found.keys()
+
+
+def _store(prefix: str, rows: Iterable[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+    loaded = {row['id']: _plain(row) for row in rows}
+    get_backend().set_many({f'{prefix}:{row_id}': row for row_id, row in loaded.items()})
+    return loaded
+
+
+def _read_through(conn: Any, prefix: str, ids: Iterable[Any], sql: str) -> Dict[int, Dict[str, Any]]:
+    found, missing = _cached(prefix, ids)
+    if missing:
+        with dict_cursor(conn) as cur:
+            cur.execute(sql, (list(missing),))
+            found.update(_store(prefix, cur.fetchall()))
+    return found
+
+
+def get_characters(conn: Any, ids: Iterable[Any]) -> Dict[int, Dict[str, Any]]:
+    return _read_through(conn, 'character', ids, 'SELECT * FROM characters WHERE id = ANY(%s)')
+
+
+def get_locations(conn: Any, ids: Iterable[Any]) -> Dict[int, Dict[str, Any]]:
+    return _read_through(conn, 'location', ids, f'SELECT {LOCATION_COLUMNS} FROM locations WHERE id = ANY(%s)')
+
+
+def cached_characters(ids: Iterable[Any]) -> Tuple[Dict[int, Dict[str, Any]], Set[int]]:
+    '''Найденные в кэше и недостающие id - async-обработчик дочитывает недостающие конвейером со своими запросами'''
+    return _cached('character', ids)
+
+
+def store_characters(rows: Iterable[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+    return _store('character', rows)
+
+
+def get_cached_character(character_id: Any) -> Optional[Dict[str, Any]]:
+    '''Проверка без обращения к БД - позволяет не брать соединение из пула на попадании'''
+    return get_backend().get_many([f'character:{int(character_id)}']).get(f'character:{int(character_id)}')
+
+
+def prime_character(row: Dict[str, Any]) -> None:
+    get_backend().set_many({f'character:{row["id"]}': _plain(row)})
+
+
+def prime_location(row: Dict[str, Any]) -> None:
+    columns = [column.strip() for column in LOCATION_COLUMNS.split(',')]
+    get_backend().set_many({f'location:{row["id"]}': _plain({column: row[column] for column in columns})})
+
+
+def hydrate_posts(conn, columns: List[str], posts: List[tuple]) -> List[tuple]:
+    '''Имена и аватары берутся из кэша справочников вместо JOIN на каждом чтении ленты'''
+    character_index = columns.index('character_id')
+    location_index = columns.index('location_id')
+    characters = get_characters(conn, {post[character_index] for post in posts})
+    locations = get_locations(conn, {post[location_index] for post in posts})
+    hydrated = []
+    for post in posts:
+        character = characters.get(post[character_index], {})
+        location = locations.get(post[location_index], {})
+        hydrated.append(tuple(post) + (character.get('name'), character.get('avatar'), location.get('name')))
+    return hydrated
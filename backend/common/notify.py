@@ -0,0 +1,150 @@
+'''
+Business: Шина уведомлений о новых сообщениях для long-poll ожидания в чатах локаций
+Args: NOTIFY_BACKEND=postgres (LISTEN/NOTIFY, по умолчанию) или memory (внутрипроцессная замена для локальных тестов)
+Returns: get_notify_bus() (get_notify_bus_async() для async-обработчиков) с sequence() / wait() / wait_async() / publish() по ключу локации
+'''
+
+import asyncio
+import os
+import select
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+CHANNEL = 'location_messages'
+LISTEN_POLL_INTERVAL = 5.0
+RECONNECT_DELAY = 1.0
+
+
+class InProcessNotifyBus:
+    '''Счётчик версий на ключ: ожидающий запрос просыпается, как только версия ушла вперёд'''
+
+    def __init__(self):
+        self._versions: Dict[str, int] = {}
+        self._cond = threading.Condition(threading.Lock())
+        # Async-ожидающие не занимают поток: publish будит их future через их event loop
+        self._async_waiters: Dict[str, List[Tuple[asyncio.AbstractEventLoop, 'asyncio.Future[None]']]] = {}
+
+    def sequence(self, key: str) -> int:
+        with self._cond:
+            return self._versions.get(key, 0)
+
+    def wait(self, key: str, seen: int, timeout: float) -> int:
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._versions.setdefault(key, 0)
+            while self._versions[key] == seen:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return self._versions[key]
+
+    async def wait_async(self, key: str, seen: int, timeout: float) -> int:
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            if self._versions.setdefault(key, 0) != seen:
+                return self._versions[key]
+            waiter = (loop, loop.create_future())
+            self._async_waiters.setdefault(key, []).append(waiter)
+        try:
+            await asyncio.wait_for(waiter[1], timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._cond:
+                waiters = self._async_waiters.get(key, [])
+                if waiter in waiters:
+                    waiters.remove(waiter)
+        with self._cond:
+            return self._versions[key]
+
+    def _wake_async(self, key: str) -> None:
+        '''Вызывается под self._cond'''
+        for loop, future in self._async_waiters.pop(key, []):
+            loop.call_soon_threadsafe(_resolve, future)
+
+    def publish(self, key: str) -> None:
+        with self._cond:
+            self._versions[key] = self._versions.get(key, 0) + 1
+            self._cond.notify_all()
+            self._wake_async(key)
+
+    def publish_all(self) -> None:
+        with self._cond:
+            for key in self._versions:
+                self._versions[key] += 1
+            self._cond.notify_all()
+            for key in list(self._async_waiters):
+                self._wake_async(key)
+
+
+def _resolve(future: 'asyncio.Future[None]') -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class PostgresNotifyBus(InProcessNotifyBus):
+    '''Одно LISTEN-соединение на процесс раздаёт уведомления всем ожидающим запросам'''
+
+    def __init__(self, dsn: str):
+        super().__init__()
+        self.dsn = dsn
+        self._conn = self._listen()
+        self._thread = threading.Thread(target=self._run, name='notify-listener', daemon=True)
+        self._thread.start()
+
+    def _listen(self):
+        import psycopg2
+        import psycopg2.extensions
+        conn = psycopg2.connect(self.dsn)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            cur.execute(f'LISTEN {CHANNEL}')
+        return conn
+
+    def _run(self) -> None:
+        import psycopg2
+        while True:
+            try:
+                if self._conn is None:
+                    self._conn = self._listen()
+                    # Пока слушателя не было, уведомления могли потеряться - пусть все перечитают
+                    self.publish_all()
+                ready, _, _ = select.select([self._conn], [], [], LISTEN_POLL_INTERVAL)
+                if not ready:
+                    continue
+                self._conn.poll()
+                while self._conn.notifies:
+                    self.publish(self._conn.notifies.pop(0).payload)
+            except (psycopg2.Error, OSError):
+                if self._conn is not None:
+                    try:
+                        self._conn.close()
+                    except psycopg2.Error:
+                        pass
+                self._conn = None
+                time.sleep(RECONNECT_DELAY)
+
+
+_bus: Optional[InProcessNotifyBus] = None
+_bus_lock = threading.Lock()
+
+
+def get_notify_bus() -> InProcessNotifyBus:
+    global _bus
+    if _bus is None:
+        with _bus_lock:
+            if _bus is None:
+                if os.environ.get('NOTIFY_BACKEND', 'postgres') == 'memory':
+                    _bus = InProcessNotifyBus()
+                else:
+                    _bus = PostgresNotifyBus(os.environ['DATABASE_URL'])
+    return _bus
+
+
+async def get_notify_bus_async() -> InProcessNotifyBus:
+    '''Первый вызов открывает LISTEN-соединение psycopg2 - в пуле потоков, а не в event loop'''
+    if _bus is not None:
+        return _bus
+    return await asyncio.get_running_loop().run_in_executor(None, get_notify_bus)
@@ -0,0 +1,46 @@
+'''
+Business: Keyset-пагинация - разбор limit и непрозрачные курсоры (created_at, id)
+Args: queryStringParameters запроса
+Returns: limit, курсор для WHERE (created_at, id) < (%s, %s) и next_cursor для ответа
+'''
+
+import base64
+from datetime import datetime
+from typing import Dict, Any, Optional, Sequence, Tuple
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+def parse_limit(query_params: Dict[str, Any], default: int = DEFAULT_LIMIT, maximum: int = MAX_LIMIT) -> int:
+    raw = query_params.get('limit')
+    if raw in (None, ''):
+        return default
+    limit = int(raw)
+    if limit < 1:
+        raise ValueError('limit must be positive')
+    return min(limit, maximum)
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = f'{created_at.isoformat()}|{row_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    padded = cursor + '=' * (-len(cursor) % 4)
+    created_at, row_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+    return datetime.fromisoformat(created_at), int(row_id)
+
+
+def next_cursor(rows: list, limit: int, columns: Optional[Sequence[str]] = None) -> Optional[str]:
+    '''
+    Ожидает выборку с LIMIT limit + 1: лишняя строка означает, что есть следующая страница.
+    Строки - dict, либо кортежи, если переданы columns
+    '''
+    if len(rows) <= limit:
+        return None
+    last = rows[limit - 1]
+    if columns is not None:
+        last = dict(zip(columns, last))
+    return encode_cursor(last['created_at'], last['id'])
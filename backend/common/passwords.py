@@ -0,0 +1,133 @@
+'''
+Business: Солёное хэширование паролей через scrypt/PBKDF2 из stdlib в ограниченном пуле потоков
+Args: PASSWORD_HASH_ALGORITHM (scrypt|pbkdf2_sha256), PASSWORD_SCRYPT_N/R/P, PASSWORD_PBKDF2_ITERATIONS, PASSWORD_HASH_WORKERS
+Returns: hash_password() / verify_password() (и async-варианты) / needs_rehash() для самоописывающего формата algorithm$params$salt$hash
+'''
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional
+
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+LEGACY_SHA256_LENGTH = 64
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode().rstrip('=')
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.b64decode(data + '=' * (-len(data) % 4))
+
+
+def _format_params(params: Dict[str, int]) -> str:
+    return ','.join(f'{key}={value}' for key, value in sorted(params.items()))
+
+
+def _parse_params(raw: str) -> Dict[str, int]:
+    return {key: int(value) for key, value in (item.split('=') for item in raw.split(','))}
+
+
+def default_settings() -> Dict[str, Any]:
+    algorithm = os.environ.get('PASSWORD_HASH_ALGORITHM', 'scrypt')
+    if algorithm == 'pbkdf2_sha256':
+        return {
+            'algorithm': algorithm,
+            'params': {'i': int(os.environ.get('PASSWORD_PBKDF2_ITERATIONS', 600000))},
+        }
+    return {
+        'algorithm': 'scrypt',
+        'params': {
+            'n': int(os.environ.get('PASSWORD_SCRYPT_N', 2 ** 14)),
+            'r': int(os.environ.get('PASSWORD_SCRYPT_R', 8)),
+            'p': int(os.environ.get('PASSWORD_SCRYPT_P', 1)),
+        },
+    }
+
+
+def _derive(algorithm: str, params: Dict[str, int], password: str, salt: bytes) -> bytes:
+    if algorithm == 'scrypt':
+        n, r, p = params['n'], params['r'], params['p']
+        return hashlib.scrypt(
+            password.encode(), salt=salt, n=n, r=r, p=p,
+            maxmem=256 * n * r + 1024 * 1024, dklen=KEY_BYTES
+        )
+    if algorithm == 'pbkdf2_sha256':
+        return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, params['i'], dklen=KEY_BYTES)
+    raise ValueError(f'Unknown password hash algorithm: {algorithm}')
+
+
+def hash_password_sync(password: str, settings: Optional[Dict[str, Any]] = None) -> str:
+    settings = settings or default_settings()
+    salt = secrets.token_bytes(SALT_BYTES)
+    key = _derive(settings['algorithm'], settings['params'], password, salt)
+    return '$'.join([settings['algorithm'], _format_params(settings['params']), _b64encode(salt), _b64encode(key)])
+
+
+def verify_password_sync(password: str, stored: str) -> bool:
+    if not stored:
+        return False
+    if '$' not in stored and len(stored) == LEGACY_SHA256_LENGTH:
+        legacy = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(legacy, stored)
+    algorithm, params, salt, key = stored.split('$')
+    derived = _derive(algorithm, _parse_params(params), password, _b64decode(salt))
+    return hmac.compare_digest(derived, _b64decode(key))
+
+
+def needs_rehash(stored: str, settings: Optional[Dict[str, Any]] = None) -> bool:
+    settings = settings or default_settings()
+    if '$' not in stored:
+        return True
+    algorithm, params, _, _ = stored.split('$')
+    return algorithm != settings['algorithm'] or _parse_params(params) != settings['params']
+
+
+# KDF намеренно медленный: ограничиваем число одновременных вычислений,
+# чтобы волна логинов не занимала все ядра и потоки воркера
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('PASSWORD_HASH_WORKERS', 2)),
+    thread_name_prefix='password-hash'
+)
+
+
+def hash_password(password: str) -> str:
+    return _executor.submit(hash_password_sync, password).result()
+
+
+def verify_password(password: str, stored: Optional[str]) -> bool:
+    if not stored:
+        # Сравниваем с фиктивным хэшем, чтобы время ответа не выдавало несуществующих пользователей
+        _executor.submit(verify_password_sync, password, _dummy_hash()).result()
+        return False
+    return _executor.submit(verify_password_sync, password, stored).result()
+
+
+async def hash_password_async(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(_executor, hash_password_sync, password)
+
+
+async def verify_password_async(password: str, stored: Optional[str]) -> bool:
+    '''Event loop не блокируется на KDF - пока считается хэш, другие запросы ждут базу'''
+    loop = asyncio.get_running_loop()
+    if not stored:
+        await loop.run_in_executor(_executor, verify_password_sync, password, _dummy_hash())
+        return False
+    return await loop.run_in_executor(_executor, verify_password_sync, password, stored)
+
+
+_dummy: Optional[str] = None
+
+
+def _dummy_hash() -> str:
+    global _dummy
+    if _dummy is None:
+        _dummy = hash_password_sync(secrets.token_urlsafe(16))
+    return _dummy
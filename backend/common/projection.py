@@ -0,0 +1,65 @@
+'''
+Business: Проекция полей списков - ?fields=id,name,avatar по белому списку колонок и компактный колоночный формат ?format=compact
+Args: queryStringParameters (fields через запятую, format), белый список полей ресурса
+Returns: parse_fields() - запрошенные поля или None (все), ValueError на неизвестное поле; select_list() для SQL; project() для уже выбранных строк
+
+Карточке в списке нужны id, name, avatar и race, а не description на килобайты лора:
+поля уходят в список колонок SELECT, поэтому лишнее не читается из базы и не кодируется
+'''
+
+from typing import Any, Iterable, List, Optional, Sequence, Tuple
+
+from common.likes import LIKED_COLUMNS
+from common.lookups import HYDRATED_COLUMNS
+
+CHARACTER_FIELDS = ['id', 'user_id', 'name', 'avatar', 'race', 'class', 'description', 'created_at']
+LOCATION_FIELDS = [
+    'id', 'user_id', 'name', 'type', 'description', 'created_at',
+    'message_count', 'last_message_at', 'follower_count', 'fanout_on_read',
+]
+POST_COLUMNS = ['id', 'character_id', 'location_id', 'content', 'likes', 'created_at']
+POST_FIELDS = POST_COLUMNS + HYDRATED_COLUMNS + LIKED_COLUMNS
+MESSAGE_COLUMNS = ['id', 'character_id', 'location_id', 'content', 'created_at']
+MESSAGE_FIELDS = MESSAGE_COLUMNS + ['character_name', 'character_avatar']
+
+FORMATS = ('json', 'compact')
+
+
+def parse_fields(query_params: dict, allowed: Sequence[str]) -> Optional[List[str]]:
+    raw = query_params.get('fields')
+    if not raw:
+        return None
+    fields = list(dict.fromkeys(field.strip() for field in raw.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in allowed]
+    if not fields or unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(allowed)}")
+    return fields
+
+
+def wants_compact(query_params: dict) -> bool:
+    response_format = query_params.get('format') or 'json'
+    if response_format not in FORMATS:
+        raise ValueError(f"Unknown format: {response_format}. Allowed: {', '.join(FORMATS)}")
+    return response_format == 'compact'
+
+
+def with_required(fields: Optional[List[str]], required: Iterable[str]) -> Optional[List[str]]:
+    '''Колонки, без которых не построить курсор или гидрацию, читаются всегда и отрезаются при выдаче'''
+    if fields is None:
+        return None
+    return fields + [column for column in required if column not in fields]
+
+
+def select_list(fields: Optional[List[str]], alias: str, table_fields: Sequence[str]) -> str:
+    '''Имена уже прошли белый список; кавычки нужны для class и прочих ключевых слов'''
+    prefix = f'{alias}.' if alias else ''
+    if fields is None:
+        return prefix + '*'
+    return ', '.join(f'{prefix}"{field}"' for field in fields if field in table_fields)
+
+
+def project(columns: Sequence[str], rows: Iterable[Sequence[Any]], fields: Optional[List[str]]) -> Tuple[List[str], List[Sequence[Any]]]:
+    if fields is None:
+        return list(columns), list(rows)
+    indexes = [list(columns).index(field) for field in fields]
+    return list(fields), [tuple(row[index] for index in indexes) for row in rows]
@@ -0,0 +1,244 @@
+'''
+Business: Ограничение частоты записи - token bucket на клиента и на IP, проверка до взятия соединения из пула
+Args: RATE_LIMIT_BACKEND=memory (по умолчанию) или postgres (UNLOGGED-таблица, общая для всех экземпляров); RATE_LIMIT_<SCOPE> и RATE_LIMIT_<SCOPE>_IP вида "запросов/секунд"
+Returns: check_rate_limit() (check_rate_limit_async() для async-обработчиков) с секундами до следующей попытки (0 - можно) и too_many_requests() для ответа 429
+'''
+
+import asyncio
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+from common.http import request_header
+
+# Запросов за окно: ключ клиента и более щедрый ключ IP - за одним NAT сидят разные игроки
+DEFAULT_LIMITS: Dict[str, Tuple[str, str]] = {
+    'messages': ('30/60', '120/60'),
+    'posts': ('10/60', '60/60'),
+    'likes': ('60/60', '300/60'),
+    'follows': ('30/60', '120/60'),
+}
+MAX_LOCAL_BUCKETS = 100_000
+RECONNECT_DELAY = 1.0
+# Раз в столько проверок Postgres-хранилище удаляет давно полные корзины
+CLEANUP_EVERY = 1000
+IDLE_BUCKET_TTL = '1 hour'
+
+
+def parse_limit_spec(spec: str) -> Tuple[float, float]:
+    '''"30/60" - до 30 запросов подряд, затем по одному каждые 2 секунды; возвращает (ёмкость, токенов в секунду)'''
+    requests, seconds = spec.split('/')
+    capacity = float(requests)
+    return capacity, capacity / float(seconds)
+
+
+def scope_limits(scope: str) -> Tuple[Tuple[float, float], Tuple[float, float]]:
+    client_default, ip_default = DEFAULT_LIMITS.get(scope, DEFAULT_LIMITS['posts'])
+    name = f'RATE_LIMIT_{scope.upper()}'
+    return (
+        parse_limit_spec(os.environ.get(name, client_default)),
+        parse_limit_spec(os.environ.get(f'{name}_IP', ip_default)),
+    )
+
+
+class InProcessRateLimitStore:
+    '''Корзины в памяти процесса: точны для одного экземпляра функции, вытесняются по LRU'''
+
+    def __init__(self, max_buckets: int = MAX_LOCAL_BUCKETS):
+        self.max_buckets = max_buckets
+        self._buckets: 'OrderedDict[str, Tuple[float, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take_many(self, checks: List[Tuple[str, float, float, float]]) -> float:
+        '''Токены списываются со всех корзин или ни с одной: отказ по IP не тратит лимит клиента'''
+        now = time.monotonic()
+        with self._lock:
+            available = []
+            for key, capacity, refill_per_second, _ in checks:
+                tokens, updated_at = self._buckets.get(key, (capacity, now))
+                available.append(min(capacity, tokens + (now - updated_at) * refill_per_second))
+            waits = [
+                0.0 if tokens >= cost else (cost - tokens) / refill_per_second
+                for tokens, (_, _, refill_per_second, cost) in zip(available, checks)
+            ]
+            admitted = not any(waits)
+            for tokens, (key, _, _, cost) in zip(available, checks):
+                self._buckets[key] = (tokens - cost if admitted else tokens, now)
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        return max(waits)
+
+
+class PostgresRateLimitStore:
+    '''
+    Общие корзины в rate_limit_buckets через одно autocommit-соединение на процесс - пул
+    обработчиков не трогается. Отказ запоминается локально до Retry-After, поэтому поток
+    повторов от одного клиента не доходит до базы; при недоступной базе работает локальный store
+    '''
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self._conn = None
+        self._lock = threading.Lock()
+        self._denied: 'OrderedDict[str, float]' = OrderedDict()
+        self._fallback = InProcessRateLimitStore()
+        self._calls = 0
+        self._retry_connect_at = 0.0
+
+    def _connection(self):
+        if self._conn is None or self._conn.closed:
+            import psycopg2
+            import psycopg2.extensions
+            self._conn = psycopg2.connect(self.dsn)
+            self._conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        return self._conn
+
+    def _denied_for(self, keys: List[str], now: float) -> float:
+        retry_after = 0.0
+        for key in keys:
+            until = self._denied.get(key)
+            if until is None:
+                continue
+            if until <= now:
+                del self._denied[key]
+            else:
+                retry_after = max(retry_after, until - now)
+        return retry_after
+
+    def take_many(self, checks: List[Tuple[str, float, float, float]]) -> float:
+        import psycopg2
+        now = time.monotonic()
+        with self._lock:
+            retry_after = self._denied_for([check[0] for check in checks], now)
+            if retry_after:
+                return retry_after
+            if now < self._retry_connect_at:
+                return self._fallback.take_many(checks)
+            try:
+                with self._connection().cursor() as cur:
+                    # Одна функция на все ключи: токены списываются со всех корзин или ни с одной
+                    cur.execute(
+                        'SELECT take_rate_limit_tokens_all(%s::text[], %s::float8[], %s::float8[], %s::float8[])',
+                        [list(column) for column in zip(*checks)]
+                    )
+                    waits = cur.fetchone()[0]
+                    self._calls += 1
+                    if self._calls % CLEANUP_EVERY == 0:
+                        cur.execute(
+                            'DELETE FROM rate_limit_buckets WHERE updated_at < clock_timestamp() - %s::interval',
+                            (IDLE_BUCKET_TTL,)
+                        )
+            except psycopg2.Error:
+                if self._conn is not None:
+                    try:
+                        self._conn.close()
+                    except psycopg2.Error:
+                        pass
+                self._conn = None
+                self._retry_connect_at = now + RECONNECT_DELAY
+                return self._fallback.take_many(checks)
+
+            for (key, _, _, _), wait in zip(checks, waits):
+                if wait > 0:
+                    self._denied[key] = now + wait
+                    self._denied.move_to_end(key)
+            while len(self._denied) > MAX_LOCAL_BUCKETS:
+                self._denied.popitem(last=False)
+            return max(waits)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_rate_limit_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if os.environ.get('RATE_LIMIT_BACKEND', 'memory') == 'postgres':
+                    _store = PostgresRateLimitStore(os.environ['DATABASE_URL'])
+                else:
+                    _store = InProcessRateLimitStore()
+    return _store
+
+
+def peek_body(event: Dict[str, Any]) -> Dict[str, Any]:
+    '''Тело для выбора ключа и стоимости; ошибки разбора оставляем обработчику'''
+    try:
+        body = json.loads(event.get('body') or '{}')
+    except ValueError:
+        return {}
+    return body if isinstance(body, dict) else {}
+
+
+def client_key(event: Dict[str, Any], body: Dict[str, Any]) -> Optional[str]:
+    session_token = request_header(event, 'X-Session-Token')
+    if session_token:
+        # Сам токен в общую таблицу не пишем
+        return 'session:' + hashlib.sha1(session_token.encode()).hexdigest()[:20]
+    user_id = request_header(event, 'X-User-Id')
+    if user_id:
+        return f'user:{user_id}'
+    items = body.get('items')
+    first = items[0] if isinstance(items, list) and items and isinstance(items[0], dict) else body
+    if first.get('character_id') is not None:
+        return f'character:{first["character_id"]}'
+    return None
+
+
+def client_ip(event: Dict[str, Any]) -> Optional[str]:
+    identity = (event.get('requestContext') or {}).get('identity') or {}
+    if identity.get('sourceIp'):
+        return identity['sourceIp']
+    forwarded = request_header(event, 'X-Forwarded-For')
+    return forwarded.split(',')[0].strip() if forwarded else None
+
+
+def request_cost(body: Dict[str, Any]) -> int:
+    '''Пакет из N элементов стоит N токенов - иначе batch обходил бы лимит'''
+    items = body.get('items')
+    return max(len(items), 1) if isinstance(items, list) else 1
+
+
+def check_rate_limit(scope: str, event: Dict[str, Any], body: Optional[Dict[str, Any]] = None) -> float:
+    if os.environ.get('RATE_LIMIT_ENABLED', '1') == '0':
+        return 0.0
+    body = peek_body(event) if body is None else body
+    (client_capacity, client_rate), (ip_capacity, ip_rate) = scope_limits(scope)
+    cost = request_cost(body)
+    checks = []
+    key = client_key(event, body)
+    if key:
+        checks.append((f'{scope}:{key}', client_capacity, client_rate, min(cost, client_capacity)))
+    ip = client_ip(event)
+    if ip:
+        checks.append((f'{scope}:ip:{ip}', ip_capacity, ip_rate, min(cost, ip_capacity)))
+    if not checks:
+        return 0.0
+    return get_rate_limit_store().take_many(checks)
+
+
+async def check_rate_limit_async(scope: str, event: Dict[str, Any], body: Optional[Dict[str, Any]] = None) -> float:
+    '''
+    Postgres-хранилище ходит в базу синхронным psycopg2 под общей блокировкой - в async-обработчике
+    это остановило бы event loop со всеми ожидающими запросами, поэтому проверка идёт в пуле потоков
+    '''
+    if isinstance(get_rate_limit_store(), InProcessRateLimitStore):
+        return check_rate_limit(scope, event, body)
+    return await asyncio.get_running_loop().run_in_executor(None, check_rate_limit, scope, event, body)
+
+
+def too_many_requests(headers: Dict[str, str], retry_after: float) -> Dict[str, Any]:
+    return {
+        'statusCode': 429,
+        'headers': {**headers, 'Retry-After': str(max(1, math.ceil(retry_after)))},
+        'body': json.dumps({'error': 'Too many requests', 'retry_after': round(retry_after, 1)}),
+        'isBase64Encoded': False
+    }
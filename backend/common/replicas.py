@@ -0,0 +1,132 @@
+'''
+Business: Чтение с реплик - GET-запросы идут на DATABASE_READ_URLS по кругу, запись и чтение автора сразу после POST - на primary
+Args: DATABASE_READ_URLS (через запятую; DATABASE_READ_URL для одной), DB_REPLICA_RETRY_SECONDS, DB_READ_PIN_SECONDS, READ_PIN_BACKEND из окружения; event запроса
+Returns: get_replica_set() - None, если реплик нет; pin_primary(event) после записи и is_pinned(event) перед чтением
+
+Реплика отстаёт на время репликации, поэтому автор, только что отправивший POST, несколько
+секунд читает с primary и видит свой пост или сообщение. Привязка хранится по сессии и X-User-Id
+в подключаемом кэше (local по умолчанию - в пределах экземпляра функции)
+'''
+
+import hashlib
+import itertools
+import os
+import re
+import threading
+import time
+from typing import Dict, Any, List, Optional
+
+from common.cache import CacheBackend, create_backend
+from common.http import request_header
+
+DEFAULT_RETRY_SECONDS = 30.0
+DEFAULT_PIN_SECONDS = 5.0
+MAX_PINS = 100000
+
+
+def read_urls() -> List[str]:
+    '''Запятая разделяет URL, только если за ней начинается новый: у многохостового URL libpq свои запятые'''
+    raw = os.environ.get('DATABASE_READ_URLS') or os.environ.get('DATABASE_READ_URL') or ''
+    return [url.strip() for url in re.split(r',\s*(?=postgres(?:ql)?://)', raw) if url.strip()]
+
+
+class ReplicaSet:
+    def __init__(self, urls: List[str], retry_seconds: float):
+        self.urls = urls
+        self.retry_seconds = retry_seconds
+        self._next = itertools.count()
+        self._down_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {'reads': 0, 'failovers': 0, 'primary_fallbacks': 0, 'pinned_reads': 0}
+
+    def candidates(self) -> List[str]:
+        '''Живые реплики по кругу, начиная со следующей; упавшая пропускается retry_seconds'''
+        start = next(self._next) % len(self.urls)
+        now = time.monotonic()
+        with self._lock:
+            self._stats['reads'] += 1
+            return [
+                url for url in self.urls[start:] + self.urls[:start]
+                if self._down_until.get(url, 0.0) <= now
+            ]
+
+    def mark_down(self, url: str) -> None:
+        with self._lock:
+            self._down_until[url] = time.monotonic() + self.retry_seconds
+            self._stats['failovers'] += 1
+
+    def count(self, metric: str) -> None:
+        with self._lock:
+            self._stats[metric] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                **self._stats,
+                'replicas': len(self.urls),
+                'down': sum(1 for until in self._down_until.values() if until > now),
+            }
+
+
+_replicas: Optional[ReplicaSet] = None
+_replicas_loaded = False
+_pins: Optional[CacheBackend] = None
+_lock = threading.Lock()
+
+
+def get_replica_set() -> Optional[ReplicaSet]:
+    global _replicas, _replicas_loaded
+    if not _replicas_loaded:
+        with _lock:
+            if not _replicas_loaded:
+                urls = read_urls()
+                if urls:
+                    _replicas = ReplicaSet(
+                        urls, float(os.environ.get('DB_REPLICA_RETRY_SECONDS', DEFAULT_RETRY_SECONDS))
+                    )
+                _replicas_loaded = True
+    return _replicas
+
+
+def pin_seconds() -> float:
+    return float(os.environ.get('DB_READ_PIN_SECONDS', DEFAULT_PIN_SECONDS))
+
+
+def _pin_backend() -> CacheBackend:
+    global _pins
+    if _pins is None:
+        with _lock:
+            if _pins is None:
+                _pins = create_backend(os.environ.get('READ_PIN_BACKEND', 'local'), MAX_PINS, pin_seconds())
+    return _pins
+
+
+def _pin_keys(event: Dict[str, Any]) -> List[str]:
+    keys = []
+    session_token = request_header(event, 'X-Session-Token')
+    if session_token:
+        keys.append('read_pin:session:' + hashlib.sha1(session_token.encode()).hexdigest()[:20])
+    user_id = request_header(event, 'X-User-Id')
+    if str(user_id or '').isdigit():
+        keys.append(f'read_pin:user:{user_id}')
+    return keys
+
+
+def pin_primary(event: Dict[str, Any]) -> None:
+    '''Вызывается в начале POST: чтения того же клиента до конца окна увидят его запись'''
+    keys = _pin_keys(event)
+    if keys and get_replica_set() is not None:
+        _pin_backend().set_many({key: True for key in keys}, ttl=pin_seconds())
+
+
+def is_pinned(event: Optional[Dict[str, Any]]) -> bool:
+    if event is None:
+        return False
+    keys = _pin_keys(event)
+    return bool(keys) and bool(_pin_backend().get_many(keys))
+
+
+def replica_stats() -> Dict[str, Any]:
+    replicas = get_replica_set()
+    return replicas.stats() if replicas is not None else {}
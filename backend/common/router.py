@@ -0,0 +1,232 @@
+'''
+Business: Все функции в одном WSGI-процессе для самостоятельного развёртывания - маршрут по первому сегменту пути
+Args: имена функций (каталоги backend с index.py); путь /<имя>/... или /<id из func2url.json>/..., как у платформы
+Returns: create_app() - WSGI-приложение, которое собирает event платформы и вызывает handler(event, context); create_asgi_app() - то же для ASGI-сервера
+
+Функции импортируются в один интерпретатор, поэтому пул соединений, кэши справочников и
+JSON-кодировщик из common общие для всех. OPTIONS отвечает сам роутер, не заходя в handler.
+В ASGI-режиме функции с async_handler выполняются прямо в event loop воркера, остальные - в потоках
+'''
+
+import asyncio
+import base64
+import importlib.util
+import json
+import os
+import traceback
+import uuid
+from http import HTTPStatus
+from typing import Dict, Any, Callable, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+FUNC2URL_PATH = os.path.join(BACKEND_DIR, 'func2url.json')
+
+# Объединение того, что разрешают preflight-ответы отдельных функций
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Session-Token, If-None-Match',
+    'Access-Control-Max-Age': '86400',
+}
+
+NOT_FOUND = {'statusCode': 404, 'headers': {'Content-Type': 'application/json'}, 'body': '{"error": "Unknown function"}'}
+PREFLIGHT = {'statusCode': 200, 'headers': CORS_HEADERS, 'body': ''}
+INTERNAL_ERROR = {'statusCode': 500, 'headers': {'Content-Type': 'application/json'}, 'body': '{"error": "Internal server error"}'}
+
+Handler = Callable[[Dict[str, Any], Any], Dict[str, Any]]
+
+
+class Context:
+    def __init__(self, function_name: str):
+        self.request_id = str(uuid.uuid4())
+        self.function_name = function_name
+
+
+def discover_functions() -> List[str]:
+    return sorted(
+        name for name in os.listdir(BACKEND_DIR)
+        if os.path.isfile(os.path.join(BACKEND_DIR, name, 'index.py'))
+    )
+
+
+def function_aliases() -> Dict[str, str]:
+    '''Фронтенд ходит по /<id функции> - с ними роутер подменяет платформу сменой одного API_BASE'''
+    if not os.path.exists(FUNC2URL_PATH):
+        return {}
+    with open(FUNC2URL_PATH) as func2url:
+        return {url.rstrip('/').rsplit('/', 1)[-1]: name for name, url in json.load(func2url).items()}
+
+
+def load_module(name: str) -> Any:
+    spec = importlib.util.spec_from_file_location(f'{name}_index', os.path.join(BACKEND_DIR, name, 'index.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def header_name(name: str) -> str:
+    return '-'.join(part.capitalize() for part in name.replace('_', '-').split('-'))
+
+
+def request_headers(environ: Dict[str, Any]) -> Dict[str, str]:
+    headers = {}
+    for key, value in environ.items():
+        if key.startswith('HTTP_'):
+            name = key[5:]
+        elif key in ('CONTENT_TYPE', 'CONTENT_LENGTH') and value:
+            name = key
+        else:
+            continue
+        headers[header_name(name)] = value
+    return headers
+
+
+def build_event(method: str, path: str, headers: Dict[str, str], query_string: str,
+                raw_body: bytes, source_ip: Optional[str]) -> Dict[str, Any]:
+    event: Dict[str, Any] = {
+        'httpMethod': method,
+        'path': path,
+        'headers': headers,
+        'queryStringParameters': dict(parse_qsl(query_string, keep_blank_values=True)),
+        'requestContext': {'identity': {'sourceIp': source_ip}},
+        'isBase64Encoded': False,
+    }
+    if raw_body:
+        try:
+            event['body'] = raw_body.decode('utf-8')
+        except UnicodeDecodeError:
+            event['body'] = base64.b64encode(raw_body).decode('ascii')
+            event['isBase64Encoded'] = True
+    return event
+
+
+def wsgi_event(environ: Dict[str, Any], path: str) -> Dict[str, Any]:
+    length = int(environ.get('CONTENT_LENGTH') or 0)
+    return build_event(
+        environ['REQUEST_METHOD'], path, request_headers(environ), environ.get('QUERY_STRING', ''),
+        environ['wsgi.input'].read(length) if length else b'', environ.get('REMOTE_ADDR')
+    )
+
+
+def response_parts(response: Dict[str, Any]) -> Tuple[int, Dict[str, str], bytes]:
+    body = response.get('body') or ''
+    payload = base64.b64decode(body) if response.get('isBase64Encoded') else body.encode('utf-8')
+    headers = {**(response.get('headers') or {}), 'Content-Length': str(len(payload))}
+    headers.setdefault('Access-Control-Allow-Origin', '*')
+    return response.get('statusCode', 200), headers, payload
+
+
+def status_line(status_code: int) -> str:
+    try:
+        return f'{status_code} {HTTPStatus(status_code).phrase}'
+    except ValueError:
+        return f'{status_code} Unknown'
+
+
+class Routes:
+    def __init__(self, names: Iterable[str], aliases: Optional[Dict[str, str]] = None):
+        self.names = set(names)
+        self.aliases = {alias: name for alias, name in (aliases or {}).items() if name in self.names}
+
+    def resolve(self, path_info: str) -> Tuple[Optional[str], str]:
+        segment, _, rest = path_info.lstrip('/').partition('/')
+        name = segment if segment in self.names else self.aliases.get(segment)
+        return name, '/' + rest
+
+
+class Router(Routes):
+    def __init__(self, handlers: Dict[str, Handler], aliases: Optional[Dict[str, str]] = None):
+        super().__init__(handlers, aliases)
+        self.handlers = handlers
+
+    def __call__(self, environ: Dict[str, Any], start_response: Callable) -> Iterable[bytes]:
+        response = self.dispatch(environ)
+        status_code, headers, payload = response_parts(response)
+        start_response(status_line(status_code), list(headers.items()))
+        return [payload]
+
+    def dispatch(self, environ: Dict[str, Any]) -> Dict[str, Any]:
+        name, path = self.resolve(environ.get('PATH_INFO', '/'))
+        if name is None:
+            return NOT_FOUND
+        if environ['REQUEST_METHOD'] == 'OPTIONS':
+            return PREFLIGHT
+        try:
+            return self.handlers[name](wsgi_event(environ, path), Context(name))
+        except Exception:
+            # Обработчики сами ловят свои ошибки - сюда попадает только то, что вылетело мимо них
+            environ['wsgi.errors'].write(traceback.format_exc())
+            return INTERNAL_ERROR
+
+
+class AsgiRouter(Routes):
+    def __init__(self, modules: Dict[str, Any], aliases: Optional[Dict[str, str]] = None):
+        super().__init__(modules, aliases)
+        self.modules = modules
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    # Пулы async-функций открыты в loop сервера - закрываются в нём же
+                    from common.aio import close_async_pools
+                    await close_async_pools()
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        if scope['type'] != 'http':
+            return
+
+        response = await self.dispatch(scope, receive)
+        status_code, headers, payload = response_parts(response)
+        await send({
+            'type': 'http.response.start',
+            'status': status_code,
+            'headers': [(name.lower().encode('latin-1'), str(value).encode('latin-1')) for name, value in headers.items()],
+        })
+        await send({'type': 'http.response.body', 'body': payload})
+
+    async def dispatch(self, scope: Dict[str, Any], receive: Callable) -> Dict[str, Any]:
+        name, path = self.resolve(scope['path'])
+        if name is None:
+            return NOT_FOUND
+        if scope['method'] == 'OPTIONS':
+            return PREFLIGHT
+
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            chunks.append(message.get('body', b''))
+            more_body = message.get('more_body', False)
+        event = build_event(
+            scope['method'], path,
+            {header_name(key.decode('latin-1')): value.decode('latin-1') for key, value in scope['headers']},
+            scope.get('query_string', b'').decode('latin-1'), b''.join(chunks),
+            scope['client'][0] if scope.get('client') else None
+        )
+
+        module = self.modules[name]
+        try:
+            if hasattr(module, 'async_handler'):
+                return await module.async_handler(event, Context(name))
+            return await asyncio.get_running_loop().run_in_executor(None, module.handler, event, Context(name))
+        except Exception:
+            traceback.print_exc()
+            return INTERNAL_ERROR
+
+
+def create_app(names: Optional[List[str]] = None) -> Router:
+    '''Загружает функции сразу: первый запрос не платит за импорт, а в пре-форк воркере всё готово до accept'''
+    handlers = {name: load_module(name).handler for name in names or discover_functions()}
+    return Router(handlers, function_aliases())
+
+
+def create_asgi_app(names: Optional[List[str]] = None) -> AsgiRouter:
+    if names is None and os.environ.get('ROUTER_FUNCTIONS'):
+        names = os.environ['ROUTER_FUNCTIONS'].split(',')
+    modules = {name: load_module(name) for name in names or discover_functions()}
+    return AsgiRouter(modules, function_aliases())
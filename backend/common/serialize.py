@@ -0,0 +1,109 @@
+'''
+Business: Потоковая JSON-сериализация списков - строки из кортежей без промежуточных dict-копий
+Args: соединение и SQL (именованный серверный курсор) или готовые колонки и строки
+Returns: JSON-массив строкой, собранный по частям, или компактный {"columns": [...], "rows": [[...]]}; даты кодируются так же, как json.dumps(default=str)
+'''
+
+import itertools
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from json.encoder import encode_basestring
+from math import isfinite
+from typing import Dict, Any, Callable, Iterable, List, Optional, Sequence
+
+from common.instrument import timed
+
+DEFAULT_CHUNK_SIZE = 2000
+
+_cursor_names = itertools.count()
+
+
+def _quoted_str(value: Any) -> str:
+    return '"' + str(value) + '"'
+
+
+def _encode_float(value: float) -> str:
+    '''Как json.dumps: repr для конечных, NaN / Infinity / -Infinity вместо nan / inf из repr'''
+    if isfinite(value):
+        return float.__repr__(value)
+    if value != value:
+        return 'NaN'
+    return 'Infinity' if value > 0 else '-Infinity'
+
+
+_ENCODERS: Dict[type, Callable[[Any], str]] = {
+    str: encode_basestring,
+    int: int.__repr__,
+    float: _encode_float,
+    bool: lambda value: 'true' if value else 'false',
+    type(None): lambda value: 'null',
+    datetime: _quoted_str,
+    date: _quoted_str,
+    Decimal: _quoted_str,
+}
+
+
+def encode_value(value: Any) -> str:
+    encoder = _ENCODERS.get(type(value))
+    if encoder is None:
+        return json.dumps(value, default=str, ensure_ascii=False)
+    return encoder(value)
+
+
+def row_encoder(columns: Sequence[str]) -> Callable[[Sequence[Any]], str]:
+    keys = [encode_basestring(column) + ':' for column in columns]
+
+    def encode(row: Sequence[Any]) -> str:
+        return '{' + ','.join([key + encode_value(value) for key, value in zip(keys, row)]) + '}'
+
+    return encode
+
+
+def array_row(row: Sequence[Any]) -> str:
+    return '[' + ','.join([encode_value(value) for value in row]) + ']'
+
+
+def _compact_envelope(columns: Sequence[str], rows_json: str) -> str:
+    '''Имена колонок один раз, дальше только значения - ключи не повторяются в каждой строке'''
+    return '{"columns":[' + ','.join(map(encode_basestring, columns)) + '],"rows":' + rows_json + '}'
+
+
+def encode_rows(columns: Sequence[str], rows: Iterable[Sequence[Any]], compact: bool = False) -> str:
+    with timed('serialize_ms'):
+        if compact:
+            return _compact_envelope(columns, '[' + ','.join(map(array_row, rows)) + ']')
+        return '[' + ','.join(map(row_encoder(columns), rows)) + ']'
+
+
+def encode_dicts(rows: List[Dict[str, Any]], fields: Optional[Sequence[str]] = None, compact: bool = False) -> str:
+    '''Для уже собранных dict-строк одинаковой формы, например после гидрации'''
+    if not rows:
+        return _compact_envelope(fields or [], '[]') if compact else '[]'
+    columns = list(fields or rows[0].keys())
+    return encode_rows(columns, ([row[column] for column in columns] for row in rows), compact)
+
+
+def query_json_array(conn: Any, sql: str, params: Optional[Sequence[Any]] = None,
+                     chunk_size: int = DEFAULT_CHUNK_SIZE, compact: bool = False) -> str:
+    '''
+    Именованный курсор держит результат на сервере: в памяти одновременно только
+    chunk_size кортежей и уже закодированный текст, а не fetchall() + dict-копии + dumps
+    '''
+    with conn.cursor(name=f'json_stream_{next(_cursor_names)}') as cur:
+        cur.itersize = chunk_size
+        cur.execute(sql, params)
+        with timed('db_ms'):
+            rows = cur.fetchmany(chunk_size)
+        # У именованного курсора description появляется только после первой выборки
+        columns = [column.name for column in cur.description] if cur.description else []
+        encode = array_row if compact else row_encoder(columns)
+        parts: List[str] = []
+        while rows:
+            with timed('serialize_ms'):
+                parts.append(','.join(map(encode, rows)))
+            with timed('db_ms'):
+                rows = cur.fetchmany(chunk_size)
+    with timed('serialize_ms'):
+        rows_json = '[' + ','.join(parts) + ']'
+        return _compact_envelope(columns, rows_json) if compact else rows_json
@@ -0,0 +1,147 @@
+'''
+Business: Подписки пользователя на локации и персонажей для персональной ленты
+Args: event с httpMethod, заголовком X-User-Id, body ({action: follow|unfollow, location_id | character_id}); context с request_id
+Returns: HTTP response со списком подписок или результатом подписки/отписки; 429 с Retry-After, если POST превысил лимит частоты
+'''
+
+import json
+import os
+import sys
+from typing import Dict, Any
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.db import get_db_connection, release_db_connection, prewarm, dict_cursor
+from common.feed import TARGETS, follow, unfollow, list_follows
+from common.http import CACHE_CONTROL_PRIVATE, request_header
+from common.instrument import instrumented, record_error
+from common.ratelimit import check_rate_limit, too_many_requests
+from common.replicas import pin_primary
+
+prewarm()
+
+@instrumented('follows')
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method: str = event.get('httpMethod', 'GET')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+
+    headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Expose-Headers': 'Retry-After',
+        'Cache-Control': CACHE_CONTROL_PRIVATE
+    }
+
+    user_id = request_header(event, 'X-User-Id')
+    if not str(user_id or '').isdigit():
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'X-User-Id header is required'}),
+            'isBase64Encoded': False
+        }
+    user_id = int(user_id)
+
+    if method == 'POST':
+        retry_after = check_rate_limit('follows', event)
+        if retry_after:
+            return too_many_requests(headers, retry_after)
+        # Домашняя лента зависит от подписок - после изменения она читается с primary
+        pin_primary(event)
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = dict_cursor(conn)
+
+        if method == 'GET':
+            follows = list_follows(cur, user_id)
+            cur.close()
+            release_db_connection(conn)
+
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'body': json.dumps(follows),
+                'isBase64Encoded': False
+            }
+
+        elif method == 'POST':
+            body_data = json.loads(event.get('body', '{}'))
+            action = body_data.get('action')
+            targets = [target for target in TARGETS if body_data.get(f'{target}_id')]
+
+            if action not in ('follow', 'unfollow') or len(targets) != 1 or not str(body_data[f'{targets[0]}_id']).isdigit():
+                cur.close()
+                release_db_connection(conn)
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'body': json.dumps({'error': 'Expected action follow|unfollow and exactly one of location_id, character_id'}),
+                    'isBase64Encoded': False
+                }
+
+            target = targets[0]
+            target_id = int(body_data[f'{target}_id'])
+            from psycopg2 import errors
+            try:
+                if action == 'follow':
+                    changed = follow(cur, user_id, target, target_id)
+                else:
+                    changed = unfollow(cur, user_id, target, target_id)
+                conn.commit()
+            except errors.ForeignKeyViolation:
+                conn.rollback()
+                cur.close()
+                release_db_connection(conn)
+                return {
+                    'statusCode': 404,
+                    'headers': headers,
+                    'body': json.dumps({'error': f'User or {target} not found'}),
+                    'isBase64Encoded': False
+                }
+            cur.close()
+            release_db_connection(conn)
+
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'body': json.dumps({
+                    f'{target}_id': target_id,
+                    'following': action == 'follow',
+                    'changed': changed
+                }),
+                'isBase64Encoded': False
+            }
+
+        else:
+            cur.close()
+            release_db_connection(conn)
+            return {
+                'statusCode': 405,
+                'headers': headers,
+                'body': json.dumps({'error': 'Method not allowed'}),
+                'isBase64Encoded': False
+            }
+
+    except Exception as e:
+        record_error(e)
+        release_db_connection(conn)
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
@@ -1,18 +1,27 @@
 '''
 Business: API для управления локациями - создание, получение списка
-Args: event с httpMethod, body, queryStringParameters; context с request_id
-Returns: HTTP response с данными локаций в JSON
+Args: event с httpMethod, body, queryStringParameters (fields - поля через запятую, format=compact); context с request_id
+Returns: HTTP response с данными локаций в JSON, большие ответы сжаты по Accept-Encoding
 '''
 
 import json
 import os
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import sys
 from typing import Dict, Any
 
-def get_db_connection():
-    return psycopg2.connect(os.environ['DATABASE_URL'])
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
 
+from common.db import get_db_connection, get_read_connection, release_db_connection, prewarm, dict_cursor
+from common.http import cache_control, compress_response, make_etag, etag_matches, not_modified, table_version
+from common.instrument import instrumented, record_error
+from common.lookups import prime_location
+from common.projection import LOCATION_FIELDS, parse_fields, select_list, wants_compact
+from common.replicas import pin_primary
+from common.serialize import query_json_array
+
+prewarm()
+
+@instrumented('locations')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
@@ -22,7 +31,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
@@ -31,33 +40,54 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     headers = {
         'Content-Type': 'application/json',
-        'Access-Control-Allow-Origin': '*'
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Expose-Headers': 'ETag',
+        'Cache-Control': cache_control(method)
     }
     
+    if method == 'POST':
+        pin_primary(event)
+    
+    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
+        conn = get_read_connection(event) if method == 'GET' else get_db_connection()
+        cur = dict_cursor(conn)
         
         if method == 'GET':
-            cur.execute('''
-                SELECT l.*, 
-                       COUNT(DISTINCT m.id) as message_count
-                FROM locations l
-                LEFT JOIN messages m ON l.id = m.location_id
-                GROUP BY l.id
-                ORDER BY l.created_at DESC
-            ''')
+            query_params = event.get('queryStringParameters') or {}
+            try:
+                fields = parse_fields(query_params, LOCATION_FIELDS)
+                compact = wants_compact(query_params)
+            except ValueError as e:
+                cur.close()
+                release_db_connection(conn)
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'body': json.dumps({'error': str(e)}),
+                    'isBase64Encoded': False
+                }
             
-            locations = cur.fetchall()
+            # Версию поднимает любое изменение строк, включая счётчики чата и подписчиков
+            etag = make_etag('locations', table_version(cur, 'locations'), fields, compact)
             cur.close()
-            conn.close()
             
-            return {
+            if etag_matches(event, etag):
+                release_db_connection(conn)
+                return not_modified(headers, etag)
+            
+            body = query_json_array(
+                conn, f"SELECT {select_list(fields, 'l', LOCATION_FIELDS)} FROM locations l ORDER BY l.created_at DESC",
+                compact=compact
+            )
+            release_db_connection(conn)
+            
+            return compress_response(event, {
                 'statusCode': 200,
-                'headers': headers,
-                'body': json.dumps([dict(loc) for loc in locations], default=str),
+                'headers': {**headers, 'ETag': etag},
+                'body': body,
                 'isBase64Encoded': False
-            }
+            })
         
         elif method == 'POST':
             body_data = json.loads(event.get('body', '{}'))
@@ -68,7 +98,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             
             if not all([user_id, name, loc_type, description]):
                 cur.close()
-                conn.close()
+                release_db_connection(conn)
                 return {
                     'statusCode': 400,
                     'headers': headers,
@@ -84,7 +114,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             new_location = cur.fetchone()
             conn.commit()
             cur.close()
-            conn.close()
+            release_db_connection(conn)
+            prime_location(new_location)
             
             return {
                 'statusCode': 201,
@@ -95,7 +126,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         else:
             cur.close()
-            conn.close()
+            release_db_connection(conn)
             return {
                 'statusCode': 405,
                 'headers': headers,
@@ -104,6 +135,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             }
     
     except Exception as e:
+        record_error(e)
+        release_db_connection(conn)
         return {
             'statusCode': 500,
             'headers': headers,
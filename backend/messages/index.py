@@ -1,135 +1,373 @@
 '''
 Business: API для сообщений в чатах локаций - создание и получение сообщений
-Args: event с httpMethod, body, queryStringParameters; context с request_id
-Returns: HTTP response с данными сообщений в JSON
+Args: event с httpMethod, body (одиночный элемент или {items: [...]} для пакета), queryStringParameters (location_id, after_id, before_id, limit, wait, fields, format=compact); context с request_id
+Returns: HTTP response с данными сообщений в JSON, большие страницы сжаты по Accept-Encoding; 429 с Retry-After, если POST превысил лимит частоты
+
+Логика в async_handler (psycopg 3, асинхронный пул, конвейер независимых запросов);
+handler - синхронная обёртка для платформы
 '''
 
 import json
 import os
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from typing import Dict, Any
+import sys
+import time
+from typing import Dict, Any, List, Optional
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.aio import async_db_connection, async_read_connection, prewarm, sync_handler
+from common.batch import MAX_BATCH_SIZE, parse_batch, referenced_ids, filter_known, batch_response_body
+from common.http import cache_control, compress_response, make_etag, etag_matches, not_modified
+from common.instrument import instrumented, record_error
+from common.lookups import cached_characters, store_characters
+from common.notify import get_notify_bus_async
+from common.pagination import parse_limit
+from common.projection import MESSAGE_COLUMNS, MESSAGE_FIELDS, parse_fields, select_list, wants_compact, with_required
+from common.ratelimit import check_rate_limit_async, too_many_requests
+from common.replicas import pin_primary
+from common.serialize import encode_dicts
+
+prewarm()
+
+DEFAULT_MESSAGES_LIMIT = 50
+MAX_MESSAGES_LIMIT = 200
+LONG_POLL_MAX_WAIT = 25.0
+RECENT_DAYS = int(os.environ.get('MESSAGES_RECENT_DAYS', 7))
+# Без них не подставить персонажа и не продолжить чат с after_id
+REQUIRED_COLUMNS = ['id', 'character_id']
+
+INSERT_SQL = '''
+    WITH new_message AS (
+        INSERT INTO messages (character_id, location_id, content)
+        VALUES (%s, %s, %s) RETURNING *
+    ), counter AS (
+        UPDATE locations
+        SET message_count = message_count + 1,
+            last_message_at = GREATEST(last_message_at, (SELECT created_at FROM new_message))
+        WHERE id = (SELECT location_id FROM new_message)
+    )
+    SELECT * FROM new_message
+'''
+
+BATCH_INSERT_SQL = '''
+    WITH new_messages AS (
+        INSERT INTO messages (character_id, location_id, content)
+        VALUES {values} RETURNING *
+    ), counters AS (
+        UPDATE locations l
+        SET message_count = l.message_count + s.added,
+            last_message_at = GREATEST(l.last_message_at, s.last_created_at)
+        FROM (
+            SELECT location_id, COUNT(*) AS added, MAX(created_at) AS last_created_at
+            FROM new_messages GROUP BY location_id
+        ) s
+        WHERE l.id = s.location_id
+    )
+    SELECT m.*,
+           c.name as character_name,
+           c.avatar as character_avatar
+    FROM new_messages m
+    JOIN characters c ON m.character_id = c.id
+    ORDER BY m.id
+'''
+
+CHARACTERS_SQL = 'SELECT * FROM characters WHERE id = ANY(%s)'
+
+async def fetch_messages(conn, location_id: int, after_id: Optional[int], before_id: Optional[int], limit: int,
+                         columns: str = 'm.*') -> List[Dict[str, Any]]:
+    '''
+    Все режимы читают диапазон индекса (location_id, id) и отдают сообщения по возрастанию id.
+    Условие на created_at отсекает партиции: курсор переводится во время по диапазонам id в message_partitions
+    (подзапрос - один вызов на запрос, а не фильтр на каждой строке), а последние сообщения сначала
+    ищутся за RECENT_DAYS и только при нехватке - в более старых месяцах
+    '''
+    async with conn.cursor() as cur:
+        if after_id is not None:
+            await cur.execute(
+                f'''SELECT {columns} FROM messages m
+                   WHERE m.location_id = %s AND m.id > %s AND m.created_at >= (SELECT message_id_floor(%s, %s))
+                   ORDER BY m.id ASC LIMIT %s''',
+                (location_id, after_id, location_id, after_id, limit)
+            )
+            return await cur.fetchall()
+
+        if before_id is not None:
+            await cur.execute(
+                f'''SELECT {columns} FROM messages m
+                   WHERE m.location_id = %s AND m.id < %s AND m.created_at < (SELECT message_id_ceiling(%s, %s))
+                   ORDER BY m.id DESC LIMIT %s''',
+                (location_id, before_id, location_id, before_id, limit)
+            )
+            return list(reversed(await cur.fetchall()))
+
+        await cur.execute(
+            f'''SELECT {columns} FROM messages m
+               WHERE m.location_id = %s AND m.created_at >= LOCALTIMESTAMP - %s * INTERVAL '1 day'
+               ORDER BY m.id DESC LIMIT %s''',
+            (location_id, RECENT_DAYS, limit)
+        )
+        messages = await cur.fetchall()
+        if len(messages) < limit:
+            # Чтение в autocommit: LOCALTIMESTAMP второго запроса чуть позже, и сообщение на самой
+            # границе окна попало бы в оба - уже отданные id исключаются
+            await cur.execute(
+                f'''SELECT {columns} FROM messages m
+                   WHERE m.location_id = %s AND m.created_at < LOCALTIMESTAMP - %s * INTERVAL '1 day'
+                     AND m.id <> ALL(%s::int[])
+                   ORDER BY m.id DESC LIMIT %s''',
+                (location_id, RECENT_DAYS, [msg['id'] for msg in messages], limit - len(messages))
+            )
+            messages += await cur.fetchall()
+        return list(reversed(messages))
 
-def get_db_connection():
-    return psycopg2.connect(os.environ['DATABASE_URL'])
+async def load_characters(conn, character_ids) -> Dict[int, Dict[str, Any]]:
+    characters, missing = cached_characters(character_ids)
+    if missing:
+        async with conn.cursor() as cur:
+            await cur.execute(CHARACTERS_SQL, (list(missing),))
+            characters.update(store_characters(await cur.fetchall()))
+    return characters
 
-def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+def attach_characters(messages: List[Dict[str, Any]], characters: Dict[int, Dict[str, Any]]) -> None:
+    for msg in messages:
+        character = characters.get(msg['character_id'])
+        msg['character_name'] = character['name'] if character else None
+        msg['character_avatar'] = character['avatar'] if character else None
+
+async def read_messages(conn, location_id: int, after_id: Optional[int], before_id: Optional[int], limit: int,
+                        columns: str = 'm.*') -> List[Dict[str, Any]]:
+    messages = await fetch_messages(conn, location_id, after_id, before_id, limit, columns)
+    if messages:
+        attach_characters(messages, await load_characters(conn, {msg['character_id'] for msg in messages}))
+    return messages
+
+async def wait_for_messages(bus, seen: int, location_id: int, after_id: int, limit: int, wait: float,
+                            columns: str = 'm.*') -> List[Dict[str, Any]]:
+    '''Во время ожидания не держится ни соединение с БД, ни поток: запрос - это future в event loop'''
+    deadline = time.monotonic() + wait
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return []
+        current = await bus.wait_async(str(location_id), seen, remaining)
+        if current == seen:
+            return []
+        seen = current
+        # Уведомление приходит после коммита на primary - реплика может его ещё не догнать
+        async with async_db_connection(autocommit=True) as conn:
+            messages = await read_messages(conn, location_id, after_id, None, limit, columns)
+        if messages:
+            return messages
+
+async def insert_message(conn, character_id: int, location_id: int, content: str) -> Dict[str, Any]:
+    '''
+    Вставка и чтение автора независимы: при промахе кэша оба запроса уходят одним конвейером,
+    при попадании остаётся только вставка
+    '''
+    characters, missing = cached_characters([character_id])
+    async with conn.pipeline():
+        insert_cur = conn.cursor()
+        await insert_cur.execute(INSERT_SQL, (character_id, location_id, content))
+        if missing:
+            character_cur = conn.cursor()
+            await character_cur.execute(CHARACTERS_SQL, (list(missing),))
+    message = await insert_cur.fetchone()
+    if missing:
+        characters.update(store_characters(await character_cur.fetchall()))
+    await conn.commit()
+    attach_characters([message], characters)
+    return message
+
+async def insert_batch(conn, items: List[Any]) -> Dict[str, Any]:
+    parsed, errors = parse_batch(items)
+    valid, rows = [], []
+    if parsed:
+        character_ids, location_ids = referenced_ids(parsed)
+        async with conn.pipeline():
+            characters_cur, locations_cur = conn.cursor(), conn.cursor()
+            await characters_cur.execute('SELECT id FROM characters WHERE id = ANY(%s)', (character_ids,))
+            await locations_cur.execute('SELECT id FROM locations WHERE id = ANY(%s)', (location_ids,))
+        known_characters = {row['id'] for row in await characters_cur.fetchall()}
+        known_locations = {row['id'] for row in await locations_cur.fetchall()}
+        valid = filter_known(parsed, errors, known_characters, known_locations)
+    if valid:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                BATCH_INSERT_SQL.format(values=', '.join(['(%s, %s, %s)'] * len(valid))),
+                [value for _, values in valid for value in values]
+            )
+            rows = await cur.fetchall()
+        await conn.commit()
+    return {'valid': valid, 'rows': rows, 'errors': errors}
+
+@instrumented('messages')
+async def async_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
-    
+
     if method == 'OPTIONS':
         return {
             'statusCode': 200,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Session-Token, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
             'isBase64Encoded': False
         }
-    
+
     headers = {
         'Content-Type': 'application/json',
-        'Access-Control-Allow-Origin': '*'
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Expose-Headers': 'ETag, Retry-After',
+        'Cache-Control': cache_control(method)
     }
-    
+
+    # Флуд отсекается до пула: отказ не стоит ни соединения, ни транзакции
+    if method == 'POST':
+        retry_after = await check_rate_limit_async('messages', event)
+        if retry_after:
+            return too_many_requests(headers, retry_after)
+        pin_primary(event)
+
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
         if method == 'GET':
             query_params = event.get('queryStringParameters') or {}
             location_id = query_params.get('location_id')
-            
+
             if not location_id:
-                cur.close()
-                conn.close()
                 return {
                     'statusCode': 400,
                     'headers': headers,
                     'body': json.dumps({'error': 'location_id is required'}),
                     'isBase64Encoded': False
                 }
-            
-            cur.execute('''
-                SELECT m.*, 
-                       c.name as character_name,
-                       c.avatar as character_avatar
-                FROM messages m
-                JOIN characters c ON m.character_id = c.id
-                WHERE m.location_id = %s
-                ORDER BY m.created_at ASC
-            ''', (location_id,))
-            
-            messages = cur.fetchall()
-            cur.close()
-            conn.close()
-            
-            return {
+
+            try:
+                location_id = int(location_id)
+                limit = parse_limit(query_params, default=DEFAULT_MESSAGES_LIMIT, maximum=MAX_MESSAGES_LIMIT)
+                after_id = int(query_params['after_id']) if query_params.get('after_id') else None
+                before_id = int(query_params['before_id']) if query_params.get('before_id') else None
+                wait = min(float(query_params.get('wait') or 0), LONG_POLL_MAX_WAIT)
+            except ValueError:
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'body': json.dumps({'error': 'Invalid location_id, limit, after_id, before_id or wait'}),
+                    'isBase64Encoded': False
+                }
+
+            try:
+                fields = parse_fields(query_params, MESSAGE_FIELDS)
+                compact = wants_compact(query_params)
+            except ValueError as e:
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'body': json.dumps({'error': str(e)}),
+                    'isBase64Encoded': False
+                }
+            columns = select_list(with_required(fields, REQUIRED_COLUMNS), 'm', MESSAGE_COLUMNS)
+
+            long_poll = after_id is not None and wait > 0
+            bus = await get_notify_bus_async() if long_poll else None
+            seen = bus.sequence(str(location_id)) if bus else 0
+
+            etag = None
+            async with async_read_connection(event) as conn:
+                if not long_poll:
+                    # Счётчики локации меняются с каждым сообщением - этого достаточно для ETag чата
+                    async with conn.cursor() as cur:
+                        await cur.execute(
+                            'SELECT message_count, last_message_at FROM locations WHERE id = %s',
+                            (location_id,)
+                        )
+                        state = await cur.fetchone() or {}
+                    etag = make_etag(
+                        'messages', location_id, state.get('message_count'), state.get('last_message_at'),
+                        after_id, before_id, limit, fields, compact
+                    )
+                    if etag_matches(event, etag):
+                        return not_modified(headers, etag)
+
+                messages = await read_messages(conn, location_id, after_id, before_id, limit, columns)
+
+            if bus and not messages:
+                messages = await wait_for_messages(bus, seen, location_id, after_id, limit, wait, columns)
+
+            return compress_response(event, {
                 'statusCode': 200,
-                'headers': headers,
-                'body': json.dumps([dict(msg) for msg in messages], default=str),
+                'headers': {**headers, 'ETag': etag} if etag else headers,
+                'body': encode_dicts(messages, fields, compact),
                 'isBase64Encoded': False
-            }
-        
+            })
+
         elif method == 'POST':
             body_data = json.loads(event.get('body', '{}'))
+
+            if 'items' in body_data:
+                items = body_data['items']
+                if not isinstance(items, list) or not items or len(items) > MAX_BATCH_SIZE:
+                    return {
+                        'statusCode': 400,
+                        'headers': headers,
+                        'body': json.dumps({'error': f'items must be a non-empty array of at most {MAX_BATCH_SIZE} entries'}),
+                        'isBase64Encoded': False
+                    }
+
+                async with async_db_connection() as conn:
+                    batch = await insert_batch(conn, items)
+                bus = await get_notify_bus_async()
+                for touched_location_id in {row['location_id'] for row in batch['rows']}:
+                    bus.publish(str(touched_location_id))
+
+                status_code, result = batch_response_body(len(items), batch['valid'], batch['rows'], batch['errors'])
+                return {
+                    'statusCode': status_code,
+                    'headers': headers,
+                    'body': json.dumps(result, default=str),
+                    'isBase64Encoded': False
+                }
+
             character_id = body_data.get('character_id')
             location_id = body_data.get('location_id')
             content = body_data.get('content')
-            
+
             if not all([character_id, location_id, content]):
-                cur.close()
-                conn.close()
                 return {
                     'statusCode': 400,
                     'headers': headers,
                     'body': json.dumps({'error': 'Missing required fields'}),
                     'isBase64Encoded': False
                 }
-            
-            cur.execute(
-                '''INSERT INTO messages (character_id, location_id, content) 
-                   VALUES (%s, %s, %s) RETURNING *''',
-                (character_id, location_id, content)
-            )
-            new_message = cur.fetchone()
-            
-            cur.execute('''
-                SELECT c.name as character_name, c.avatar as character_avatar
-                FROM characters c WHERE c.id = %s
-            ''', (character_id,))
-            character_data = cur.fetchone()
-            
-            conn.commit()
-            cur.close()
-            conn.close()
-            
-            result = dict(new_message)
-            result.update(dict(character_data))
-            
+
+            async with async_db_connection() as conn:
+                result = await insert_message(conn, character_id, location_id, content)
+            (await get_notify_bus_async()).publish(str(result['location_id']))
+
             return {
                 'statusCode': 201,
                 'headers': headers,
                 'body': json.dumps(result, default=str),
                 'isBase64Encoded': False
             }
-        
+
         else:
-            cur.close()
-            conn.close()
             return {
                 'statusCode': 405,
                 'headers': headers,
                 'body': json.dumps({'error': 'Method not allowed'}),
                 'isBase64Encoded': False
             }
-    
+
     except Exception as e:
+        record_error(e)
         return {
             'statusCode': 500,
             'headers': headers,
             'body': json.dumps({'error': str(e)}),
             'isBase64Encoded': False
         }
+
+handler = sync_handler(async_handler)
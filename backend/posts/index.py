@@ -1,18 +1,50 @@
 '''
 Business: API для управления постами - создание, получение ленты
-Args: event с httpMethod, body, queryStringParameters; context с request_id
-Returns: HTTP response с данными постов в JSON
+Args: event с httpMethod, body (одиночный элемент, {items: [...]} для пакета или {action: like|unlike, post_id} с X-User-Id), queryStringParameters (limit, before, location_id, character_id, feed=home с X-User-Id, fields, format=compact); X-User-Id в GET - флаг liked у постов; context с request_id
+Returns: HTTP response с данными постов в JSON, большие ленты сжаты по Accept-Encoding; 429 с Retry-After, если POST превысил лимит частоты
 '''
 
 import json
 import os
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import sys
 from typing import Dict, Any
 
-def get_db_connection():
-    return psycopg2.connect(os.environ['DATABASE_URL'])
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
 
+from common.batch import MAX_BATCH_SIZE, validate_batch, batch_response_body
+from common.db import get_db_connection, get_read_connection, release_db_connection, prewarm, dict_cursor
+from common.feed import fetch_home_feed
+from common.http import CACHE_CONTROL_PRIVATE, cache_control, compress_response, make_etag, etag_matches, not_modified, request_header, table_version
+from common.instrument import instrumented, record_error
+from common.likes import LIKED_COLUMNS, attach_like_counts, attach_liked, like, like_count, likes_version, unlike
+from common.lookups import HYDRATED_COLUMNS, hydrate_posts
+from common.pagination import parse_limit, decode_cursor, next_cursor
+from common.projection import POST_COLUMNS, POST_FIELDS, parse_fields, project, select_list, wants_compact, with_required
+from common.ratelimit import check_rate_limit, peek_body, too_many_requests
+from common.replicas import pin_primary
+from common.serialize import encode_rows
+
+prewarm()
+
+# Курсор, гидрация и счётчик лайков читают эти колонки, даже если клиент их не просил
+FEED_REQUIRED_COLUMNS = ['id', 'created_at', 'character_id', 'location_id', 'likes']
+
+BATCH_INSERT_SQL = '''
+    WITH new_posts AS (
+        INSERT INTO posts (character_id, location_id, content) 
+        VALUES %s RETURNING *
+    )
+    SELECT p.*, 
+           c.name as character_name,
+           c.avatar as character_avatar,
+           l.name as location_name
+    FROM new_posts p
+    JOIN characters c ON p.character_id = c.id
+    JOIN locations l ON p.location_id = l.id
+    ORDER BY p.id
+'''
+
+@instrumented('posts')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
@@ -22,7 +54,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Session-Token, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
@@ -31,45 +63,227 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     headers = {
         'Content-Type': 'application/json',
-        'Access-Control-Allow-Origin': '*'
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Expose-Headers': 'ETag, Retry-After',
+        'Cache-Control': cache_control(method)
     }
     
+    if method == 'POST':
+        peeked = peek_body(event)
+        scope = 'likes' if peeked.get('action') in ('like', 'unlike') else 'posts'
+        retry_after = check_rate_limit(scope, event, peeked)
+        if retry_after:
+            return too_many_requests(headers, retry_after)
+        # Лента автора следующие секунды читается с primary - реплика могла ещё не получить пост
+        pin_primary(event)
+    
+    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
+        conn = get_read_connection(event) if method == 'GET' else get_db_connection()
+        cur = dict_cursor(conn)
         
         if method == 'GET':
-            cur.execute('''
-                SELECT p.*, 
-                       c.name as character_name,
-                       c.avatar as character_avatar,
-                       l.name as location_name
+            query_params = event.get('queryStringParameters') or {}
+            location_id = query_params.get('location_id')
+            character_id = query_params.get('character_id')
+            viewer_id = request_header(event, 'X-User-Id')
+            viewer_id = int(viewer_id) if str(viewer_id or '').isdigit() else None
+            
+            try:
+                if (location_id and not location_id.isdigit()) or (character_id and not character_id.isdigit()):
+                    raise ValueError('location_id and character_id must be integers')
+                limit = parse_limit(query_params)
+                before = decode_cursor(query_params['before']) if query_params.get('before') else None
+            except ValueError:
+                cur.close()
+                release_db_connection(conn)
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'body': json.dumps({'error': 'Invalid limit, cursor, location_id or character_id'}),
+                    'isBase64Encoded': False
+                }
+            
+            try:
+                fields = parse_fields(query_params, POST_FIELDS)
+                compact = wants_compact(query_params)
+            except ValueError as e:
+                cur.close()
+                release_db_connection(conn)
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'body': json.dumps({'error': str(e)}),
+                    'isBase64Encoded': False
+                }
+            
+            if query_params.get('feed') == 'home':
+                cur.close()
+                if viewer_id is None:
+                    release_db_connection(conn)
+                    return {
+                        'statusCode': 400,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'X-User-Id header is required for the home feed'}),
+                        'isBase64Encoded': False
+                    }
+                
+                cur = conn.cursor()
+                posts = fetch_home_feed(cur, viewer_id, limit + 1, before)
+                columns = [column.name for column in cur.description]
+                cur.close()
+                page = attach_like_counts(conn, columns, hydrate_posts(conn, columns, posts[:limit]))
+                page = attach_liked(conn, columns, page, viewer_id)
+                release_db_connection(conn)
+                output_columns, page = project(columns + HYDRATED_COLUMNS + LIKED_COLUMNS, page, fields)
+                
+                return compress_response(event, {
+                    'statusCode': 200,
+                    'headers': {**headers, 'Cache-Control': CACHE_CONTROL_PRIVATE},
+                    'body': '{"posts":' + encode_rows(output_columns, page, compact)
+                            + ',"next_cursor":' + json.dumps(next_cursor(posts, limit, columns)) + '}',
+                    'isBase64Encoded': False
+                })
+            
+            conditions = []
+            params = []
+            if location_id:
+                conditions.append('p.location_id = %s')
+                params.append(location_id)
+            if character_id:
+                conditions.append('p.character_id = %s')
+                params.append(character_id)
+            if before:
+                conditions.append('(p.created_at, p.id) < (%s, %s)')
+                params.extend(before)
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+            params.append(limit + 1)
+            
+            etag = make_etag(
+                'posts', table_version(cur, 'posts'), likes_version(cur), location_id, character_id, limit, before,
+                fields, compact, viewer_id
+            )
+            cur.close()
+            
+            if etag_matches(event, etag):
+                release_db_connection(conn)
+                return not_modified(headers, etag)
+            
+            cur = conn.cursor()
+            cur.execute(f'''
+                SELECT {select_list(with_required(fields, FEED_REQUIRED_COLUMNS), 'p', POST_COLUMNS)}
                 FROM posts p
-                JOIN characters c ON p.character_id = c.id
-                JOIN locations l ON p.location_id = l.id
-                ORDER BY p.created_at DESC
-            ''')
+                {where}
+                ORDER BY p.created_at DESC, p.id DESC
+                LIMIT %s
+            ''', params)
             
+            columns = [column.name for column in cur.description]
             posts = cur.fetchall()
             cur.close()
-            conn.close()
+            page = attach_like_counts(conn, columns, hydrate_posts(conn, columns, posts[:limit]))
+            page = attach_liked(conn, columns, page, viewer_id)
+            release_db_connection(conn)
+            output_columns, page = project(columns + HYDRATED_COLUMNS + LIKED_COLUMNS, page, fields)
             
-            return {
+            # liked у каждого читателя свой: ETag включает его id, а общий кэш хранит ответы раздельно
+            return compress_response(event, {
                 'statusCode': 200,
-                'headers': headers,
-                'body': json.dumps([dict(post) for post in posts], default=str),
+                'headers': {**headers, 'ETag': etag, 'Vary': 'X-User-Id'},
+                'body': '{"posts":' + encode_rows(output_columns, page, compact)
+                        + ',"next_cursor":' + json.dumps(next_cursor(posts, limit, columns)) + '}',
                 'isBase64Encoded': False
-            }
+            })
         
         elif method == 'POST':
             body_data = json.loads(event.get('body', '{}'))
+            
+            if body_data.get('action') in ('like', 'unlike'):
+                user_id = request_header(event, 'X-User-Id')
+                post_id = body_data.get('post_id')
+                if not str(user_id or '').isdigit() or not str(post_id or '').isdigit():
+                    cur.close()
+                    release_db_connection(conn)
+                    return {
+                        'statusCode': 400,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'post_id and X-User-Id header are required'}),
+                        'isBase64Encoded': False
+                    }
+                
+                from psycopg2.errors import ForeignKeyViolation
+                try:
+                    if body_data['action'] == 'like':
+                        changed = like(cur, int(user_id), int(post_id))
+                    else:
+                        changed = unlike(cur, int(user_id), int(post_id))
+                    conn.commit()
+                except ForeignKeyViolation:
+                    conn.rollback()
+                    cur.close()
+                    release_db_connection(conn)
+                    return {
+                        'statusCode': 404,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'User or post not found'}),
+                        'isBase64Encoded': False
+                    }
+                likes = like_count(cur, int(post_id))
+                conn.commit()
+                cur.close()
+                release_db_connection(conn)
+                
+                return {
+                    'statusCode': 200,
+                    'headers': headers,
+                    'body': json.dumps({
+                        'post_id': int(post_id),
+                        'liked': body_data['action'] == 'like',
+                        'changed': changed,
+                        'likes': likes
+                    }),
+                    'isBase64Encoded': False
+                }
+            
+            if 'items' in body_data:
+                items = body_data['items']
+                if not isinstance(items, list) or not items or len(items) > MAX_BATCH_SIZE:
+                    cur.close()
+                    release_db_connection(conn)
+                    return {
+                        'statusCode': 400,
+                        'headers': headers,
+                        'body': json.dumps({'error': f'items must be a non-empty array of at most {MAX_BATCH_SIZE} entries'}),
+                        'isBase64Encoded': False
+                    }
+                
+                valid, errors = validate_batch(cur, items)
+                rows = []
+                if valid:
+                    from psycopg2.extras import execute_values
+                    rows = execute_values(
+                        cur, BATCH_INSERT_SQL, [values for _, values in valid],
+                        page_size=len(valid), fetch=True
+                    )
+                    conn.commit()
+                cur.close()
+                release_db_connection(conn)
+                
+                status_code, result = batch_response_body(len(items), valid, rows, errors)
+                return {
+                    'statusCode': status_code,
+                    'headers': headers,
+                    'body': json.dumps(result, default=str),
+                    'isBase64Encoded': False
+                }
+            
             character_id = body_data.get('character_id')
             location_id = body_data.get('location_id')
             content = body_data.get('content')
             
             if not all([character_id, location_id, content]):
                 cur.close()
-                conn.close()
+                release_db_connection(conn)
                 return {
                     'statusCode': 400,
                     'headers': headers,
@@ -77,15 +291,23 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
-            cur.execute(
-                '''INSERT INTO posts (character_id, location_id, content) 
-                   VALUES (%s, %s, %s) RETURNING *''',
-                (character_id, location_id, content)
-            )
+            cur.execute('''
+                WITH new_post AS (
+                    INSERT INTO posts (character_id, location_id, content) 
+                    VALUES (%s, %s, %s) RETURNING *
+                )
+                SELECT p.*, 
+                       c.name as character_name,
+                       c.avatar as character_avatar,
+                       l.name as location_name
+                FROM new_post p
+                JOIN characters c ON p.character_id = c.id
+                JOIN locations l ON p.location_id = l.id
+            ''', (character_id, location_id, content))
             new_post = cur.fetchone()
             conn.commit()
             cur.close()
-            conn.close()
+            release_db_connection(conn)
             
             return {
                 'statusCode': 201,
@@ -96,7 +318,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         else:
             cur.close()
-            conn.close()
+            release_db_connection(conn)
             return {
                 'statusCode': 405,
                 'headers': headers,
@@ -105,6 +327,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             }
     
     except Exception as e:
+        record_error(e)
+        release_db_connection(conn)
         return {
             'statusCode': 500,
             'headers': headers,
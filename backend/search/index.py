@@ -0,0 +1,215 @@
+'''
+Business: Полнотекстовый поиск по персонажам, локациям, постам и сообщениям - ранжирование, подсветка, keyset-пагинация
+Args: event с httpMethod, queryStringParameters (q, types, location_id, character_id, limit, after); context с request_id
+Returns: HTTP response {results, next_cursor}; results отсортированы по релевантности
+'''
+
+import base64
+import json
+import os
+import sys
+from typing import Dict, Any, List, Optional, Tuple
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.db import get_db_connection, release_db_connection, prewarm
+from common.http import cache_control
+from common.instrument import instrumented, record_error
+from common.pagination import parse_limit
+from common.serialize import encode_rows
+
+prewarm()
+
+ENTITIES = ('character', 'location', 'post', 'message')
+MAX_QUERY_LENGTH = 200
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 50
+STATEMENT_TIMEOUT_MS = int(os.environ.get('SEARCH_STATEMENT_TIMEOUT_MS', 5000))
+HEADLINE_OPTIONS = 'StartSel=<mark>, StopSel=</mark>, MaxWords=30, MinWords=10, MaxFragments=2, FragmentDelimiter=" … "'
+
+# Каждая сущность ранжируется отдельной веткой: в ней условие entity = '...' совпадает с предикатом
+# частичного GIN-индекса, и в общий ORDER BY попадает не больше limit + 1 строк с ветки
+ENTITY_HITS_SQL = '''
+    (SELECT * FROM (
+        SELECT d.entity, d.entity_id, ts_rank_cd(d.document, q.query, 1) AS rank
+        FROM search_documents d, q
+        WHERE d.entity = '{entity}' AND d.document @@ q.query {filters}
+    ) ranked
+    {after}
+    ORDER BY rank DESC, entity_id DESC
+    LIMIT %(limit)s)
+'''
+
+SEARCH_SQL = '''
+    WITH q AS (SELECT search_query(%(q)s) AS query),
+    hits AS ({hits}),
+    page AS (
+        SELECT * FROM hits
+        ORDER BY rank DESC, entity DESC, entity_id DESC
+        LIMIT %(limit)s
+    )
+    SELECT page.entity,
+           page.entity_id AS id,
+           page.rank,
+           COALESCE(c.name, l.name) AS title,
+           ts_headline(
+               'russian',
+               COALESCE(p.content, m.content, c.race || ' ' || c.class || '. ' || c.description, l.type || '. ' || l.description),
+               q.query,
+               %(headline_options)s
+           ) AS headline,
+           COALESCE(p.location_id, m.location_id, l.id) AS location_id,
+           COALESCE(p.character_id, m.character_id, c.id) AS character_id,
+           COALESCE(p.created_at, m.created_at, c.created_at, l.created_at) AS created_at
+    FROM page
+    CROSS JOIN q
+    LEFT JOIN characters c ON page.entity = 'character' AND c.id = page.entity_id
+    LEFT JOIN locations l ON page.entity = 'location' AND l.id = page.entity_id
+    LEFT JOIN posts p ON page.entity = 'post' AND p.id = page.entity_id
+    LEFT JOIN messages m ON page.entity = 'message' AND m.id = page.entity_id
+    ORDER BY page.rank DESC, page.entity DESC, page.entity_id DESC
+'''
+
+
+def encode_search_cursor(rank: float, entity: str, entity_id: int) -> str:
+    raw = f'{rank!r}|{entity}|{entity_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_search_cursor(cursor: str) -> Tuple[float, str, int]:
+    padded = cursor + '=' * (-len(cursor) % 4)
+    rank, entity, entity_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+    if entity not in ENTITIES:
+        raise ValueError('Unknown entity in cursor')
+    return float(rank), entity, int(entity_id)
+
+
+def parse_types(raw: Optional[str]) -> List[str]:
+    if not raw:
+        return list(ENTITIES)
+    types = [value.strip() for value in raw.split(',') if value.strip()]
+    if not types or any(value not in ENTITIES for value in types):
+        raise ValueError(f'types must be a comma-separated subset of {", ".join(ENTITIES)}')
+    return [entity for entity in ENTITIES if entity in types]
+
+
+def build_search_sql(types: List[str], location_id: Optional[str], character_id: Optional[str], after: Optional[Tuple[float, str, int]]) -> str:
+    filters = ''
+    if location_id:
+        filters += ' AND d.location_id = %(location_id)s'
+    if character_id:
+        filters += ' AND d.character_id = %(character_id)s'
+    # rank - real: курсор приводится к тому же типу, иначе сравнение пойдёт в double precision и страница повторит строку
+    keyset = 'WHERE (rank, entity, entity_id) < (%(after_rank)s::real, %(after_entity)s, %(after_id)s)' if after else ''
+    hits = ' UNION ALL '.join(
+        ENTITY_HITS_SQL.format(entity=entity, filters=filters, after=keyset) for entity in types
+    )
+    return SEARCH_SQL.format(hits=hits)
+
+
+@instrumented('search')
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method: str = event.get('httpMethod', 'GET')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+
+    headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*',
+        'Cache-Control': cache_control(method)
+    }
+
+    if method != 'GET':
+        return {
+            'statusCode': 405,
+            'headers': headers,
+            'body': json.dumps({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+
+    query_params = event.get('queryStringParameters') or {}
+    query = (query_params.get('q') or '').strip()
+    location_id = query_params.get('location_id')
+    character_id = query_params.get('character_id')
+
+    try:
+        if not query or len(query) > MAX_QUERY_LENGTH:
+            raise ValueError(f'q must be between 1 and {MAX_QUERY_LENGTH} characters')
+        if (location_id and not location_id.isdigit()) or (character_id and not character_id.isdigit()):
+            raise ValueError('location_id and character_id must be integers')
+        types = parse_types(query_params.get('types'))
+        limit = parse_limit(query_params, DEFAULT_LIMIT, MAX_LIMIT)
+        after = decode_search_cursor(query_params['after']) if query_params.get('after') else None
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+
+    params = {
+        'q': query,
+        'location_id': location_id,
+        'character_id': character_id,
+        'limit': limit + 1,
+        'headline_options': HEADLINE_OPTIONS,
+    }
+    if after:
+        params.update({'after_rank': after[0], 'after_entity': after[1], 'after_id': after[2]})
+
+    from psycopg2 import errors
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute('SET LOCAL statement_timeout = %s', (STATEMENT_TIMEOUT_MS,))
+        cur.execute(build_search_sql(types, location_id, character_id, after), params)
+        columns = [column.name for column in cur.description]
+        results = cur.fetchall()
+        cur.close()
+        release_db_connection(conn)
+
+        cursor = None
+        if len(results) > limit:
+            last = results[limit - 1]
+            cursor = encode_search_cursor(last[2], last[0], last[1])
+
+        return {
+            'statusCode': 200,
+            'headers': headers,
+            'body': '{"results":' + encode_rows(columns, results[:limit])
+                    + ',"next_cursor":' + json.dumps(cursor) + '}',
+            'isBase64Encoded': False
+        }
+
+    except errors.QueryCanceled as e:
+        record_error(e)
+        release_db_connection(conn)
+        return {
+            'statusCode': 503,
+            'headers': headers,
+            'body': json.dumps({'error': 'Search took too long, try a more specific query'}),
+            'isBase64Encoded': False
+        }
+
+    except Exception as e:
+        record_error(e)
+        release_db_connection(conn)
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
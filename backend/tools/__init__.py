@@ -0,0 +1,3 @@
+'''
+Business: Служебные команды обслуживания БД - запускаются из каталога backend через python -m tools.<команда>
+'''
@@ -0,0 +1,34 @@
+'''
+Business: Обрезка материализованных лент feed_items - старые записи и хвост сверх лимита на пользователя
+Args: --max-items, --max-age-days (по умолчанию FEED_MAX_ITEMS / FEED_MAX_AGE_DAYS); DATABASE_URL из окружения
+Returns: JSON-строка с числом удалённых записей; запускается по расписанию
+'''
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.db import db_connection
+from common.feed import MAX_ITEMS, MAX_AGE_DAYS, trim_feed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Trim old and excess rows from feed_items')
+    parser.add_argument('--max-items', type=int, default=MAX_ITEMS, help='rows kept per user')
+    parser.add_argument('--max-age-days', type=int, default=MAX_AGE_DAYS)
+    args = parser.parse_args()
+    
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            deleted = trim_feed(cur, args.max_items, args.max_age_days)
+        conn.commit()
+    
+    print(json.dumps(deleted))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
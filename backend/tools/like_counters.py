@@ -0,0 +1,67 @@
+'''
+Business: Свёртка шардов лайков в posts.likes и проверка счётчиков по post_likes
+Args: --batch-size (постов за транзакцию), --verify чтобы сверить суммы с post_likes; DATABASE_URL из окружения
+Returns: JSON-строка с числом свёрнутых постов; при --verify строка на каждое расхождение и код выхода 1
+'''
+
+import argparse
+import json
+import os
+import sys
+from typing import Dict, Any, List
+
+from psycopg2.extras import RealDictCursor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.db import db_connection
+from common.likes import fold_shards
+
+DRIFT_QUERY = '''
+    SELECT p.id,
+           COALESCE(p.likes, 0) + COALESCE(s.shard_likes, 0) AS likes,
+           COALESCE(l.actual_likes, 0) AS actual_likes
+    FROM posts p
+    LEFT JOIN (SELECT post_id, SUM(likes) AS shard_likes FROM post_like_shards GROUP BY post_id) s ON s.post_id = p.id
+    LEFT JOIN (SELECT post_id, COUNT(*) AS actual_likes FROM post_likes GROUP BY post_id) l ON l.post_id = p.id
+    WHERE COALESCE(p.likes, 0) + COALESCE(s.shard_likes, 0) <> COALESCE(l.actual_likes, 0)
+    ORDER BY p.id
+'''
+
+
+def find_drift(cur) -> List[Dict[str, Any]]:
+    cur.execute(DRIFT_QUERY)
+    return [dict(row) for row in cur.fetchall()]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Fold post_like_shards into posts.likes')
+    parser.add_argument('--batch-size', type=int, default=1000, help='posts folded per transaction')
+    parser.add_argument('--verify', action='store_true', help='compare counters with post_likes afterwards')
+    args = parser.parse_args()
+    
+    folded = 0
+    drift: List[Dict[str, Any]] = []
+    with db_connection() as conn:
+        # Короткие транзакции: каждая держит блокировки строк постов только на свой батч
+        with conn.cursor() as cur:
+            while True:
+                updated = fold_shards(cur, args.batch_size)
+                conn.commit()
+                folded += updated
+                if updated < args.batch_size:
+                    break
+        
+        if args.verify:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                drift = find_drift(cur)
+            conn.rollback()
+            for row in drift:
+                print(json.dumps(row, default=str))
+    
+    print(json.dumps({'folded_posts': folded}))
+    return 1 if drift else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,52 @@
+'''
+Business: Локальная реплика для проверки чтения с реплик - второй экземпляр Postgres с потоковой репликацией от DATABASE_URL
+Args: --data-dir (каталог новой реплики), --port, --stop; DATABASE_URL (роль с правом REPLICATION, pg_hba разрешает replication) из окружения
+Returns: JSON-строка с DATABASE_READ_URLS для запуска функций, harness и бенчмарков; --stop останавливает реплику
+'''
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+from urllib.parse import urlsplit, urlunsplit
+
+
+def replica_url(primary_url: str, port: int) -> str:
+    parts = urlsplit(primary_url)
+    credentials = parts.netloc.rsplit('@', 1)[0] + '@' if '@' in parts.netloc else ''
+    return urlunsplit((parts.scheme, f'{credentials}127.0.0.1:{port}', parts.path, parts.query, parts.fragment))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Start a local streaming replica of DATABASE_URL')
+    parser.add_argument('--data-dir', default=os.path.join(os.getcwd(), '.replica'))
+    parser.add_argument('--port', type=int, default=5433)
+    parser.add_argument('--stop', action='store_true', help='stop the replica started earlier')
+    args = parser.parse_args()
+
+    for binary in ('pg_basebackup', 'pg_ctl'):
+        if shutil.which(binary) is None:
+            print(f'{binary} not found in PATH', file=sys.stderr)
+            return 1
+
+    if args.stop:
+        return subprocess.call(['pg_ctl', '-D', args.data_dir, 'stop', '-m', 'fast'])
+
+    if not os.path.exists(os.path.join(args.data_dir, 'PG_VERSION')):
+        # -R пишет standby.signal и primary_conninfo: каталог сразу стартует репликой
+        subprocess.check_call([
+            'pg_basebackup', '-d', os.environ['DATABASE_URL'], '-D', args.data_dir, '-R', '-X', 'stream', '-c', 'fast'
+        ])
+    subprocess.check_call([
+        'pg_ctl', '-D', args.data_dir, '-l', os.path.join(args.data_dir, 'replica.log'),
+        '-o', f'-p {args.port} -k {args.data_dir}', '-w', 'start'
+    ])
+
+    print(json.dumps({'DATABASE_READ_URLS': replica_url(os.environ['DATABASE_URL'], args.port)}))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,87 @@
+'''
+Business: Проверка и починка денормализованных счётчиков сообщений в locations
+Args: --repair чтобы исправить расхождения, иначе только отчёт; DATABASE_URL из окружения
+Returns: JSON-строка на каждую локацию с расхождением, код выхода 1 если расхождения остались
+'''
+
+import argparse
+import json
+import os
+import sys
+from typing import Dict, Any, List
+
+from psycopg2.extras import RealDictCursor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.db import db_connection
+
+DRIFT_QUERY = '''
+    SELECT l.id,
+           l.message_count,
+           COALESCE(s.actual_count, 0) AS actual_count,
+           l.last_message_at,
+           s.actual_last_message_at
+    FROM locations l
+    LEFT JOIN (
+        SELECT location_id, COUNT(*) AS actual_count, MAX(created_at) AS actual_last_message_at
+        FROM messages
+        GROUP BY location_id
+    ) s ON s.location_id = l.id
+    WHERE l.message_count <> COALESCE(s.actual_count, 0)
+       OR l.last_message_at IS DISTINCT FROM s.actual_last_message_at
+    ORDER BY l.id
+'''
+
+
+def find_drift(cur) -> List[Dict[str, Any]]:
+    cur.execute(DRIFT_QUERY)
+    return [dict(row) for row in cur.fetchall()]
+
+
+def repair_location(conn, location_id: int) -> None:
+    '''
+    Блокировка строки локации упорядочивает починку с POST-ом сообщений:
+    он обновляет ту же строку в своей транзакции, поэтому пересчёт не теряет вставки
+    '''
+    with conn.cursor() as cur:
+        cur.execute('SELECT id FROM locations WHERE id = %s FOR UPDATE', (location_id,))
+        cur.execute(
+            '''UPDATE locations l
+               SET message_count = s.actual_count,
+                   last_message_at = s.actual_last_message_at
+               FROM (
+                   SELECT COUNT(*) AS actual_count, MAX(created_at) AS actual_last_message_at
+                   FROM messages WHERE location_id = %s
+               ) s
+               WHERE l.id = %s''',
+            (location_id, location_id)
+        )
+    conn.commit()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Check or repair locations.message_count / last_message_at')
+    parser.add_argument('--repair', action='store_true', help='rewrite drifted counters from messages')
+    args = parser.parse_args()
+    
+    with db_connection() as conn:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        drift = find_drift(cur)
+        conn.rollback()
+        
+        for row in drift:
+            print(json.dumps(row, default=str))
+            if args.repair:
+                repair_location(conn, row['id'])
+        
+        if args.repair and drift:
+            drift = find_drift(cur)
+            conn.rollback()
+        cur.close()
+    
+    return 1 if drift else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
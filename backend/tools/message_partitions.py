@@ -0,0 +1,137 @@
+'''
+Business: Обслуживание партиций messages - создание месяцев вперёд, запись диапазонов id и архивация старых месяцев
+Args: --months-ahead, --archive-after-months (без него архивации нет), --archive-dir; DATABASE_URL из окружения
+Returns: JSON-строка на каждое действие; архив - gzip CSV партиции, после проверки числа строк партиция удаляется
+'''
+
+import argparse
+import gzip
+import json
+import os
+import sys
+from typing import Dict, Any, List
+
+from psycopg2 import sql
+from psycopg2.extras import RealDictCursor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.db import db_connection
+
+LOCK_TIMEOUT = os.environ.get('PARTITION_LOCK_TIMEOUT', '5s')
+
+
+def ensure_partitions(conn, months_ahead: int) -> List[str]:
+    with conn.cursor() as cur:
+        cur.execute(
+            '''SELECT create_messages_partition(date_trunc('month', LOCALTIMESTAMP) + ahead * INTERVAL '1 month')
+               FROM generate_series(0, %s) ahead''',
+            (months_ahead,)
+        )
+        names = [row[0] for row in cur.fetchall()]
+    conn.commit()
+    return names
+
+
+def record_id_ranges(conn) -> int:
+    '''
+    MIN/MAX(id) живых сообщений каждой начавшейся партиции, без загруженных импортом. Диапазон, записанный
+    через сутки после конца месяца, окончательный; до этого месяц входит в нижнюю границу каждого опроса чата,
+    поэтому запускать не реже раза в сутки
+    '''
+    with conn.cursor() as cur:
+        cur.execute('SELECT record_message_partition_ids()')
+        recorded = cur.fetchone()[0]
+    conn.commit()
+    return recorded
+
+
+def archivable(conn, archive_after_months: int) -> List[Dict[str, Any]]:
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(
+            '''SELECT name, starts_at, ends_at FROM message_partitions
+               WHERE archived_at IS NULL
+                 AND ends_at <= date_trunc('month', LOCALTIMESTAMP) - %s * INTERVAL '1 month'
+               ORDER BY starts_at''',
+            (archive_after_months,)
+        )
+        partitions = [dict(row) for row in cur.fetchall()]
+    conn.rollback()
+    return partitions
+
+
+def archive_partition(conn, name: str, archive_dir: str) -> Dict[str, Any]:
+    '''
+    Экспорт идёт, пока партиция ещё подключена: сообщения не редактируются, а при сбое
+    чат не теряет историю. Отключение, чистка производных данных и DROP - одна транзакция
+    '''
+    table = sql.Identifier(name)
+    path = os.path.join(archive_dir, f'{name}.csv.gz')
+    partial_path = path + '.partial'
+    with conn.cursor() as cur, gzip.open(partial_path, 'wt', encoding='utf-8') as archive:
+        cur.copy_expert(
+            sql.SQL('COPY (SELECT * FROM {} ORDER BY id) TO STDOUT WITH (FORMAT csv, HEADER)').format(table).as_string(conn),
+            archive
+        )
+        exported = cur.rowcount
+    conn.rollback()
+    os.replace(partial_path, path)
+
+    with conn.cursor() as cur:
+        cur.execute('SET LOCAL lock_timeout = %s', (LOCK_TIMEOUT,))
+        cur.execute(sql.SQL('ALTER TABLE messages DETACH PARTITION {}').format(table))
+        cur.execute(sql.SQL('SELECT COUNT(*) FROM {}').format(table))
+        count = cur.fetchone()[0]
+        if count != exported:
+            conn.rollback()
+            raise RuntimeError(f'{name}: exported {exported} rows but the partition has {count}')
+
+        cur.execute(sql.SQL('''
+            DELETE FROM search_documents d USING {} m
+            WHERE d.entity = 'message' AND d.entity_id = m.id
+        ''').format(table))
+        # Счётчики чата отражают доступную историю - иначе location_counters увидит расхождение
+        cur.execute(sql.SQL('''
+            UPDATE locations l
+            SET message_count = GREATEST(l.message_count - s.archived, 0),
+                last_message_at = CASE WHEN l.message_count - s.archived > 0 THEN l.last_message_at END
+            FROM (SELECT location_id, COUNT(*) AS archived FROM {} GROUP BY location_id) s
+            WHERE l.id = s.location_id
+        ''').format(table))
+        cur.execute(sql.SQL('DROP TABLE {}').format(table))
+        cur.execute(
+            'UPDATE message_partitions SET archived_at = LOCALTIMESTAMP, archive_path = %s WHERE name = %s',
+            (path, name)
+        )
+    conn.commit()
+    return {'archived': name, 'rows': exported, 'path': path}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Create upcoming messages partitions and archive old ones')
+    parser.add_argument('--months-ahead', type=int, default=3)
+    parser.add_argument('--archive-after-months', type=int, help='archive partitions that ended this many months ago')
+    parser.add_argument('--archive-dir', default='message_archive')
+    args = parser.parse_args()
+
+    with db_connection() as conn:
+        print(json.dumps({'ensured': ensure_partitions(conn, args.months_ahead)}))
+        print(json.dumps({'partitions_with_id_ranges': record_id_ranges(conn)}))
+
+        if args.archive_after_months is not None:
+            os.makedirs(args.archive_dir, exist_ok=True)
+            for partition in archivable(conn, args.archive_after_months):
+                print(json.dumps(archive_partition(conn, partition['name'], args.archive_dir)))
+
+        with conn.cursor() as cur:
+            cur.execute('SELECT COUNT(*) FROM messages_default')
+            stray = cur.fetchone()[0]
+        conn.rollback()
+        if stray:
+            print(json.dumps({'warning': 'messages_default is not empty', 'rows': stray}))
+
+    return 1 if stray else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+'''
+Business: Самостоятельный запуск всех функций одним сервером - WSGI-роутер, пре-форк воркеры на ядра и потоки в каждом
+Args: --host, --port, --workers (по умолчанию число ядер), --functions (через запятую, по умолчанию все), --access-log, --asgi (uvicorn: async-функции в event loop воркера); DATABASE_URL и DB_POOL_MAX_SIZE (на воркер) из окружения
+Returns: слушает порт до SIGINT/SIGTERM; каждая функция доступна по /<имя> и по /<id из func2url.json>
+'''
+
+import argparse
+import os
+import signal
+import socketserver
+import sys
+from typing import List, Optional
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.router import BACKEND_DIR, create_app
+
+
+class ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    # Long-poll чата держит поток до 25 секунд, но не соединение из пула
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs) -> None:
+        pass
+
+
+def run_worker(server: WSGIServer, functions: Optional[List[str]]) -> None:
+    '''Функции загружаются после fork: у каждого воркера свой пул и свои соединения'''
+    server.set_app(create_app(functions))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def run_asgi(args: argparse.Namespace) -> int:
+    try:
+        import uvicorn
+    except ImportError:
+        print('--asgi needs uvicorn: pip install uvicorn', file=sys.stderr)
+        return 1
+    if args.functions:
+        # Фабрику вызывает каждый воркер uvicorn в своём процессе - список передаётся через окружение
+        os.environ['ROUTER_FUNCTIONS'] = ','.join(args.functions)
+    uvicorn.run(
+        'common.router:create_asgi_app', factory=True, app_dir=BACKEND_DIR,
+        host=args.host, port=args.port, workers=args.workers,
+        access_log=args.access_log, log_level='info' if args.access_log else 'warning'
+    )
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Serve every backend function from one process')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--functions', type=lambda value: value.split(','), help='default: every directory with index.py')
+    parser.add_argument('--access-log', action='store_true')
+    parser.add_argument('--asgi', action='store_true', help='serve through uvicorn; async handlers run on its event loop')
+    args = parser.parse_args()
+
+    if args.asgi:
+        return run_asgi(args)
+
+    handler_class = WSGIRequestHandler if args.access_log else QuietRequestHandler
+    # Сокет слушает родитель: воркеры наследуют его и принимают соединения наперегонки
+    server = make_server(args.host, args.port, None, server_class=ThreadingWSGIServer, handler_class=handler_class)
+    if args.workers <= 1:
+        run_worker(server, args.functions)
+        return 0
+
+    children = []
+    for _ in range(args.workers):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            run_worker(server, args.functions)
+            os._exit(0)
+        children.append(pid)
+
+    def stop(signum, frame) -> None:
+        for child in children:
+            try:
+                os.kill(child, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    exit_code = 0
+    for child in children:
+        while True:
+            try:
+                _, status = os.waitpid(child, 0)
+                break
+            except InterruptedError:
+                continue
+        if os.waitstatus_to_exitcode(status) not in (0, -signal.SIGTERM):
+            exit_code = 1
+    server.server_close()
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,305 @@
+'''
+Business: Снимок локации для архива или переноса кампании - чат, посты и их персонажи в сжатом NDJSON
+Args: export --location-id N --output путь (.gz - gzip); import путь [--user-id владелец] [--name новое имя]; DATABASE_URL из окружения
+Returns: JSON-строка с числом строк по таблицам, байтами, временем и rows/s; import - id новой локации
+
+Строки не проходят через Python: COPY (SELECT to_jsonb(...)) TO STDOUT пишет готовые строки
+NDJSON прямо в gzip, а импорт - COPY FROM STDIN во временную таблицу и перенос одним
+INSERT ... SELECT на таблицу. Память постоянна при любом размере чата.
+Импорт всегда создаёт новую локацию и новых персонажей: id переназначаются, ссылки
+сообщений и постов переписываются через временную таблицу character_map
+'''
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, BinaryIO, Optional
+
+import psycopg2
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.db import db_connection
+
+SNAPSHOT_VERSION = 1
+TABLES = ['locations', 'characters', 'posts', 'messages']
+
+# CSV с разделителем и кавычкой из управляющих символов: в тексте JSON они всегда экранированы,
+# поэтому строки идут через COPY без кавычек и экранирования - ровно как NDJSON
+COPY_OPTIONS = r"WITH (FORMAT csv, DELIMITER E'\x02', QUOTE E'\x01')"
+
+EXPORT_QUERIES = {
+    'locations': 'SELECT l.* FROM locations l WHERE l.id = %(location_id)s',
+    'characters': '''
+        SELECT c.* FROM characters c
+        WHERE c.id IN (
+            SELECT character_id FROM messages WHERE location_id = %(location_id)s
+            UNION
+            SELECT character_id FROM posts WHERE location_id = %(location_id)s
+        )
+        ORDER BY c.id
+    ''',
+    # Лайки - свёрнутое значение плюс шарды: отдельные post_likes ссылаются на пользователей и не переносятся
+    'posts': '''
+        SELECT p.id, p.character_id, p.location_id, p.content,
+               p.likes + COALESCE((SELECT SUM(s.likes) FROM post_like_shards s WHERE s.post_id = p.id), 0) AS likes,
+               p.created_at
+        FROM posts p
+        WHERE p.location_id = %(location_id)s
+        ORDER BY p.id
+    ''',
+    'messages': 'SELECT m.* FROM messages m WHERE m.location_id = %(location_id)s ORDER BY m.id',
+}
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class LineCounter:
+    '''Поток COPY идёт в архив как есть; считаются только переводы строк'''
+
+    def __init__(self, target: BinaryIO):
+        self.target = target
+        self.lines = 0
+
+    def write(self, data: bytes) -> int:
+        self.lines += data.count(b'\n')
+        return self.target.write(data)
+
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def open_archive(path: str, mode: str, compressed: bool = False) -> BinaryIO:
+    '''Запись сжимает по флагу (имя .partial ничего не говорит о формате), чтение - по первым байтам файла'''
+    if mode == 'r':
+        with open(path, 'rb') as probe:
+            compressed = probe.read(2) == GZIP_MAGIC
+        return gzip.open(path, 'rb') if compressed else open(path, 'rb')
+    return gzip.open(path, 'wb', compresslevel=6) if compressed else open(path, 'wb')
+
+
+def export_location(conn, location_id: int, path: str) -> Dict[str, Any]:
+    started = time.perf_counter()
+    rows: Dict[str, int] = {}
+    partial_path = path + '.partial'
+    # REPEATABLE READ: все четыре COPY видят один снимок базы, даже если чат в это время пишут
+    conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+    try:
+        with conn.cursor() as cur, open_archive(partial_path, 'w', path.endswith('.gz')) as archive:
+            header = {
+                'snapshot': SNAPSHOT_VERSION,
+                'location_id': location_id,
+                'exported_at': datetime.now(timezone.utc).isoformat(),
+                'tables': TABLES,
+            }
+            archive.write(json.dumps(header).encode() + b'\n')
+            for table in TABLES:
+                query = cur.mogrify(EXPORT_QUERIES[table], {'location_id': location_id}).decode()
+                counter = LineCounter(archive)
+                cur.copy_expert(
+                    f"COPY (SELECT json_build_object('t', '{table}', 'r', to_jsonb(x))::text FROM ({query}) x) "
+                    f'TO STDOUT {COPY_OPTIONS}',
+                    counter
+                )
+                rows[table] = counter.lines
+            if not rows['locations']:
+                raise SnapshotError(f'Location {location_id} not found')
+            archive.write(json.dumps({'t': 'end', 'rows': rows}).encode() + b'\n')
+    except Exception:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    finally:
+        conn.rollback()
+        conn.set_session(isolation_level='DEFAULT', readonly='DEFAULT')
+    os.replace(partial_path, path)
+
+    elapsed = time.perf_counter() - started
+    total = sum(rows.values())
+    return {
+        'exported': location_id,
+        'path': path,
+        'rows': rows,
+        'bytes': os.path.getsize(path),
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(total / elapsed) if elapsed else total,
+    }
+
+
+IMPORT_STEPS = [
+    ('character_map', '''
+        CREATE TEMP TABLE character_map ON COMMIT DROP AS
+        SELECT (line->'r'->>'id')::int AS old_id, nextval(pg_get_serial_sequence('characters', 'id')) AS new_id
+        FROM snapshot_rows
+        WHERE line->>'t' = 'characters'
+    '''),
+    ('character_map_index', 'CREATE UNIQUE INDEX ON character_map (old_id); ANALYZE character_map'),
+    ('characters', '''
+        INSERT INTO characters (id, user_id, name, avatar, race, class, description, created_at)
+        SELECT cm.new_id, COALESCE(u.id, %(owner_id)s), c.name, c.avatar, c.race, c.class, c.description, c.created_at
+        FROM snapshot_rows s
+        CROSS JOIN LATERAL jsonb_populate_record(NULL::characters, s.line->'r') c
+        JOIN character_map cm ON cm.old_id = c.id
+        LEFT JOIN users u ON u.id = c.user_id
+        WHERE s.line->>'t' = 'characters'
+    '''),
+    # ORDER BY старого id: новые id растут в том же порядке, на этом держатся курсоры ленты и чата
+    ('posts', '''
+        INSERT INTO posts (character_id, location_id, content, likes, created_at)
+        SELECT cm.new_id, %(location_id)s, p.content, p.likes, p.created_at
+        FROM snapshot_rows s
+        CROSS JOIN LATERAL jsonb_populate_record(NULL::posts, s.line->'r') p
+        JOIN character_map cm ON cm.old_id = p.character_id
+        WHERE s.line->>'t' = 'posts'
+        ORDER BY p.id
+    '''),
+    ('messages', '''
+        INSERT INTO messages (character_id, location_id, content, created_at)
+        SELECT cm.new_id, %(location_id)s, m.content, m.created_at
+        FROM snapshot_rows s
+        CROSS JOIN LATERAL jsonb_populate_record(NULL::messages, s.line->'r') m
+        JOIN character_map cm ON cm.old_id = m.character_id
+        WHERE s.line->>'t' = 'messages'
+        ORDER BY m.id
+    '''),
+    # Старые месяцы получили новые, большие id: их диапазоны записываются для этой локации в той же транзакции.
+    # Иначе message_id_floor/message_id_ceiling отсекут сообщения от курсоров чата, а в общем диапазоне
+    # месяца они утянули бы нижнюю границу опроса всех остальных чатов в этот месяц
+    ('partition_loads', 'SELECT record_message_partition_load(%(location_id)s)'),
+    # Счётчики чата пишет POST-путь, не триггер - после массовой вставки их нужно выставить самим
+    ('counters', '''
+        UPDATE locations l
+        SET message_count = s.message_count, last_message_at = s.last_message_at
+        FROM (
+            SELECT COUNT(*) AS message_count, MAX(created_at) AS last_message_at
+            FROM messages WHERE location_id = %(location_id)s
+        ) s
+        WHERE l.id = %(location_id)s
+    '''),
+]
+
+
+def _ensure_message_partitions(cur) -> None:
+    '''
+    Месяцы истории без своей партиции создаются заранее, иначе строки осядут в messages_default.
+    Если в default уже есть строки этого месяца, PostgreSQL не даст создать партицию - тогда
+    сообщения идут в default, как и раньше, и tools/message_partitions.py о них предупредит
+    '''
+    cur.execute('''
+        SELECT DISTINCT date_trunc('month', (line->'r'->>'created_at')::timestamp) AS month_start
+        FROM snapshot_rows
+        WHERE line->>'t' = 'messages'
+        EXCEPT
+        SELECT starts_at FROM message_partitions WHERE archived_at IS NULL
+    ''')
+    for (month_start,) in cur.fetchall():
+        cur.execute('SAVEPOINT create_partition')
+        try:
+            cur.execute('SELECT create_messages_partition(%s)', (month_start,))
+            cur.execute('RELEASE SAVEPOINT create_partition')
+        except psycopg2.Error:
+            cur.execute('ROLLBACK TO SAVEPOINT create_partition')
+
+
+def import_snapshot(conn, path: str, owner_id: Optional[int] = None, name: Optional[str] = None) -> Dict[str, Any]:
+    started = time.perf_counter()
+    try:
+        with open_archive(path, 'r') as archive:
+            header = json.loads(archive.readline() or b'{}')
+            if header.get('snapshot') != SNAPSHOT_VERSION:
+                raise SnapshotError(f'{path} is not a version {SNAPSHOT_VERSION} snapshot')
+
+            with conn.cursor() as cur:
+                cur.execute('CREATE TEMP TABLE snapshot_rows (line jsonb NOT NULL) ON COMMIT DROP')
+                # Остаток файла после заголовка уходит в COPY как есть, вместе с замыкающей строкой end
+                cur.copy_expert(f'COPY snapshot_rows (line) FROM STDIN {COPY_OPTIONS}', archive)
+        copied = time.perf_counter()
+
+        with conn.cursor() as cur:
+            cur.execute("SELECT line->>'t', COUNT(*) FROM snapshot_rows GROUP BY 1")
+            staged = dict(cur.fetchall())
+            cur.execute("SELECT line->'rows' FROM snapshot_rows WHERE line->>'t' = 'end'")
+            trailer = cur.fetchone()
+            expected = trailer[0] if trailer else None
+            if expected is None or any(staged.get(table, 0) != expected.get(table, 0) for table in TABLES):
+                raise SnapshotError(f'{path} is truncated: expected {expected}, read {staged}')
+
+            cur.execute('''
+                SELECT COUNT(*) FROM snapshot_rows s
+                LEFT JOIN users u ON u.id = (s.line->'r'->>'user_id')::int
+                WHERE s.line->>'t' IN ('locations', 'characters') AND u.id IS NULL
+            ''')
+            if cur.fetchone()[0] and owner_id is None:
+                raise SnapshotError('Snapshot owners do not exist in this database: pass --user-id')
+
+            cur.execute('''
+                INSERT INTO locations (user_id, name, type, description, created_at)
+                SELECT COALESCE(u.id, %(owner_id)s), COALESCE(%(name)s, l.name), l.type, l.description, l.created_at
+                FROM snapshot_rows s
+                CROSS JOIN LATERAL jsonb_populate_record(NULL::locations, s.line->'r') l
+                LEFT JOIN users u ON u.id = l.user_id
+                WHERE s.line->>'t' = 'locations'
+                RETURNING id
+            ''', {'owner_id': owner_id, 'name': name})
+            location_id = cur.fetchone()[0]
+
+            _ensure_message_partitions(cur)
+            params = {'owner_id': owner_id, 'location_id': location_id}
+            timings: Dict[str, float] = {}
+            for step, statement in IMPORT_STEPS:
+                step_started = time.perf_counter()
+                cur.execute(statement, params)
+                timings[step] = round(time.perf_counter() - step_started, 3)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    elapsed = time.perf_counter() - started
+    rows = {table: staged.get(table, 0) for table in TABLES}
+    total = sum(rows.values())
+    return {
+        'imported': path,
+        'location_id': location_id,
+        'source_location_id': header.get('location_id'),
+        'rows': rows,
+        'copy_seconds': round(copied - started, 3),
+        'step_seconds': timings,
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(total / elapsed) if elapsed else total,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Export a location with its chat, posts and characters, or import such a snapshot')
+    commands = parser.add_subparsers(dest='command', required=True)
+    export_parser = commands.add_parser('export')
+    export_parser.add_argument('--location-id', type=int, required=True)
+    export_parser.add_argument('--output', help='default: location_<id>.ndjson.gz')
+    import_parser = commands.add_parser('import')
+    import_parser.add_argument('path')
+    import_parser.add_argument('--user-id', type=int, help='owner for rows whose users do not exist here')
+    import_parser.add_argument('--name', help='name of the new location; default: the exported name')
+    args = parser.parse_args()
+
+    try:
+        with db_connection() as conn:
+            if args.command == 'export':
+                result = export_location(conn, args.location_id, args.output or f'location_{args.location_id}.ndjson.gz')
+            else:
+                result = import_snapshot(conn, args.path, args.user_id, args.name)
+    except SnapshotError as e:
+        print(json.dumps({'error': str(e)}), file=sys.stderr)
+        return 1
+    print(json.dumps(result))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,2 @@
+-- Composite index for keyset pagination of the posts feed
+CREATE INDEX IF NOT EXISTS idx_posts_created_at_id ON posts(created_at DESC, id DESC);
\ No newline at end of file
@@ -0,0 +1,5 @@
+-- Composite index for incremental (after_id) and scrollback (before_id) chat reads
+CREATE INDEX IF NOT EXISTS idx_messages_location_id_id ON messages(location_id, id);
+
+-- The composite index covers every lookup the single-column one served
+DROP INDEX IF EXISTS idx_messages_location_id;
\ No newline at end of file
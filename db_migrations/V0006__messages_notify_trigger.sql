@@ -0,0 +1,15 @@
+-- Notify long-polling chat readers once per INSERT statement and location
+CREATE OR REPLACE FUNCTION notify_location_messages() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('location_messages', location_id::text)
+    FROM (SELECT DISTINCT location_id FROM new_messages) AS touched;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS messages_notify ON messages;
+CREATE TRIGGER messages_notify
+    AFTER INSERT ON messages
+    REFERENCING NEW TABLE AS new_messages
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_location_messages();
\ No newline at end of file
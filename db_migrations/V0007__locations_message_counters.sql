@@ -0,0 +1,17 @@
+-- Denormalized chat counters for the locations list, maintained by the messages POST path
+ALTER TABLE locations ADD COLUMN IF NOT EXISTS message_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE locations ADD COLUMN IF NOT EXISTS last_message_at TIMESTAMP;
+
+-- Backfill counters from existing messages
+UPDATE locations l
+SET message_count = s.message_count,
+    last_message_at = s.last_message_at
+FROM (
+    SELECT location_id, COUNT(*) AS message_count, MAX(created_at) AS last_message_at
+    FROM messages
+    GROUP BY location_id
+) s
+WHERE l.id = s.location_id;
+
+-- Index for the locations list ordering
+CREATE INDEX IF NOT EXISTS idx_locations_created_at ON locations(created_at DESC);
\ No newline at end of file
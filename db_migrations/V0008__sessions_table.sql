@@ -0,0 +1,20 @@
+-- Per-device sessions with expiry; several sessions per user are allowed
+CREATE TABLE IF NOT EXISTS sessions (
+    token VARCHAR(255) PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON sessions(user_id);
+CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions(expires_at);
+
+-- Carry over tokens issued before sessions existed
+INSERT INTO sessions (token, user_id, expires_at)
+SELECT session_token, id, CURRENT_TIMESTAMP + INTERVAL '30 days'
+FROM users
+WHERE session_token IS NOT NULL
+ON CONFLICT (token) DO NOTHING;
+
+-- Legacy column is no longer written, but keep any remaining lookups index-backed
+CREATE UNIQUE INDEX IF NOT EXISTS idx_users_session_token ON users(session_token);
\ No newline at end of file
@@ -0,0 +1,38 @@
+-- Per-table version counters for cheap ETags, bumped once per modifying statement
+CREATE TABLE IF NOT EXISTS table_versions (
+    table_name VARCHAR(64) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO table_versions (table_name)
+VALUES ('characters'), ('locations'), ('posts')
+ON CONFLICT (table_name) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE table_name = TG_TABLE_NAME;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS characters_version ON characters;
+CREATE TRIGGER characters_version
+    AFTER INSERT OR UPDATE OR DELETE ON characters
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION bump_table_version();
+
+-- Counter updates from chat posts are excluded so they do not serialize on the version row;
+-- the locations list ETag covers them through max(last_message_at) instead
+DROP TRIGGER IF EXISTS locations_version ON locations;
+CREATE TRIGGER locations_version
+    AFTER INSERT OR DELETE OR UPDATE OF user_id, name, type, description ON locations
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION bump_table_version();
+
+DROP TRIGGER IF EXISTS posts_version ON posts;
+CREATE TRIGGER posts_version
+    AFTER INSERT OR UPDATE OR DELETE ON posts
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION bump_table_version();
+
+CREATE INDEX IF NOT EXISTS idx_locations_last_message_at ON locations(last_message_at DESC NULLS LAST);
\ No newline at end of file
@@ -0,0 +1,204 @@
+-- Full-text search index over characters, locations, posts and messages.
+-- Vectors live in one side table instead of columns on the source tables so that the
+-- existing SELECT * list endpoints do not start shipping tsvectors to the client
+CREATE TABLE IF NOT EXISTS search_documents (
+    entity VARCHAR(16) NOT NULL,
+    entity_id INTEGER NOT NULL,
+    location_id INTEGER,
+    character_id INTEGER,
+    document TSVECTOR NOT NULL,
+    PRIMARY KEY (entity, entity_id)
+);
+
+-- Russian stems for inflected words plus simple lexemes for names, foreign words and stop words
+CREATE OR REPLACE FUNCTION search_vector(weight "char", body TEXT) RETURNS TSVECTOR AS $$
+    SELECT setweight(
+        to_tsvector('russian'::regconfig, COALESCE(body, '')) || to_tsvector('simple'::regconfig, COALESCE(body, '')),
+        weight
+    )
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION search_query(query TEXT) RETURNS TSQUERY AS $$
+    SELECT websearch_to_tsquery('russian'::regconfig, query) || websearch_to_tsquery('simple'::regconfig, query)
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION character_document(character_name TEXT, race TEXT, character_class TEXT, description TEXT) RETURNS TSVECTOR AS $$
+    SELECT search_vector('A', character_name)
+        || search_vector('B', race || ' ' || character_class)
+        || search_vector('C', description)
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION location_document(location_name TEXT, location_type TEXT, description TEXT) RETURNS TSVECTOR AS $$
+    SELECT search_vector('A', location_name) || search_vector('B', location_type) || search_vector('C', description)
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Inserts are indexed once per statement from the transition table, so batch ingestion
+-- pays one INSERT ... SELECT; updates of the indexed columns and deletes are rare and go row by row
+CREATE OR REPLACE FUNCTION search_index_characters() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM search_documents WHERE entity = 'character' AND entity_id = OLD.id;
+    ELSIF TG_LEVEL = 'STATEMENT' THEN
+        INSERT INTO search_documents (entity, entity_id, location_id, character_id, document)
+        SELECT 'character', n.id, NULL, n.id, character_document(n.name, n.race, n.class, n.description) FROM new_rows n
+        ON CONFLICT (entity, entity_id) DO UPDATE SET document = EXCLUDED.document;
+    ELSE
+        UPDATE search_documents SET document = character_document(NEW.name, NEW.race, NEW.class, NEW.description)
+        WHERE entity = 'character' AND entity_id = NEW.id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION search_index_locations() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM search_documents WHERE entity = 'location' AND entity_id = OLD.id;
+    ELSIF TG_LEVEL = 'STATEMENT' THEN
+        INSERT INTO search_documents (entity, entity_id, location_id, character_id, document)
+        SELECT 'location', n.id, n.id, NULL, location_document(n.name, n.type, n.description) FROM new_rows n
+        ON CONFLICT (entity, entity_id) DO UPDATE SET document = EXCLUDED.document;
+    ELSE
+        UPDATE search_documents SET document = location_document(NEW.name, NEW.type, NEW.description)
+        WHERE entity = 'location' AND entity_id = NEW.id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION search_index_posts() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM search_documents WHERE entity = 'post' AND entity_id = OLD.id;
+    ELSIF TG_LEVEL = 'STATEMENT' THEN
+        INSERT INTO search_documents (entity, entity_id, location_id, character_id, document)
+        SELECT 'post', n.id, n.location_id, n.character_id, search_vector('C', n.content) FROM new_rows n
+        ON CONFLICT (entity, entity_id) DO UPDATE SET document = EXCLUDED.document;
+    ELSE
+        UPDATE search_documents
+        SET location_id = NEW.location_id, character_id = NEW.character_id, document = search_vector('C', NEW.content)
+        WHERE entity = 'post' AND entity_id = NEW.id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION search_index_messages() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM search_documents WHERE entity = 'message' AND entity_id = OLD.id;
+    ELSIF TG_LEVEL = 'STATEMENT' THEN
+        INSERT INTO search_documents (entity, entity_id, location_id, character_id, document)
+        SELECT 'message', n.id, n.location_id, n.character_id, search_vector('C', n.content) FROM new_rows n
+        ON CONFLICT (entity, entity_id) DO UPDATE SET document = EXCLUDED.document;
+    ELSE
+        UPDATE search_documents
+        SET location_id = NEW.location_id, character_id = NEW.character_id, document = search_vector('C', NEW.content)
+        WHERE entity = 'message' AND entity_id = NEW.id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Transition tables cannot be combined with column lists or several events, hence three triggers per table.
+-- The locations UPDATE trigger lists the text columns so chat counter updates never touch the index
+DROP TRIGGER IF EXISTS characters_search_insert ON characters;
+CREATE TRIGGER characters_search_insert
+    AFTER INSERT ON characters
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION search_index_characters();
+
+DROP TRIGGER IF EXISTS characters_search_update ON characters;
+CREATE TRIGGER characters_search_update
+    AFTER UPDATE OF name, race, class, description ON characters
+    FOR EACH ROW
+    EXECUTE FUNCTION search_index_characters();
+
+DROP TRIGGER IF EXISTS characters_search_delete ON characters;
+CREATE TRIGGER characters_search_delete
+    AFTER DELETE ON characters
+    FOR EACH ROW
+    EXECUTE FUNCTION search_index_characters();
+
+DROP TRIGGER IF EXISTS locations_search_insert ON locations;
+CREATE TRIGGER locations_search_insert
+    AFTER INSERT ON locations
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION search_index_locations();
+
+DROP TRIGGER IF EXISTS locations_search_update ON locations;
+CREATE TRIGGER locations_search_update
+    AFTER UPDATE OF name, type, description ON locations
+    FOR EACH ROW
+    EXECUTE FUNCTION search_index_locations();
+
+DROP TRIGGER IF EXISTS locations_search_delete ON locations;
+CREATE TRIGGER locations_search_delete
+    AFTER DELETE ON locations
+    FOR EACH ROW
+    EXECUTE FUNCTION search_index_locations();
+
+DROP TRIGGER IF EXISTS posts_search_insert ON posts;
+CREATE TRIGGER posts_search_insert
+    AFTER INSERT ON posts
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION search_index_posts();
+
+DROP TRIGGER IF EXISTS posts_search_update ON posts;
+CREATE TRIGGER posts_search_update
+    AFTER UPDATE OF content, location_id, character_id ON posts
+    FOR EACH ROW
+    EXECUTE FUNCTION search_index_posts();
+
+DROP TRIGGER IF EXISTS posts_search_delete ON posts;
+CREATE TRIGGER posts_search_delete
+    AFTER DELETE ON posts
+    FOR EACH ROW
+    EXECUTE FUNCTION search_index_posts();
+
+DROP TRIGGER IF EXISTS messages_search_insert ON messages;
+CREATE TRIGGER messages_search_insert
+    AFTER INSERT ON messages
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION search_index_messages();
+
+DROP TRIGGER IF EXISTS messages_search_update ON messages;
+CREATE TRIGGER messages_search_update
+    AFTER UPDATE OF content, location_id, character_id ON messages
+    FOR EACH ROW
+    EXECUTE FUNCTION search_index_messages();
+
+DROP TRIGGER IF EXISTS messages_search_delete ON messages;
+CREATE TRIGGER messages_search_delete
+    AFTER DELETE ON messages
+    FOR EACH ROW
+    EXECUTE FUNCTION search_index_messages();
+
+-- Backfill existing rows; rows inserted concurrently are already covered by the triggers above
+INSERT INTO search_documents (entity, entity_id, location_id, character_id, document)
+SELECT 'character', c.id, NULL, c.id, character_document(c.name, c.race, c.class, c.description) FROM characters c
+ON CONFLICT (entity, entity_id) DO NOTHING;
+
+INSERT INTO search_documents (entity, entity_id, location_id, character_id, document)
+SELECT 'location', l.id, l.id, NULL, location_document(l.name, l.type, l.description) FROM locations l
+ON CONFLICT (entity, entity_id) DO NOTHING;
+
+INSERT INTO search_documents (entity, entity_id, location_id, character_id, document)
+SELECT 'post', p.id, p.location_id, p.character_id, search_vector('C', p.content) FROM posts p
+ON CONFLICT (entity, entity_id) DO NOTHING;
+
+INSERT INTO search_documents (entity, entity_id, location_id, character_id, document)
+SELECT 'message', m.id, m.location_id, m.character_id, search_vector('C', m.content) FROM messages m
+ON CONFLICT (entity, entity_id) DO NOTHING;
+
+-- One partial GIN index per entity: a characters-only search does not wade through message postings,
+-- and the search endpoint queries each requested entity separately so the planner can pick them
+CREATE INDEX IF NOT EXISTS idx_search_documents_characters ON search_documents USING GIN (document) WHERE entity = 'character';
+CREATE INDEX IF NOT EXISTS idx_search_documents_locations ON search_documents USING GIN (document) WHERE entity = 'location';
+CREATE INDEX IF NOT EXISTS idx_search_documents_posts ON search_documents USING GIN (document) WHERE entity = 'post';
+CREATE INDEX IF NOT EXISTS idx_search_documents_messages ON search_documents USING GIN (document) WHERE entity = 'message';
+CREATE INDEX IF NOT EXISTS idx_search_documents_location_id ON search_documents(entity, location_id);
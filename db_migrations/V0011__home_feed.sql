@@ -0,0 +1,62 @@
+-- Follows for the personalized home feed
+CREATE TABLE IF NOT EXISTS location_follows (
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    location_id INTEGER NOT NULL REFERENCES locations(id),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, location_id)
+);
+
+CREATE TABLE IF NOT EXISTS character_follows (
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    character_id INTEGER NOT NULL REFERENCES characters(id),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, character_id)
+);
+
+-- Fan-out looks followers up by the followed side
+CREATE INDEX IF NOT EXISTS idx_location_follows_location_id ON location_follows(location_id, user_id);
+CREATE INDEX IF NOT EXISTS idx_character_follows_character_id ON character_follows(character_id, user_id);
+
+-- Maintained by the follow/unfollow path; once a location has too many followers to copy every
+-- post to, fanout_on_read is set and its posts are merged into feeds at read time instead.
+-- The flag is sticky so posts written while it was on are never lost from a feed
+ALTER TABLE locations ADD COLUMN IF NOT EXISTS follower_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE locations ADD COLUMN IF NOT EXISTS fanout_on_read BOOLEAN NOT NULL DEFAULT FALSE;
+
+-- Materialized home feed: the primary key order is the read order, so a page is one backward range scan
+CREATE TABLE IF NOT EXISTS feed_items (
+    user_id INTEGER NOT NULL,
+    created_at TIMESTAMP NOT NULL,
+    post_id INTEGER NOT NULL,
+    PRIMARY KEY (user_id, created_at, post_id)
+);
+
+-- Fan-out on write, once per INSERT statement so batch ingestion stays a single round of work
+CREATE OR REPLACE FUNCTION fan_out_posts() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO feed_items (user_id, created_at, post_id)
+    SELECT f.user_id, n.created_at, n.id
+    FROM new_posts n
+    JOIN locations l ON l.id = n.location_id AND NOT l.fanout_on_read
+    JOIN location_follows f ON f.location_id = n.location_id
+    UNION
+    SELECT f.user_id, n.created_at, n.id
+    FROM new_posts n
+    JOIN character_follows f ON f.character_id = n.character_id
+    ON CONFLICT DO NOTHING;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS posts_fan_out ON posts;
+CREATE TRIGGER posts_fan_out
+    AFTER INSERT ON posts
+    REFERENCING NEW TABLE AS new_posts
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION fan_out_posts();
+
+-- Per-location reads for fan-out on read; also serves the location-filtered global feed
+CREATE INDEX IF NOT EXISTS idx_posts_location_id_created_at_id ON posts(location_id, created_at DESC, id DESC);
+
+-- The composite index covers every lookup the single-column one served
+DROP INDEX IF EXISTS idx_posts_location_id;
\ No newline at end of file
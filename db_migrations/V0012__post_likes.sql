@@ -0,0 +1,24 @@
+-- One row per (user, post): makes like/unlike idempotent
+CREATE TABLE IF NOT EXISTS post_likes (
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    post_id INTEGER NOT NULL REFERENCES posts(id),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, post_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_post_likes_post_id ON post_likes(post_id);
+
+-- Sharded counter deltas: a like upserts one of POST_LIKE_SHARDS rows at random instead of
+-- locking the post row, so concurrent likes on a hot post rarely wait on each other.
+-- posts.likes holds the folded base; the displayed count is likes + SUM(shards).
+-- tools/like_counters.py periodically folds shards back into posts.likes
+CREATE TABLE IF NOT EXISTS post_like_shards (
+    post_id INTEGER NOT NULL REFERENCES posts(id),
+    shard SMALLINT NOT NULL,
+    likes INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (post_id, shard)
+);
+
+-- Bumped with nextval() after each committed like/unlike: sequences are not transactional and take
+-- no row lock, unlike table_versions, so the global feed ETag can follow likes without a hot row
+CREATE SEQUENCE IF NOT EXISTS post_likes_version;
\ No newline at end of file
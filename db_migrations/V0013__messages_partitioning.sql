@@ -0,0 +1,125 @@
+-- Monthly range partitions for messages. Each partition carries its own small (location_id, id) index,
+-- old months can be detached and archived whole, and reads bounded by created_at touch only recent partitions
+CREATE TABLE IF NOT EXISTS message_partitions (
+    name VARCHAR(64) PRIMARY KEY,
+    starts_at TIMESTAMP NOT NULL UNIQUE,
+    ends_at TIMESTAMP NOT NULL,
+    -- Smallest message id in the partition, recorded by tools/message_partitions.py once the month has begun.
+    -- Ids grow with time, so this maps an after_id / before_id cursor to a created_at bound for pruning
+    first_id INTEGER,
+    archived_at TIMESTAMP,
+    archive_path TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_message_partitions_first_id ON message_partitions(first_id);
+
+ALTER TABLE messages RENAME TO messages_legacy;
+-- Index names are schema-wide; free them for the new table
+ALTER INDEX messages_pkey RENAME TO messages_legacy_pkey;
+ALTER SEQUENCE messages_id_seq OWNED BY NONE;
+
+CREATE TABLE messages (
+    id INTEGER NOT NULL DEFAULT nextval('messages_id_seq'),
+    character_id INTEGER NOT NULL REFERENCES characters(id),
+    location_id INTEGER NOT NULL REFERENCES locations(id),
+    content TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+ALTER SEQUENCE messages_id_seq OWNED BY messages.id;
+
+-- Rows outside every monthly range land here instead of failing the insert; tools/message_partitions.py
+-- keeps partitions created ahead so it stays empty
+CREATE TABLE IF NOT EXISTS messages_default PARTITION OF messages DEFAULT;
+
+CREATE OR REPLACE FUNCTION create_messages_partition(month_start TIMESTAMP) RETURNS TEXT AS $$
+DECLARE
+    partition_start TIMESTAMP := date_trunc('month', month_start);
+    partition_end TIMESTAMP := date_trunc('month', month_start) + INTERVAL '1 month';
+    partition_name TEXT := 'messages_' || to_char(date_trunc('month', month_start), 'YYYY_MM');
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF messages FOR VALUES FROM (%L) TO (%L)',
+        partition_name, partition_start, partition_end
+    );
+    INSERT INTO message_partitions (name, starts_at, ends_at)
+    VALUES (partition_name, partition_start, partition_end)
+    ON CONFLICT (name) DO NOTHING;
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    month_start TIMESTAMP;
+BEGIN
+    SELECT date_trunc('month', LEAST(MIN(created_at), LOCALTIMESTAMP - INTERVAL '1 month'))
+    INTO month_start
+    FROM messages_legacy;
+    WHILE month_start < date_trunc('month', LOCALTIMESTAMP) + INTERVAL '3 months' LOOP
+        PERFORM create_messages_partition(month_start);
+        month_start := month_start + INTERVAL '1 month';
+    END LOOP;
+END;
+$$;
+
+-- Copy before creating the triggers: search documents already exist for these rows and
+-- chat readers must not be woken for history
+INSERT INTO messages (id, character_id, location_id, content, created_at)
+SELECT id, character_id, location_id, content, COALESCE(created_at, LOCALTIMESTAMP)
+FROM messages_legacy;
+
+UPDATE message_partitions mp
+SET first_id = (SELECT MIN(m.id) FROM messages m WHERE m.created_at >= mp.starts_at AND m.created_at < mp.ends_at)
+WHERE mp.starts_at <= LOCALTIMESTAMP;
+
+DROP TABLE messages_legacy;
+
+-- Partitioned index: created on every partition, including future ones.
+-- idx_messages_created_at is not recreated - partition pruning on created_at replaces it
+CREATE INDEX IF NOT EXISTS idx_messages_location_id_id ON messages(location_id, id);
+
+DROP TRIGGER IF EXISTS messages_notify ON messages;
+CREATE TRIGGER messages_notify
+    AFTER INSERT ON messages
+    REFERENCING NEW TABLE AS new_messages
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_location_messages();
+
+DROP TRIGGER IF EXISTS messages_search_insert ON messages;
+CREATE TRIGGER messages_search_insert
+    AFTER INSERT ON messages
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION search_index_messages();
+
+DROP TRIGGER IF EXISTS messages_search_update ON messages;
+CREATE TRIGGER messages_search_update
+    AFTER UPDATE OF content, location_id, character_id ON messages
+    FOR EACH ROW
+    EXECUTE FUNCTION search_index_messages();
+
+DROP TRIGGER IF EXISTS messages_search_delete ON messages;
+CREATE TRIGGER messages_search_delete
+    AFTER DELETE ON messages
+    FOR EACH ROW
+    EXECUTE FUNCTION search_index_messages();
+
+-- created_at bounds for id cursors. The one-minute margin covers transactions that took an id
+-- just before a month boundary and committed after it; it costs at most one extra partition probe
+CREATE OR REPLACE FUNCTION message_id_floor(message_id INTEGER) RETURNS TIMESTAMP AS $$
+    SELECT COALESCE(
+        (SELECT starts_at FROM message_partitions WHERE first_id <= message_id ORDER BY first_id DESC LIMIT 1)
+            - INTERVAL '1 minute',
+        '-infinity'::TIMESTAMP
+    )
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION message_id_ceiling(message_id INTEGER) RETURNS TIMESTAMP AS $$
+    SELECT COALESCE(
+        (SELECT starts_at FROM message_partitions WHERE first_id > message_id ORDER BY first_id LIMIT 1)
+            + INTERVAL '1 minute',
+        'infinity'::TIMESTAMP
+    )
+$$ LANGUAGE sql STABLE;
\ No newline at end of file
@@ -0,0 +1,42 @@
+-- Token buckets shared by every function instance. UNLOGGED: no WAL for a write on every POST,
+-- and losing the table on a crash only resets the limits
+CREATE UNLOGGED TABLE IF NOT EXISTS rate_limit_buckets (
+    key VARCHAR(200) PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_rate_limit_buckets_updated_at ON rate_limit_buckets(updated_at);
+
+-- Returns 0 when cost tokens were taken, otherwise the seconds until they will be available.
+-- A rejected request takes nothing, so a client that backs off is admitted on time
+CREATE OR REPLACE FUNCTION take_rate_limit_tokens(
+    bucket_key TEXT, capacity DOUBLE PRECISION, refill_per_second DOUBLE PRECISION, cost DOUBLE PRECISION
+) RETURNS DOUBLE PRECISION AS $$
+DECLARE
+    stored_tokens DOUBLE PRECISION;
+    stored_at TIMESTAMPTZ;
+    now_at TIMESTAMPTZ;
+    available DOUBLE PRECISION;
+BEGIN
+    INSERT INTO rate_limit_buckets (key, tokens, updated_at)
+    VALUES (bucket_key, capacity, clock_timestamp())
+    ON CONFLICT (key) DO NOTHING;
+
+    SELECT tokens, updated_at INTO stored_tokens, stored_at
+    FROM rate_limit_buckets WHERE key = bucket_key
+    FOR UPDATE;
+
+    -- Read the clock after the row lock: a concurrent taker may have moved updated_at forward
+    now_at := GREATEST(clock_timestamp(), stored_at);
+    available := LEAST(capacity, stored_tokens + EXTRACT(EPOCH FROM now_at - stored_at) * refill_per_second);
+
+    IF available >= cost THEN
+        UPDATE rate_limit_buckets SET tokens = available - cost, updated_at = now_at WHERE key = bucket_key;
+        RETURN 0;
+    END IF;
+
+    UPDATE rate_limit_buckets SET tokens = available, updated_at = now_at WHERE key = bucket_key;
+    RETURN (cost - available) / refill_per_second;
+END;
+$$ LANGUAGE plpgsql;
\ No newline at end of file
@@ -0,0 +1,67 @@
+-- Id cursors map to created_at bounds through the id range of each partition instead of first_id alone.
+-- Ids do not always grow with time: an imported snapshot keeps the old created_at of its messages but
+-- takes new ids, so an old month can hold ids larger than the current month's
+ALTER TABLE message_partitions ADD COLUMN IF NOT EXISTS last_id INTEGER;
+ALTER TABLE message_partitions ADD COLUMN IF NOT EXISTS ids_recorded_at TIMESTAMP;
+
+-- MIN/MAX(id) of every live partition that has begun: two probes of each partition's (id, created_at) key
+CREATE OR REPLACE FUNCTION record_message_partition_ids() RETURNS INTEGER AS $$
+DECLARE
+    partition_name TEXT;
+    recorded INTEGER := 0;
+    min_id INTEGER;
+    max_id INTEGER;
+BEGIN
+    FOR partition_name IN
+        SELECT name FROM message_partitions WHERE archived_at IS NULL AND starts_at <= LOCALTIMESTAMP
+    LOOP
+        EXECUTE format('SELECT MIN(id), MAX(id) FROM %I', partition_name) INTO min_id, max_id;
+        UPDATE message_partitions
+        SET first_id = min_id, last_id = max_id, ids_recorded_at = LOCALTIMESTAMP
+        WHERE name = partition_name;
+        recorded := recorded + 1;
+    END LOOP;
+    RETURN recorded;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Id ranges used by the cursor bounds. A range recorded a day after its month ended is final
+-- (late commits of transactions started in the month are in); younger or never recorded months
+-- are probed live, so the bounds prune partitions even before tools/message_partitions.py runs
+CREATE OR REPLACE FUNCTION message_partition_ids()
+RETURNS TABLE (starts_at TIMESTAMP, ends_at TIMESTAMP, first_id INTEGER, last_id INTEGER) AS $$
+DECLARE
+    mp message_partitions%ROWTYPE;
+BEGIN
+    FOR mp IN
+        SELECT * FROM message_partitions p WHERE p.archived_at IS NULL AND p.starts_at <= LOCALTIMESTAMP
+    LOOP
+        starts_at := mp.starts_at;
+        ends_at := mp.ends_at;
+        IF mp.ids_recorded_at >= mp.ends_at + INTERVAL '1 day' THEN
+            first_id := mp.first_id;
+            last_id := mp.last_id;
+        ELSE
+            EXECUTE format('SELECT MIN(id), MAX(id) FROM %I', mp.name) INTO first_id, last_id;
+        END IF;
+        RETURN NEXT;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Messages with id > message_id live only in partitions whose range reaches past it. With none,
+-- nothing newer exists yet and the current month is bound, which keeps empty long-poll reads pruned
+CREATE OR REPLACE FUNCTION message_id_floor(message_id INTEGER) RETURNS TIMESTAMP AS $$
+    SELECT COALESCE(MIN(starts_at), date_trunc('month', LOCALTIMESTAMP))
+    FROM message_partition_ids()
+    WHERE last_id > message_id
+$$ LANGUAGE sql STABLE;
+
+-- Messages with id < message_id live only in partitions whose range starts below it
+CREATE OR REPLACE FUNCTION message_id_ceiling(message_id INTEGER) RETURNS TIMESTAMP AS $$
+    SELECT COALESCE(MAX(ends_at), '-infinity'::TIMESTAMP)
+    FROM message_partition_ids()
+    WHERE first_id < message_id
+$$ LANGUAGE sql STABLE;
+
+SELECT record_message_partition_ids();
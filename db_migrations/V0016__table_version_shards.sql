@@ -0,0 +1,42 @@
+-- One table_versions row per table made every write to characters, locations and posts queue on
+-- that row's lock. Versions are now spread over 16 shards: a statement bumps the shard of its backend
+-- (one shard per session, so two transactions never lock shards in opposite order) and the version
+-- is the sum. Still transactional: a reader never sees the new version before the change commits
+CREATE TABLE IF NOT EXISTS table_version_shards (
+    table_name VARCHAR(64) NOT NULL,
+    shard SMALLINT NOT NULL,
+    version BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (table_name, shard)
+);
+
+INSERT INTO table_version_shards (table_name, shard, version)
+SELECT t.table_name, s.shard, CASE WHEN s.shard = 0 THEN t.version ELSE 0 END
+FROM table_versions t
+CROSS JOIN generate_series(0, 15) AS s(shard)
+ON CONFLICT (table_name, shard) DO NOTHING;
+
+-- The shard count here must match the rows inserted above
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+BEGIN
+    UPDATE table_version_shards SET version = version + 1
+    WHERE table_name = TG_TABLE_NAME AND shard = pg_backend_pid() % 16;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TABLE IF EXISTS table_versions;
+
+-- Same shape as the old table, so version readers keep working
+CREATE OR REPLACE VIEW table_versions AS
+SELECT table_name, SUM(version)::BIGINT AS version
+FROM table_version_shards
+GROUP BY table_name;
+
+-- Counter columns bump the version too: message_count changes without a new max(last_message_at)
+-- (location_counters --repair, archiving) and follower_count changes with follows. With shards
+-- the chat write path no longer serializes on one version row
+DROP TRIGGER IF EXISTS locations_version ON locations;
+CREATE TRIGGER locations_version
+    AFTER INSERT OR UPDATE OR DELETE ON locations
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION bump_table_version();
@@ -0,0 +1,16 @@
+-- The likes version was a sequence bumped after the like committed: a standby sees sequence advances
+-- only in WAL batches of 32, so the feed ETag on a replica could miss likes, and a failed bump left it
+-- behind for good. post_likes now carries a sharded table version bumped by a statement trigger in
+-- the like's own transaction, exactly like characters, locations and posts
+INSERT INTO table_version_shards (table_name, shard, version)
+SELECT 'post_likes', s.shard, CASE WHEN s.shard = 0 THEN (SELECT last_value FROM post_likes_version) ELSE 0 END
+FROM generate_series(0, 15) AS s(shard)
+ON CONFLICT (table_name, shard) DO NOTHING;
+
+DROP TRIGGER IF EXISTS post_likes_version ON post_likes;
+CREATE TRIGGER post_likes_version
+    AFTER INSERT OR DELETE ON post_likes
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION bump_table_version();
+
+DROP SEQUENCE IF EXISTS post_likes_version;
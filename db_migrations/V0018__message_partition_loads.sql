@@ -0,0 +1,121 @@
+-- Cursor bounds from recorded per-partition id bounds instead of live MIN/MAX probes.
+-- A snapshot import gives an old month ids above every live message. Folded into the month's range, it
+-- pulled message_id_floor of every location back to that month, so after_id polls of untouched chats
+-- scanned all partitions in between. Imported ids are now kept per location, and only the chat they
+-- belong to bounds its cursors with them
+CREATE TABLE IF NOT EXISTS message_partition_loads (
+    location_id INTEGER NOT NULL,
+    partition_name VARCHAR(64) NOT NULL REFERENCES message_partitions(name),
+    first_id INTEGER NOT NULL,
+    last_id INTEGER NOT NULL,
+    PRIMARY KEY (location_id, partition_name)
+);
+
+-- Ids come only from messages_id_seq, so nothing written into a partition after it exists can take an id
+-- at or below the sequence value at that moment: that is the partition's first_id until it is recorded
+CREATE OR REPLACE FUNCTION create_messages_partition(month_start TIMESTAMP) RETURNS TEXT AS $$
+DECLARE
+    partition_start TIMESTAMP := date_trunc('month', month_start);
+    partition_end TIMESTAMP := date_trunc('month', month_start) + INTERVAL '1 month';
+    partition_name TEXT := 'messages_' || to_char(date_trunc('month', month_start), 'YYYY_MM');
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF messages FOR VALUES FROM (%L) TO (%L)',
+        partition_name, partition_start, partition_end
+    );
+    INSERT INTO message_partitions (name, starts_at, ends_at, first_id)
+    VALUES (partition_name, partition_start, partition_end,
+            COALESCE(pg_sequence_last_value('messages_id_seq'), 0) + 1)
+    ON CONFLICT (name) DO NOTHING;
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Months created ahead and still empty get the same lower bound
+UPDATE message_partitions
+SET first_id = COALESCE(pg_sequence_last_value('messages_id_seq'), 0) + 1
+WHERE starts_at > LOCALTIMESTAMP AND first_id IS NULL;
+
+-- Id range of the live messages of every begun partition; rows of recorded loads are left out. A month
+-- that is not final keeps its lower bound from creation: a transaction that took an id below MIN(id)
+-- may still commit into it
+CREATE OR REPLACE FUNCTION record_message_partition_ids() RETURNS INTEGER AS $$
+DECLARE
+    mp message_partitions%ROWTYPE;
+    recorded INTEGER := 0;
+    min_id INTEGER;
+    max_id INTEGER;
+BEGIN
+    FOR mp IN
+        SELECT * FROM message_partitions WHERE archived_at IS NULL AND starts_at <= LOCALTIMESTAMP
+    LOOP
+        EXECUTE format(
+            'SELECT MIN(m.id), MAX(m.id) FROM %I m
+             WHERE NOT EXISTS (
+                 SELECT 1 FROM message_partition_loads l
+                 WHERE l.partition_name = %L AND l.location_id = m.location_id
+                   AND m.id BETWEEN l.first_id AND l.last_id
+             )',
+            mp.name, mp.name
+        ) INTO min_id, max_id;
+        IF LOCALTIMESTAMP < mp.ends_at + INTERVAL '1 day' THEN
+            min_id := LEAST(mp.first_id, min_id);
+        END IF;
+        UPDATE message_partitions
+        SET first_id = min_id, last_id = max_id, ids_recorded_at = LOCALTIMESTAMP
+        WHERE name = mp.name;
+        recorded := recorded + 1;
+    END LOOP;
+    RETURN recorded;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Called by the snapshot import in its own transaction: the id range of the location in each partition
+CREATE OR REPLACE FUNCTION record_message_partition_load(load_location_id INTEGER) RETURNS INTEGER AS $$
+    WITH loaded AS (
+        INSERT INTO message_partition_loads (location_id, partition_name, first_id, last_id)
+        SELECT load_location_id, p.name, MIN(m.id), MAX(m.id)
+        FROM messages m
+        JOIN message_partitions p ON p.name = m.tableoid::regclass::text
+        WHERE m.location_id = load_location_id
+        GROUP BY p.name
+        ON CONFLICT (location_id, partition_name) DO UPDATE
+        SET first_id = LEAST(message_partition_loads.first_id, EXCLUDED.first_id),
+            last_id = GREATEST(message_partition_loads.last_id, EXCLUDED.last_id)
+        RETURNING 1
+    )
+    SELECT COUNT(*)::INTEGER FROM loaded
+$$ LANGUAGE sql;
+
+DROP FUNCTION IF EXISTS message_id_floor(INTEGER);
+DROP FUNCTION IF EXISTS message_id_ceiling(INTEGER);
+DROP FUNCTION IF EXISTS message_partition_ids();
+
+-- Messages of the location with id > message_id. A range recorded a day after its month ended is final
+-- (late commits are in); a younger or unrecorded month may still receive ids, so it is always included
+CREATE OR REPLACE FUNCTION message_id_floor(message_location_id INTEGER, message_id INTEGER) RETURNS TIMESTAMP AS $$
+    SELECT COALESCE(MIN(starts_at), date_trunc('month', LOCALTIMESTAMP))
+    FROM (
+        SELECT starts_at FROM message_partitions
+        WHERE archived_at IS NULL AND starts_at <= LOCALTIMESTAMP
+          AND (ids_recorded_at IS NULL OR ids_recorded_at < ends_at + INTERVAL '1 day' OR last_id > message_id)
+        UNION ALL
+        SELECT p.starts_at FROM message_partition_loads l
+        JOIN message_partitions p ON p.name = l.partition_name
+        WHERE l.location_id = message_location_id AND l.last_id > message_id AND p.archived_at IS NULL
+    ) bounds
+$$ LANGUAGE sql STABLE;
+
+-- Messages of the location with id < message_id. first_id is a lower bound from creation on
+CREATE OR REPLACE FUNCTION message_id_ceiling(message_location_id INTEGER, message_id INTEGER) RETURNS TIMESTAMP AS $$
+    SELECT COALESCE(MAX(ends_at), '-infinity'::TIMESTAMP)
+    FROM (
+        SELECT ends_at FROM message_partitions
+        WHERE archived_at IS NULL AND starts_at <= LOCALTIMESTAMP
+          AND (first_id IS NULL OR first_id < message_id)
+        UNION ALL
+        SELECT p.ends_at FROM message_partition_loads l
+        JOIN message_partitions p ON p.name = l.partition_name
+        WHERE l.location_id = message_location_id AND l.first_id < message_id AND p.archived_at IS NULL
+    ) bounds
+$$ LANGUAGE sql STABLE;
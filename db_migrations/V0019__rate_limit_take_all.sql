@@ -0,0 +1,43 @@
+-- Takes cost tokens from every bucket or from none. Separate take_rate_limit_tokens calls charged the
+-- client bucket even when the IP bucket rejected the request, so clients behind a busy NAT lost their
+-- own allowance to requests that never ran. Returns the wait per key; all zeros when admitted
+CREATE OR REPLACE FUNCTION take_rate_limit_tokens_all(
+    bucket_keys TEXT[], capacities DOUBLE PRECISION[], refills DOUBLE PRECISION[], costs DOUBLE PRECISION[]
+) RETURNS DOUBLE PRECISION[] AS $$
+DECLARE
+    now_at TIMESTAMPTZ;
+    waits DOUBLE PRECISION[];
+BEGIN
+    -- Keys in one order for every caller: two requests sharing a client and an IP cannot deadlock
+    INSERT INTO rate_limit_buckets (key, tokens, updated_at)
+    SELECT t.key, t.capacity, clock_timestamp()
+    FROM unnest(bucket_keys, capacities) AS t(key, capacity)
+    ORDER BY t.key
+    ON CONFLICT (key) DO NOTHING;
+
+    PERFORM 1 FROM rate_limit_buckets WHERE key = ANY(bucket_keys) ORDER BY key FOR UPDATE;
+
+    -- Read the clock after the row locks: a concurrent taker may have moved updated_at forward
+    now_at := clock_timestamp();
+
+    WITH wanted AS (
+        SELECT t.key, t.refill, t.cost, t.ord, GREATEST(now_at, r.updated_at) AS taken_at,
+               LEAST(t.capacity, r.tokens + EXTRACT(EPOCH FROM GREATEST(now_at, r.updated_at) - r.updated_at) * t.refill)
+                   AS available
+        FROM unnest(bucket_keys, capacities, refills, costs) WITH ORDINALITY AS t(key, capacity, refill, cost, ord)
+        JOIN rate_limit_buckets r ON r.key = t.key
+    ), verdict AS (
+        SELECT bool_and(available >= cost) AS admitted FROM wanted
+    ), taken AS (
+        UPDATE rate_limit_buckets r
+        SET tokens = w.available - CASE WHEN v.admitted THEN w.cost ELSE 0 END, updated_at = w.taken_at
+        FROM wanted w, verdict v
+        WHERE r.key = w.key
+    )
+    SELECT array_agg(CASE WHEN available >= cost THEN 0 ELSE (cost - available) / refill END ORDER BY ord)
+    INTO waits
+    FROM wanted;
+
+    RETURN waits;
+END;
+$$ LANGUAGE plpgsql;
@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { Card } from '@/components/ui/card';
 import { Button } from '@/components/ui/button';
 import { Textarea } from '@/components/ui/textarea';
@@ -40,31 +40,99 @@ interface LocationChatProps {
   onBack: () => void;
 }
 
+// Столько сообщений сервер отдаёт на страницу по умолчанию: полная страница значит, что есть более ранние
+const MESSAGES_PAGE_SIZE = 50;
+const POLL_RETRY_MS = 3000;
+
+const formatMessage = (msg: any): Message => ({
+  id: msg.id.toString(),
+  characterId: msg.character_id.toString(),
+  characterName: msg.character_name,
+  characterAvatar: msg.character_avatar,
+  content: msg.content,
+  timestamp: new Date(msg.created_at).toLocaleTimeString('ru-RU', { hour: '2-digit', minute: '2-digit' }),
+});
+
+// Своё сообщение приходит и ответом на POST, и из опроса - повтор по id отбрасывается
+const mergeMessages = (current: Message[], incoming: Message[]): Message[] => {
+  const seen = new Set(current.map((message) => message.id));
+  return [...current, ...incoming.filter((message) => !seen.has(message.id))]
+    .sort((a, b) => parseInt(a.id) - parseInt(b.id));
+};
+
 export default function LocationChat({ location, characters, onBack }: LocationChatProps) {
   const { toast } = useToast();
   const [messages, setMessages] = useState<Message[]>([]);
+  const [hasOlder, setHasOlder] = useState(false);
+  const [isLoadingOlder, setIsLoadingOlder] = useState(false);
+  const lastIdRef = useRef(0);
 
   const [selectedCharacterId, setSelectedCharacterId] = useState<string>('');
   const [messageText, setMessageText] = useState('');
 
+  const appendMessages = (incoming: Message[]) => {
+    if (incoming.length === 0) return;
+    lastIdRef.current = Math.max(lastIdRef.current, ...incoming.map((message) => parseInt(message.id)));
+    setMessages((current) => mergeMessages(current, incoming));
+  };
+
   useEffect(() => {
-    loadMessages();
+    let cancelled = false;
+    const locationId = parseInt(location.id);
+    setMessages([]);
+    setHasOlder(false);
+    lastIdRef.current = 0;
+
+    const retryLater = () => new Promise((resolve) => setTimeout(resolve, POLL_RETRY_MS));
+
+    // Последняя страница, затем долгий опрос с последнего id: сервер держит запрос, пока не появятся новые.
+    // Без первой страницы опрос с нуля пошёл бы по всей истории - её загрузка повторяется
+    const run = async () => {
+      let loaded = false;
+      while (!cancelled && !loaded) {
+        try {
+          const data = await messagesApi.getByLocation(locationId);
+          if (cancelled) return;
+          appendMessages(data.map(formatMessage));
+          setHasOlder(data.length >= MESSAGES_PAGE_SIZE);
+          loaded = true;
+        } catch (error) {
+          console.error('Failed to load messages:', error);
+          await retryLater();
+        }
+      }
+
+      while (!cancelled) {
+        try {
+          const data = await messagesApi.waitSince(locationId, lastIdRef.current);
+          if (!cancelled) appendMessages(data.map(formatMessage));
+        } catch (error) {
+          await retryLater();
+        }
+      }
+    };
+    run();
+
+    return () => {
+      cancelled = true;
+    };
   }, [location.id]);
 
-  const loadMessages = async () => {
+  const handleLoadOlder = async () => {
+    if (messages.length === 0) return;
     try {
-      const data = await messagesApi.getByLocation(parseInt(location.id));
-      const formattedMessages = data.map((msg: any) => ({
-        id: msg.id.toString(),
-        characterId: msg.character_id.toString(),
-        characterName: msg.character_name,
-        characterAvatar: msg.character_avatar,
-        content: msg.content,
-        timestamp: new Date(msg.created_at).toLocaleTimeString('ru-RU', { hour: '2-digit', minute: '2-digit' }),
-      }));
-      setMessages(formattedMessages);
+      setIsLoadingOlder(true);
+      const data = await messagesApi.getBefore(parseInt(location.id), parseInt(messages[0].id));
+      setMessages((current) => mergeMessages(current, data.map(formatMessage)));
+      setHasOlder(data.length >= MESSAGES_PAGE_SIZE);
     } catch (error) {
-      console.error('Failed to load messages:', error);
+      toast({
+        title: 'Ошибка',
+        description: 'Не удалось загрузить историю',
+        variant: 'destructive',
+      });
+    } finally {
+      setIsLoadingOlder(false);
     }
   };
 
@@ -72,13 +140,13 @@ export default function LocationChat({ location, characters, onBack }: LocationC
     if (!messageText.trim() || !selectedCharacterId) return;
 
     try {
-      await messagesApi.create({
+      const newMessage = await messagesApi.create({
         character_id: parseInt(selectedCharacterId),
         location_id: parseInt(location.id),
         content: messageText,
       });
       setMessageText('');
-      await loadMessages();
+      appendMessages([formatMessage(newMessage)]);
     } catch (error) {
       toast({
         title: 'Ошибка',
@@ -122,6 +190,14 @@ export default function LocationChat({ location, characters, onBack }: LocationC
 
             <ScrollArea className="flex-1 p-4">
               <div className="space-y-4">
+                {hasOlder && (
+                  <div className="flex justify-center">
+                    <Button variant="outline" size="sm" onClick={handleLoadOlder} disabled={isLoadingOlder} className="gap-2">
+                      <Icon name="ChevronUp" size={16} />
+                      {isLoadingOlder ? 'Загрузка...' : 'Загрузить ранее'}
+                    </Button>
+                  </div>
+                )}
                 {messages.map((message) => (
                   <div key={message.id} className="flex gap-3 animate-fade-in">
                     <Avatar className="w-10 h-10 ring-2 ring-primary/20">
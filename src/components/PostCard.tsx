@@ -1,8 +1,10 @@
+import { useState } from 'react';
 import { Card } from '@/components/ui/card';
 import { Avatar, AvatarFallback, AvatarImage } from '@/components/ui/avatar';
 import { Badge } from '@/components/ui/badge';
 import { Button } from '@/components/ui/button';
 import Icon from '@/components/ui/icon';
+import { postsApi } from '@/lib/api';
 
 interface Post {
   id: string;
@@ -16,6 +18,7 @@ interface Post {
   timestamp?: string;
   created_at?: string;
   likes: number;
+  liked?: boolean;
   comments?: number;
 }
 
@@ -28,6 +31,18 @@ export default function PostCard({ post }: PostCardProps) {
   const characterAvatar = post.character_avatar || post.characterAvatar || '';
   const locationName = post.location_name || post.locationName || 'Unknown';
   const timestamp = post.timestamp || (post.created_at ? new Date(post.created_at).toLocaleString('ru-RU') : 'Just now');
+  const [liked, setLiked] = useState(post.liked ?? false);
+  const [likes, setLikes] = useState(post.likes || 0);
+  
+  const toggleLike = async () => {
+    try {
+      const result = await postsApi.setLiked(Number(post.id), !liked);
+      setLiked(result.liked);
+      setLikes(result.likes);
+    } catch (error) {
+      console.error('Failed to update like:', error);
+    }
+  };
   
   return (
     <Card className="p-6 animate-fade-in">
@@ -55,9 +70,14 @@ export default function PostCard({ post }: PostCardProps) {
           <p className="text-sm leading-relaxed mb-4 whitespace-pre-wrap">{post.content}</p>
           
           <div className="flex items-center gap-4">
-            <Button variant="ghost" size="sm" className="gap-2 text-muted-foreground hover:text-primary">
+            <Button
+              variant="ghost"
+              size="sm"
+              className={`gap-2 hover:text-primary ${liked ? 'text-primary' : 'text-muted-foreground'}`}
+              onClick={toggleLike}
+            >
               <Icon name="Heart" size={16} />
-              <span className="text-xs">{post.likes}</span>
+              <span className="text-xs">{likes}</span>
             </Button>
             <Button variant="ghost" size="sm" className="gap-2 text-muted-foreground hover:text-primary">
               <Icon name="MessageCircle" size={16} />
@@ -71,8 +71,12 @@ export const locationsApi = {
 };
 
 export const postsApi = {
-  getAll: () => apiRequest(ENDPOINTS.posts),
-  
+  getPage: (before?: string, limit = 20) =>
+    apiRequest(`${ENDPOINTS.posts}?limit=${limit}${before ? `&before=${encodeURIComponent(before)}` : ''}`),
+
+  getHomePage: (before?: string, limit = 20) =>
+    apiRequest(`${ENDPOINTS.posts}?feed=home&limit=${limit}${before ? `&before=${encodeURIComponent(before)}` : ''}`),
+
   create: (data: {
     character_id: number;
     location_id: number;
@@ -81,12 +85,23 @@ export const postsApi = {
     method: 'POST',
     body: JSON.stringify(data),
   }),
+
+  setLiked: (postId: number, liked: boolean) => apiRequest(ENDPOINTS.posts, {
+    method: 'POST',
+    body: JSON.stringify({ action: liked ? 'like' : 'unlike', post_id: postId }),
+  }),
 };
 
 export const messagesApi = {
   getByLocation: (locationId: number) => 
     apiRequest(`${ENDPOINTS.messages}?location_id=${locationId}`),
   
+  waitSince: (locationId: number, afterId: number, wait = 25) =>
+    apiRequest(`${ENDPOINTS.messages}?location_id=${locationId}&after_id=${afterId}&wait=${wait}`),
+  
+  getBefore: (locationId: number, beforeId: number) =>
+    apiRequest(`${ENDPOINTS.messages}?location_id=${locationId}&before_id=${beforeId}`),
+  
   create: (data: {
     character_id: number;
     location_id: number;
@@ -18,6 +18,8 @@ export default function Index() {
   const [characters, setCharacters] = useState<any[]>([]);
   const [locations, setLocations] = useState<any[]>([]);
   const [posts, setPosts] = useState<any[]>([]);
+  const [postsCursor, setPostsCursor] = useState<string | null>(null);
+  const [isLoadingMorePosts, setIsLoadingMorePosts] = useState(false);
   const [isLoading, setIsLoading] = useState(true);
 
   const [createCharacterOpen, setCreateCharacterOpen] = useState(false);
@@ -58,20 +60,22 @@ export default function Index() {
     setCharacters([]);
     setLocations([]);
     setPosts([]);
+    setPostsCursor(null);
     setAuthOpen(true);
   };
 
   const loadData = async () => {
     try {
       setIsLoading(true);
-      const [charsData, locsData, postsData] = await Promise.all([
+      const [charsData, locsData, postsPage] = await Promise.all([
         charactersApi.getAll(),
         locationsApi.getAll(),
-        postsApi.getAll(),
+        postsApi.getPage(),
       ]);
       setCharacters(charsData);
       setLocations(locsData);
-      setPosts(postsData);
+      setPosts(postsPage.posts);
+      setPostsCursor(postsPage.next_cursor);
     } catch (error) {
       toast({
         title: 'Ошибка',
@@ -83,6 +87,28 @@ export default function Index() {
     }
   };
 
+  const handleLoadMorePosts = async () => {
+    if (!postsCursor) return;
+    try {
+      setIsLoadingMorePosts(true);
+      const page = await postsApi.getPage(postsCursor);
+      // Посты, созданные после загрузки ленты, уже стоят сверху - курсор может вернуть их повторно
+      setPosts((current) => {
+        const seen = new Set(current.map((post) => post.id));
+        return [...current, ...page.posts.filter((post: any) => !seen.has(post.id))];
+      });
+      setPostsCursor(page.next_cursor);
+    } catch (error) {
+      toast({
+        title: 'Ошибка',
+        description: 'Не удалось загрузить посты',
+        variant: 'destructive',
+      });
+    } finally {
+      setIsLoadingMorePosts(false);
+    }
+  };
+
   const handleCreateCharacter = async (character: any) => {
     try {
       const newChar = await charactersApi.create(character);
@@ -102,12 +128,12 @@ export default function Index() {
 
   const handleCreatePost = async (postData: any) => {
     try {
-      await postsApi.create({
+      const newPost = await postsApi.create({
         character_id: parseInt(postData.characterId),
         location_id: parseInt(postData.locationId),
         content: postData.content,
       });
-      await loadData();
+      setPosts([newPost, ...posts]);
       toast({
         title: 'Успех!',
         description: 'Пост опубликован',
@@ -211,6 +237,15 @@ export default function Index() {
               ))}
             </div>
 
+            {postsCursor && (
+              <div className="flex justify-center">
+                <Button variant="outline" onClick={handleLoadMorePosts} disabled={isLoadingMorePosts} className="gap-2">
+                  <Icon name="ChevronDown" size={16} />
+                  {isLoadingMorePosts ? 'Загрузка...' : 'Показать ещё'}
+                </Button>
+              </div>
+            )}
+
             {posts.length === 0 && (
               <div className="text-center py-12 text-muted-foreground">
                 <Icon name="Scroll" size={48} className="mx-auto mb-4 opacity-50" />
@@ -282,7 +317,9 @@ export default function Index() {
                     <div className="text-sm text-muted-foreground">Персонажей</div>
                   </div>
                   <div className="p-4 bg-secondary/50 rounded-lg">
-                    <div className="text-2xl font-bold text-primary">{posts.length}</div>
+                    <div className="text-2xl font-bold text-primary">
+                      {posts.length}{postsCursor ? '+' : ''}
+                    </div>
                     <div className="text-sm text-muted-foreground">Постов</div>
                   </div>
                   <div className="p-4 bg-secondary/50 rounded-lg">